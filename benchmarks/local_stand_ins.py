@@ -0,0 +1,421 @@
+""" Local stand-ins for S3 and Redshift, to run the Sparkify operators against a local Postgres and directory """
+
+import asyncio
+import copy
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+Credentials = namedtuple('Credentials', ['access_key', 'secret_key'])
+
+copy_pattern = re.compile(r"^\s*COPY\s+(?P<table>\S+)\s+FROM\s+'(?P<source>[^']+)'", re.IGNORECASE)
+json_paths_pattern = re.compile(r"FORMAT\s+AS\s+JSON\s+'(?P<paths>[^']+)'", re.IGNORECASE)
+
+# Spectrum external DDL, imitated with a schema and (partitioned) tables loaded from the local files.
+external_schema_pattern = re.compile(r"^\s*CREATE\s+EXTERNAL\s+SCHEMA\s+IF\s+NOT\s+EXISTS\s+(?P<schema>\w+)",
+                                     re.IGNORECASE)
+external_table_pattern = re.compile(
+    r"^\s*CREATE\s+EXTERNAL\s+TABLE\s+(?P<table>[\w.]+)\s*\((?P<columns>.*?)\n\s*\)\s*"
+    r"(PARTITIONED\s+BY\s*\((?P<partitions>[^)]*)\))?.*LOCATION\s+'(?P<location>[^']+)'",
+    re.IGNORECASE | re.DOTALL)
+add_partition_pattern = re.compile(
+    r"^\s*ALTER\s+TABLE\s+(?P<table>[\w.]+)\s+ADD\s+IF\s+NOT\s+EXISTS\s+PARTITION\s*"
+    r"\((?P<values>[^)]*)\)\s*LOCATION\s+'(?P<location>[^']+)'", re.IGNORECASE)
+
+# Redshift dialect rewritten for Postgres.
+postgres_rewrites = [
+    (re.compile(r"extract\(\s*dayofweek\s+from", re.IGNORECASE), "extract(dow from"),
+    # Postgres has no distribution, sort keys or column encodings.
+    (re.compile(r"\s+ENCODE\s+\w+", re.IGNORECASE), ""),
+    (re.compile(r"\s*\bDISTSTYLE\s+\w+", re.IGNORECASE), ""),
+    (re.compile(r"\s*\b(DISTKEY|(COMPOUND\s+|INTERLEAVED\s+)?SORTKEY)\s*\([^)]*\)", re.IGNORECASE), ""),
+]
+
+compat_sql_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'postgres_compat.sql')
+
+
+def split_s3_url(url):
+    """ Bucket and key of an s3:// url. """
+    bucket, _, key = url[len('s3://'):].partition('/')
+    return bucket, key
+
+
+class LocalS3Object:
+    """ Object summary of a file of the local S3 directory, as returned by boto3. """
+
+    def __init__(self, root, bucket, key):
+        self.path = os.path.join(root, bucket, key)
+        self.key = key
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+    def get(self):
+        return {'Body': open(self.path, 'rb')}
+
+
+class LocalBucket:
+
+    def __init__(self, root, name):
+        self.root = root
+        self.name = name
+        self.objects = self
+
+    def filter(self, Prefix=''):
+        bucket_root = os.path.join(self.root, self.name)
+        for folder, _, files in os.walk(bucket_root):
+            for file_name in sorted(files):
+                key = os.path.relpath(os.path.join(folder, file_name), bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    yield LocalS3Object(self.root, self.name, key)
+
+
+class LocalS3Hook:
+    """ Directory backed stand-in of the S3Hook methods used by the operators: <root>/<bucket>/<key>. """
+
+    root = ''
+
+    def __init__(self, aws_conn_id=None, *args, **kwargs):
+        self.aws_conn_id = aws_conn_id
+
+    def get_bucket(self, bucket_name):
+        return LocalBucket(self.root, bucket_name)
+
+    def get_key(self, key, bucket_name=None):
+        return LocalS3Object(self.root, bucket_name, key)
+
+    def _path(self, key, bucket_name):
+        path = os.path.join(self.root, bucket_name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def read_key(self, key, bucket_name=None):
+        with open(os.path.join(self.root, bucket_name, key)) as local_file:
+            return local_file.read()
+
+    def load_string(self, string_data, key, bucket_name=None, replace=False):
+        with open(self._path(key, bucket_name), 'w') as local_file:
+            local_file.write(string_data)
+
+    def load_file(self, filename, key, bucket_name=None, replace=False):
+        with open(filename, 'rb') as source, open(self._path(key, bucket_name), 'wb') as local_file:
+            local_file.write(source.read())
+
+
+class LocalAwsHook:
+    """ Stand-in of the AwsHook, the local COPY doesn't need credentials. """
+
+    def __init__(self, aws_conn_id=None, *args, **kwargs):
+        self.aws_conn_id = aws_conn_id
+
+    def get_credentials(self):
+        return Credentials('local', 'local')
+
+    def get_client_type(self, client_type, region_name=None, config=None):
+        if client_type != 'redshift-data':
+            raise ValueError(f"No local stand-in of the {client_type} client")
+        return LocalDataApiClient()
+
+
+class LocalDataApiClient:
+    """
+        Stand-in of the boto3 'redshift-data' client: a batch runs in a background thread, in one transaction
+        on its own connection to the local Postgres, and is described with the statuses of the Data API.
+    """
+
+    dsn = None
+    root = None
+    _statements = {}
+    _lock = threading.Lock()
+
+    def batch_execute_statement(self, Sqls, **target):
+        statement_id = str(uuid.uuid4())
+        with self._lock:
+            self._statements[statement_id] = {
+                'Id': statement_id, 'Status': 'SUBMITTED',
+                'SubStatements': [{'Id': f"{statement_id}:{number}", 'QueryString': sql, 'Status': 'SUBMITTED'}
+                                  for number, sql in enumerate(Sqls, 1)]}
+        threading.Thread(target=self._run, args=(statement_id,), daemon=True).start()
+        return {'Id': statement_id}
+
+    def describe_statement(self, Id):
+        with self._lock:
+            return copy.deepcopy(self._statements[Id])
+
+    def _update(self, description, **values):
+        with self._lock:
+            description.update(values)
+
+    def _run(self, statement_id):
+        import psycopg2
+
+        description = self._statements[statement_id]
+        self._update(description, Status='STARTED')
+        conn = psycopg2.connect(self.dsn)
+        try:
+            for sub_statement in description['SubStatements']:
+                sql = sub_statement['QueryString']
+                started = time.monotonic()
+                try:
+                    with conn.cursor() as cursor:
+                        if sql.lstrip().upper().startswith('SET QUERY_GROUP'):
+                            rows = -1
+                            cursor.execute("SET application_name TO %s", (sql.split("'")[1],))
+                        elif copy_pattern.match(sql):
+                            rows = local_copy(conn, sql, self.root)
+                        else:
+                            rows = external_ddl(conn, sql, self.root)
+                            if rows is None:
+                                cursor.execute(to_postgres(sql))
+                                rows = cursor.rowcount
+                except Exception as error:
+                    conn.rollback()
+                    self._update(sub_statement, Status='FAILED', Error=str(error).strip())
+                    self._update(description, Status='FAILED', Error=str(error).strip())
+                    return
+                self._update(sub_statement, Status='FINISHED', ResultRows=rows, RedshiftQueryId=-1,
+                             Duration=int((time.monotonic() - started) * 1000000000))
+            conn.commit()
+            self._update(description, Status='FINISHED')
+        finally:
+            conn.close()
+
+
+def run_deferrable(operator, context):
+    """
+        Execute a deferrable operator the way a worker and the triggerer would: the operator defers,
+        its trigger runs in an asyncio loop until it fires, and the task resumes with the event.
+
+        :return: the return value of the resumed method.
+    """
+    from airflow.exceptions import TaskDeferred
+
+    try:
+        return operator.execute(context)
+    except TaskDeferred as deferred:
+        async def first_event():
+            async for event in deferred.trigger.run():
+                return event
+
+        event = asyncio.run(first_event())
+        return getattr(operator, deferred.method_name)(context, event=event.payload, **(deferred.kwargs or {}))
+
+
+class StreamReader(io.RawIOBase):
+    """ File-like object over a generator of text chunks, for the streamed COPY FROM STDIN. """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk.encode('utf-8')
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def to_postgres(sql):
+    """ Rewrite the Redshift specific syntax of a statement for Postgres. """
+    for pattern, replacement in postgres_rewrites:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def copy_source_files(root, sql):
+    """ Local paths of the files a COPY statement reads, from its manifest or its prefix. """
+    source = copy_pattern.match(sql).group('source')
+    bucket, key = split_s3_url(source)
+
+    if re.search(r"\bMANIFEST\b", sql, re.IGNORECASE):
+        with open(os.path.join(root, bucket, key)) as manifest_file:
+            urls = [entry['url'] for entry in json.load(manifest_file)['entries']]
+        return [os.path.join(root, *split_s3_url(url)) for url in urls]
+
+    return [obj.path for obj in LocalBucket(root, bucket).filter(Prefix=key)]
+
+
+def iter_documents(path, compressed):
+    """ JSON documents of a file, one line at a time. """
+    opener = gzip.open if compressed else open
+    with opener(path, 'rt') as source:
+        for line in source:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def local_copy(conn, sql, root, constants=None):
+    """
+        Run a Redshift JSON COPY statement against the local Postgres, streaming the files through COPY FROM STDIN.
+
+        :param constants: values of the columns that are not read from the files, e.g. partition columns.
+        :type constants: dictionary
+
+        :return: number of rows loaded.
+    """
+    table = copy_pattern.match(sql).group('table')
+    compressed = re.search(r"\bGZIP\b", sql, re.IGNORECASE) is not None
+    schema, _, table_name = table.rpartition('.')
+    constants = constants or {}
+
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position
+        """, (schema or 'public', table_name))
+        columns = cursor.fetchall()
+
+        json_paths = json_paths_pattern.search(sql).group('paths')
+        if json_paths == 'auto':
+            keys = None
+        else:
+            with open(os.path.join(root, *split_s3_url(json_paths))) as paths_file:
+                keys = [re.match(r"\$\['(.+)'\]", path).group(1)
+                        for path in json.load(paths_file)['jsonpaths']]
+
+        def csv_lines():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for path in copy_source_files(root, sql):
+                for document in iter_documents(path, compressed):
+                    if keys is None:
+                        lowered = {key.lower(): value for key, value in document.items()}
+                        values = [lowered.get(name) for name, _ in columns]
+                    else:
+                        values = [document.get(key) for key in keys]
+                    values = [constants.get(name, value) for value, (name, _) in zip(values, columns)]
+                    # Redshift loads empty strings of non character columns as NULL.
+                    writer.writerow([
+                        '' if value is None or (value == '' and 'char' not in data_type)
+                        else value for value, (_, data_type) in zip(values, columns)])
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+
+        cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+            table, ", ".join('"{}"'.format(name) for name, _ in columns)), StreamReader(csv_lines()))
+        return cursor.rowcount
+
+
+def external_ddl(conn, sql, root):
+    """
+        Imitate the Spectrum external DDL of a statement: external schemas are schemas, partitioned external tables
+        are partitioned tables, whose partitions are loaded from their local folder when they are added, and the
+        other external tables are loaded from their local prefix when they are created.
+
+        :return: the row count, None if `sql` is not external DDL.
+    """
+    match = external_schema_pattern.match(sql)
+    if match:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS {}".format(match.group('schema')))
+        return -1
+
+    match = external_table_pattern.match(sql)
+    if match:
+        table, columns = match.group('table'), match.group('columns')
+        with conn.cursor() as cursor:
+            if match.group('partitions'):
+                partition_columns = [column.split()[0] for column in match.group('partitions').split(',')]
+                cursor.execute("CREATE TABLE {} ({}, {}) PARTITION BY RANGE ({})".format(
+                    table, columns, match.group('partitions'), ", ".join(partition_columns)))
+                return -1
+            cursor.execute("CREATE TABLE {} ({})".format(table, columns))
+        return local_copy(conn, "COPY {} FROM '{}' FORMAT AS JSON 'auto'".format(table, match.group('location')), root)
+
+    match = add_partition_pattern.match(sql)
+    if match:
+        table = match.group('table')
+        values = dict((name.strip(), int(value)) for name, value in
+                      (pair.split('=') for pair in match.group('values').split(',')))
+        bounds = list(values.values())
+        partition = "{}_{}".format(table, "_".join(str(value) for value in bounds))
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (partition,))
+            if cursor.fetchone()[0] is not None:
+                return 0
+            cursor.execute("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})".format(
+                partition, table, ", ".join(map(str, bounds)), ", ".join(map(str, bounds[:-1] + [bounds[-1] + 1]))))
+        return local_copy(conn, "COPY {} FROM '{}' FORMAT AS JSON 'auto'".format(partition, match.group('location')),
+                          root, constants=values)
+
+    return None
+
+
+def install(root, dsn):
+    """
+        Point the Sparkify operators to the local stand-ins.
+
+        :param root: local directory standing in for S3, holding one folder per bucket.
+        :type root: string
+        :param dsn: postgres:// URI of the local database standing in for Redshift.
+        :type dsn: string
+    """
+    os.environ['AIRFLOW_CONN_REDSHIFT'] = dsn
+    LocalS3Hook.root = root
+    LocalDataApiClient.dsn, LocalDataApiClient.root = dsn, root
+
+    from helpers.redshift_session import RedshiftSession
+    import airflow.contrib.hooks.aws_hook
+    import airflow.hooks.S3_hook
+
+    # the operators import their hooks when they run.
+    airflow.hooks.S3_hook.S3Hook = LocalS3Hook
+    airflow.contrib.hooks.aws_hook.AwsHook = LocalAwsHook
+    try:
+        # the Redshift Data API client of the deferrable operators, on Airflow 2.
+        import airflow.providers.amazon.aws.hooks.base_aws
+        airflow.providers.amazon.aws.hooks.base_aws.AwsBaseHook = LocalAwsHook
+    except ImportError:
+        pass
+
+    redshift_run = RedshiftSession.run
+    redshift_get_records = RedshiftSession.get_records
+    redshift_get_first = RedshiftSession.get_first
+
+    def run(self, sql, parameters=None):
+        rowcount = -1
+        for statement in [sql] if isinstance(sql, str) else sql:
+            if copy_pattern.match(statement):
+                rowcount = local_copy(self.conn, statement, root)
+            elif external_ddl(self.conn, statement, root) is not None:
+                rowcount = -1
+            else:
+                rowcount = redshift_run(self, to_postgres(statement), parameters)
+        return rowcount
+
+    # Postgres has no WLM queues, the query group only names the connection.
+    RedshiftSession.query_group_sql = "SET application_name TO %s"
+    RedshiftSession.run = run
+    RedshiftSession.get_records = lambda self, sql, parameters=None: \
+        redshift_get_records(self, to_postgres(sql), parameters)
+    RedshiftSession.get_first = lambda self, sql, parameters=None: \
+        redshift_get_first(self, to_postgres(sql), parameters)
+
+
+def create_tables(dsn, ddl_path):
+    """ Create the Redshift system views stand-ins and the star schema in the local Postgres. """
+    import psycopg2
+
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        with open(compat_sql_path) as compat_file:
+            cursor.execute(compat_file.read())
+        with open(ddl_path) as ddl_file:
+            cursor.execute(to_postgres(ddl_file.read()))
@@ -0,0 +1,121 @@
+""" Parse time benchmark of the Sparkify DAG files, as the scheduler parses them
+
+Usage:
+
+    python benchmarks/parse_time_benchmark.py --runs 20 --budget-ms 100 --cold-budget-ms 3000
+
+A cold parse imports the DAG file in a fresh interpreter, a warm parse imports it in a process forked
+from one which imported the plugins and warmed their caches, as the scheduler forks a DAG file processor
+for every parse: what a parse caches is lost with its process. The median
+of both is written to the report, and the exit code is 1 when one of them is over its budget.
+"""
+
+import argparse
+import json
+import os
+import runpy
+import statistics
+import subprocess
+import sys
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+plugins_folder = os.path.join(repo_root, 'plugins')
+dags_folder = os.path.join(repo_root, 'dags')
+
+cold_parse_script = """
+import runpy, sys, time
+sys.path.insert(0, {plugins_folder!r})
+started = time.perf_counter()
+runpy.run_path({dag_file!r})
+print(time.perf_counter() - started)
+"""
+
+
+def cold_parse_seconds(dag_file):
+    """ Seconds to parse the DAG file in a fresh interpreter, Airflow itself already imported. """
+    output = subprocess.run(
+        [sys.executable, '-c', "import airflow.models\n" + cold_parse_script.format(
+            plugins_folder=plugins_folder, dag_file=dag_file)],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_plugins():
+    """ Import the plugins and warm their caches, as the scheduler does before it forks. """
+    if plugins_folder not in sys.path:
+        sys.path.insert(0, plugins_folder)
+    import operators  # noqa: F401
+    from helpers.dag_factory import warm_cache
+
+    warm_cache(os.path.join(dags_folder, 'config', 'sparkify_tenants.json'))
+
+
+def warm_parse_seconds(dag_file):
+    """ Seconds to parse the DAG file in a process forked from this interpreter, the plugins already imported. """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # the child never returns into the benchmark.
+        try:
+            os.close(read_end)
+            started = time.perf_counter()
+            runpy.run_path(dag_file)
+            os.write(write_end, str(time.perf_counter() - started).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as child_output:
+        output = child_output.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0 or not output:
+        raise RuntimeError(f"Parsing {dag_file} failed in the forked process")
+    return float(output)
+
+
+def benchmark(dag_file, runs):
+    cold = [cold_parse_seconds(dag_file) for _ in range(runs)]
+
+    import_plugins()
+    warm = [warm_parse_seconds(dag_file) for _ in range(runs)]
+
+    return {'dag_file': os.path.relpath(dag_file, repo_root),
+            'cold_median_ms': round(statistics.median(cold) * 1000, 2),
+            'warm_median_ms': round(statistics.median(warm) * 1000, 2),
+            'warm_max_ms': round(max(warm) * 1000, 2)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('dag_files', nargs='*', help='DAG files to parse, every file of dags/ by default')
+    arg_parser.add_argument('--runs', type=int, default=10, help='parses per DAG file')
+    arg_parser.add_argument('--budget-ms', type=float, default=100, help='budget of the warm parse median')
+    arg_parser.add_argument('--cold-budget-ms', type=float, default=3000, help='budget of the cold parse median')
+    arg_parser.add_argument('--report', default='parse_time_report.json', help='path of the JSON report')
+    args = arg_parser.parse_args()
+
+    dag_files = args.dag_files or sorted(
+        os.path.join(dags_folder, name) for name in os.listdir(dags_folder) if name.endswith('.py'))
+
+    results = []
+    over_budget = False
+    for dag_file in dag_files:
+        result = benchmark(os.path.abspath(dag_file), args.runs)
+        result['over_budget'] = result['warm_median_ms'] > args.budget_ms or \
+            result['cold_median_ms'] > args.cold_budget_ms
+        over_budget = over_budget or result['over_budget']
+        results.append(result)
+        print("{dag_file}: cold {cold_median_ms} ms, warm {warm_median_ms} ms (max {warm_max_ms} ms)"
+              "{}".format(" OVER BUDGET" if result['over_budget'] else "", **result))
+
+    with open(args.report, 'w') as report_file:
+        json.dump({'budget_ms': args.budget_ms, 'cold_budget_ms': args.cold_budget_ms,
+                   'dag_files': results}, report_file, indent=2)
+    print(f"Report written to {args.report}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
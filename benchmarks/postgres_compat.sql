@@ -0,0 +1,53 @@
+-- Redshift system views and operators the Sparkify plugin relies on, imitated in Postgres.
+
+CREATE OR REPLACE VIEW public.stv_slices AS
+SELECT 0 AS slice, 0 AS node;
+
+CREATE OR REPLACE VIEW public.svv_table_info AS
+SELECT n.nspname::varchar AS "schema",
+       c.relname::varchar AS "table",
+       c.reltuples::int8 AS tbl_rows,
+       c.reltuples::int8 AS estimated_visible_rows,
+       0.0::numeric(5,2) AS unsorted,
+       0.0::numeric(5,2) AS stats_off,
+       NULL::varchar AS diststyle,
+       NULL::varchar AS sortkey1
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname = 'public';
+
+CREATE OR REPLACE VIEW public.svl_query_summary AS
+SELECT 0 AS query, ''::varchar AS label, 0::int8 AS bytes
+WHERE FALSE;
+
+-- the stand-in sessions set their query group as application_name.
+CREATE OR REPLACE VIEW public.stv_inflight AS
+SELECT pid AS query, application_name::varchar AS label, query_start AS starttime, query::varchar AS text
+FROM pg_stat_activity
+WHERE state = 'active' AND pid <> pg_backend_pid();
+
+CREATE OR REPLACE VIEW public.stl_wlm_query AS
+SELECT 0 AS query, 0 AS service_class, 0::int8 AS total_queue_time, 0::int8 AS total_exec_time
+WHERE FALSE;
+
+-- the external schemas are plain schemas of the stand-in, see local_stand_ins.external_ddl.
+CREATE OR REPLACE VIEW public.svv_external_tables AS
+SELECT table_schema::varchar AS schemaname, table_name::varchar AS tablename
+FROM information_schema.tables
+WHERE table_schema NOT IN ('public', 'pg_catalog', 'information_schema');
+
+CREATE OR REPLACE FUNCTION public.pg_last_query_id() RETURNS int4
+    AS 'SELECT -1' LANGUAGE SQL STABLE;
+
+-- Redshift casts the operands of || implicitly, e.g. md5(sessionid || start_time).
+CREATE OR REPLACE FUNCTION public.sparkify_concat(int4, timestamp) RETURNS text
+    AS 'SELECT $1::text || $2::text' LANGUAGE SQL IMMUTABLE;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_operator WHERE oprname = '||'
+                   AND oprleft = 'int4'::regtype AND oprright = 'timestamp'::regtype) THEN
+        CREATE OPERATOR || (LEFTARG = int4, RIGHTARG = timestamp, FUNCTION = public.sparkify_concat);
+    END IF;
+END
+$$;
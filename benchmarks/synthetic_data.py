@@ -0,0 +1,113 @@
+""" Synthetic `log_data` and `song_data` generator, laid out like the udacity-dend S3 bucket """
+
+import json
+import os
+import random
+from datetime import timedelta
+
+# the JSONPaths mapping file of the log data, in the column order of staging_events.
+log_json_paths = [
+    'artist', 'auth', 'firstName', 'gender', 'itemInSession', 'lastName', 'length', 'level', 'location',
+    'method', 'page', 'registration', 'sessionId', 'song', 'status', 'ts', 'userAgent', 'userId'
+]
+
+first_names = ['Kaylee', 'Lily', 'Jacob', 'Chloe', 'Aleena', 'Tegan', 'Ryan', 'Mohammad', 'Jayden', 'Ava']
+last_names = ['Summers', 'Koch', 'Klein', 'Cuevas', 'Kirby', 'Levine', 'Smith', 'Rodriguez', 'Lee', 'Dunn']
+locations = ['San Francisco-Oakland-Hayward, CA', 'Chicago-Naperville-Elgin, IL-IN-WI',
+             'Atlanta-Sandy Springs-Roswell, GA', 'Portland-South Portland, ME', 'Lansing-East Lansing, MI']
+user_agents = ['Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36',
+               'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.77.4',
+               'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:31.0) Gecko/20100101 Firefox/31.0']
+
+
+def write_songs(root, num_songs, seed=0):
+    """
+        Write one JSON song file per song under song_data/A/A/A/.
+
+        :return: the catalog of (title, artist_name, duration) the events pick their songs from.
+    """
+    rng = random.Random(seed)
+    folder = os.path.join(root, 'song_data', 'A', 'A', 'A')
+    os.makedirs(folder, exist_ok=True)
+
+    catalog = []
+    num_artists = max(num_songs // 4, 1)
+    for i in range(num_songs):
+        artist = rng.randrange(num_artists)
+        song = {'num_songs': 1,
+                'artist_id': 'AR{:016X}'.format(artist),
+                'artist_latitude': round(rng.uniform(-90, 90), 5) if rng.random() < 0.5 else None,
+                'artist_longitude': round(rng.uniform(-180, 180), 5) if rng.random() < 0.5 else None,
+                'artist_location': rng.choice(locations),
+                'artist_name': 'Artist {}'.format(artist),
+                'song_id': 'SO{:016X}'.format(i),
+                'title': 'Song {}'.format(i),
+                'duration': round(rng.uniform(60, 600), 5),
+                'year': rng.choice([0, rng.randrange(1960, 2021)])}
+        with open(os.path.join(folder, 'TRAAA{:012d}.json'.format(i)), 'w') as song_file:
+            json.dump(song, song_file)
+        catalog.append((song['title'], song['artist_name'], song['duration']))
+
+    return catalog
+
+
+def write_events(root, num_events, catalog, start, hours=24, num_users=100, events_per_file=10000, seed=0):
+    """
+        Write `num_events` events spread over [start, start + hours) as JSON lines files under log_data/YYYY/MM/.
+
+        Events are streamed to disk, the generator never holds more than one event in memory.
+    """
+    rng = random.Random(seed)
+    span_ms = int(hours * 3600 * 1000)
+    start_ms = int(start.timestamp() * 1000)
+    users = [(user_id, rng.choice(first_names), rng.choice(last_names), rng.choice('MF'),
+              rng.choice(['free', 'paid']), rng.choice(locations), rng.choice(user_agents))
+             for user_id in range(1, num_users + 1)]
+
+    written = 0
+    file_number = 0
+    while written < num_events:
+        batch = min(events_per_file, num_events - written)
+        # every file covers a contiguous slice of the time range, like the hourly log files.
+        file_start = start_ms + span_ms * written // num_events
+        file_end = start_ms + span_ms * (written + batch) // num_events
+        day = start + timedelta(milliseconds=file_start - start_ms)
+
+        folder = os.path.join(root, 'log_data', str(day.year), '{:02d}'.format(day.month))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, '{}-events-{:06d}.json'.format(day.strftime('%Y-%m-%d'), file_number))
+
+        with open(path, 'w') as events_file:
+            for i in range(batch):
+                user_id, first_name, last_name, gender, level, location, user_agent = rng.choice(users)
+                next_song = rng.random() < 0.8
+                title, artist, duration = rng.choice(catalog) if next_song and catalog else (None, None, None)
+                event = {'artist': artist,
+                         'auth': 'Logged In',
+                         'firstName': first_name,
+                         'gender': gender,
+                         'itemInSession': i % 100,
+                         'lastName': last_name,
+                         'length': duration,
+                         # users upgrade now and then, so the level of a user changes over time.
+                         'level': 'paid' if rng.random() < 0.05 else level,
+                         'location': location,
+                         'method': 'PUT' if next_song else 'GET',
+                         'page': 'NextSong' if next_song else 'Home',
+                         'registration': 1540000000000.0 + user_id,
+                         'sessionId': user_id * 1000 + (i // 100),
+                         'song': title,
+                         'status': 200,
+                         'ts': file_start + (file_end - file_start) * i // batch,
+                         'userAgent': user_agent,
+                         'userId': user_id}
+                events_file.write(json.dumps(event))
+                events_file.write('\n')
+
+        written += batch
+        file_number += 1
+
+    with open(os.path.join(root, 'log_json_path.json'), 'w') as paths_file:
+        json.dump({'jsonpaths': ["$['{}']".format(path) for path in log_json_paths]}, paths_file, indent=2)
+
+    return file_number
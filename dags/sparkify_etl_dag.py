@@ -1,164 +1,15 @@
-""" DAG to execute data extract, transform and load pipeline from Amazon S3 to Amazon Redshift """
+""" DAGs to execute data extract, transform and load pipeline from Amazon S3 to Amazon Redshift, one per tenant """
 
-from datetime import datetime, timedelta
 import os
-from airflow import DAG
-from airflow.operators.subdag import SubDagOperator
-from airflow.operators.postgres_operator import PostgresOperator
-from airflow.operators.dummy_operator import DummyOperator
-from operators import (StageToRedshiftOperator, LoadFactOperator,
-                       LoadDimensionOperator, DataQualityOperator)
-from helpers import SqlQueries
-from subdags.dimension_subdag import load_dimension_tables_dag
-
-# default parameters provided for our DAG
-default_args = {
-    'owner': 'abdelraouf',
-    'depends_on_past': False,
-    'retries': 3,
-    'retry_delay': 5,
-    'email_on_failure': False,
-    'catchup': False
-}
-
-start_date = datetime(2020, 5, 10)
-
-
-dag = DAG('sparkify_etl_dag',
-          default_args=default_args,
-          description='Load and transform data in Redshift with Airflow',
-          start_date=start_date,
-          schedule_interval='0 * * * *'  # scheduled hourly using cron_expression
-          )
-
-start_operator = DummyOperator(task_id='Begin_execution',  dag=dag)
-
-stage_events_to_redshift = StageToRedshiftOperator(
-    task_id='Stage_events',
-    dag=dag,
-    table='staging_events',
-    time_format='epochmillisecs',
-    region='us-west-2',
-    format_type='s3://udacity-dend/log_json_path.json',
-    s3_bucket='udacity-dend',
-    s3_key='log_data',
-    use_partitioning=False,
-    execution_date='{{ execution_date }}',
-    redshift_conn_id='redshift',
-    aws_credentials_id='aws_credentials'
-)
-
-stage_songs_to_redshift = StageToRedshiftOperator(
-    task_id='Stage_songs',
-    dag=dag,
-    table='staging_songs',
-    time_format='epochmillisecs',
-    region='us-west-2',
-    format_type='auto',
-    s3_bucket='udacity-dend',
-    s3_key='song_data/A/A/A/',
-    use_partitioning=False,
-    execution_date='{{ execution_date }}',
-    redshift_conn_id='redshift',
-    aws_credentials_id='aws_credentials'
-)
-
-load_songplays_table = LoadFactOperator(
-    task_id='Load_songplays_fact_table',
-    dag=dag,
-    redshift_conn_id='redshift',
-    table='songplays',
-    append_data='False',
-    sql=SqlQueries.songplay_table_insert
-)
-
-user_table_task_id = "Load_user_dim_table"
-load_user_dim_task = SubDagOperator(
-    subdag=load_dimension_tables_dag(
-        "sparkify_etl_dag",
-        user_table_task_id,
-        "redshift",
-        "users",
-        "False",
-        SqlQueries.user_table_insert,
-        start_date=start_date
-    ),
-    task_id=user_table_task_id,
-    dag=dag
-)
-
-
-song_table_task_id = "Load_song_dim_table"
-load_song_dim_task = SubDagOperator(
-    subdag=load_dimension_tables_dag(
-        "sparkify_etl_dag",
-        song_table_task_id,
-        "redshift",
-        "songs",
-        "False",
-        SqlQueries.song_table_insert,
-        start_date=start_date
-    ),
-    task_id=song_table_task_id,
-    dag=dag
-)
-
-
-artist_table_task_id = "Load_artist_dim_table"
-load_artist_dim_task = SubDagOperator(
-    subdag=load_dimension_tables_dag(
-        "sparkify_etl_dag",
-        artist_table_task_id,
-        "redshift",
-        "artists",
-        "False",
-        SqlQueries.artist_table_insert,
-        start_date=start_date
-    ),
-    task_id=artist_table_task_id,
-    dag=dag
-)
-
-
-time_table_task_id = "Load_time_dim_table"
-load_time_dim_task = SubDagOperator(
-    subdag=load_dimension_tables_dag(
-        "sparkify_etl_dag",
-        time_table_task_id,
-        "redshift",
-        "time",
-        "False",
-        SqlQueries.time_table_insert,
-        start_date=start_date
-    ),
-    task_id=time_table_task_id,
-    dag=dag
-)
-
-
-run_quality_checks = DataQualityOperator(
-    task_id='Run_data_quality_checks',
-    dag=dag,
-    redshift_conn_id='redshift',
-    data_qaulity_checks=[
-        {'check_sql_query': "SELECT COUNT(*) FROM users WHERE userid is null", 'targeted_table': 'users', 'test_against': 'null', 'expected_result': 0}]
-)
-
-end_operator = DummyOperator(task_id='Stop_execution',  dag=dag)
-
-
-# tasks dependencies management
-start_operator >> create_tables_task
-create_tables_task >> stage_events_to_redshift
-create_tables_task >> stage_songs_to_redshift
-stage_events_to_redshift >> load_songplays_table
-stage_songs_to_redshift >> load_songplays_table
-load_songplays_table >> load_song_dim_task
-load_songplays_table >> load_user_dim_task
-load_songplays_table >> load_artist_dim_task
-load_songplays_table >> load_time_dim_task
-load_song_dim_task >> run_quality_checks
-load_user_dim_task >> run_quality_checks
-load_artist_dim_task >> run_quality_checks
-load_time_dim_task >> run_quality_checks
-run_quality_checks >> end_operator
+from airflow import DAG  # noqa: F401, the scheduler only parses files mentioning airflow and DAG
+from helpers.dag_factory import create_dags
+
+# the tenants, their S3 source, connections and shared pools are declared in config/sparkify_tenants.json,
+# the config is parsed again only when it changes.
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'sparkify_tenants.json')
+
+# the tasks and their dependencies come from the declarative spec in helpers.pipeline_spec,
+# built once per tenant when the scheduler imports the plugins (helpers.dag_factory.warm_cache): Begin_execution >> Create_tables
+# >> Stage_events/Stage_songs >> Load_song_lookup_table >> Load_songplays_fact_table
+# >> Load_dimension_tables >> Run_data_quality_checks >> Load_rollups >> Run_table_maintenance >> Stop_execution
+create_dags(config_path, globals())
@@ -1,9 +1,22 @@
 from __future__ import division, absolute_import, print_function
 
+import logging
+import os
+
+from airflow import settings
 from airflow.plugins_manager import AirflowPlugin
 
 import operators
 import helpers
+from helpers.dag_factory import warm_cache
+
+# the plugins are imported by the scheduler before it forks the DAG file processors: the tenant specs built
+# here are cached in every processor, instead of being built again by each parse.
+try:
+    warm_cache(os.path.join(settings.DAGS_FOLDER, 'config', 'sparkify_tenants.json'))
+except Exception:
+    # an invalid config fails the parse of the DAG file, where the error is reported.
+    logging.getLogger(__name__).exception("The tenant specs could not be built in advance")
 
 # Defining the plugin class
 
@@ -14,8 +27,18 @@ class UdacityPlugin(AirflowPlugin):
         operators.StageToRedshiftOperator,
         operators.LoadFactOperator,
         operators.LoadDimensionOperator,
-        operators.DataQualityOperator
+        operators.LoadDimensionsOperator,
+        operators.DataQualityOperator,
+        operators.RedshiftMaintenanceOperator,
+        operators.ReleaseStagingTablesOperator,
+        operators.LoadCalendarOperator,
+        operators.StageToSpectrumOperator,
+        operators.DeferrableStageToRedshiftOperator,
+        operators.DeferrableLoadFactOperator,
+        operators.DeferrableLoadDimensionOperator,
+        operators.LoadRollupsOperator
     ]
     helpers = [
-        helpers.SqlQueries
+        helpers.SqlQueries,
+        helpers.CopyFormat
     ]
@@ -1,9 +1,111 @@
 from helpers.sql_queries import SqlQueries
+from helpers.sql_builder import (build_query, merge_statements, calendar_sql,
+                                 calendar_coverage_sql, calendar_ranges, calendar_grains)
+from helpers.s3_manifest import (load_watermark, save_watermark, next_watermark, serialize_watermark,
+                                 deserialize_watermark, list_new_objects,
+                                 balance_objects, slice_metrics, coalesce_objects,
+                                 build_manifest, upload_manifest)
+from helpers.copy_format import CopyFormat
+from helpers.time_window import (parse_window, has_window_filter, render_window,
+                                 window_delete_sql, window_months)
+from helpers.backfill import plan_backfill, backfill_commands
+from helpers.quality_checks import (group_checks, needs_scan,
+                                    run_table_checks, system_row_counts)
+from helpers.table_stats import TableStatsStore
+from helpers.redshift_session import RedshiftSession, RedshiftConnectionPool
+from helpers.query_stats import publish_query_stats
+from helpers.star_schema import (star_schema, create_schema_sql, deep_copy_sql,
+                                 tables_to_migrate, migrate_tables)
+from helpers.table_maintenance import table_health, plan_maintenance, active_queries
+from helpers.pipeline_spec import pipeline_spec, build_dag
+from helpers.dag_factory import load_config, create_dags
+from helpers.run_tables import (release_modes, run_tables_sql, run_table_name, run_table_date,
+                                create_run_table_sql, scope_sql, release_run_table_sql,
+                                stale_run_tables)
+from helpers.spectrum import (external_schema_sql, external_table_sql, external_tables_sql,
+                              add_partition_sql, external_sql)
+from helpers.staging_validation import (staging_columns, parse_json_paths,
+                                        validate_staging_object)
+from helpers.redshift_data import (StatementBatch, data_api_target, data_api_client,
+                                   submit_batch, batch_error, batch_query_stats)
+from helpers.rollups import (rollups, rollup_periods, rollup_refresh_sql,
+                             rollup_consistency_sql)
 
 # Python import paths are related to many factors.
 # Normally we would include the relative path of the modules to be imported,
 # but we may also define global paths or in places like __init__.py.
 
 __all__ = [
-    'SqlQueries'
+    'SqlQueries',
+    'build_query',
+    'merge_statements',
+    'calendar_sql',
+    'calendar_coverage_sql',
+    'calendar_ranges',
+    'calendar_grains',
+    'load_watermark',
+    'save_watermark',
+    'list_new_objects',
+    'balance_objects',
+    'slice_metrics',
+    'coalesce_objects',
+    'build_manifest',
+    'upload_manifest',
+    'CopyFormat',
+    'parse_window',
+    'has_window_filter',
+    'render_window',
+    'window_delete_sql',
+    'window_months',
+    'plan_backfill',
+    'backfill_commands',
+    'group_checks',
+    'needs_scan',
+    'run_table_checks',
+    'system_row_counts',
+    'TableStatsStore',
+    'RedshiftSession',
+    'RedshiftConnectionPool',
+    'publish_query_stats',
+    'staging_columns',
+    'parse_json_paths',
+    'validate_staging_object',
+    'star_schema',
+    'create_schema_sql',
+    'deep_copy_sql',
+    'tables_to_migrate',
+    'migrate_tables',
+    'table_health',
+    'plan_maintenance',
+    'pipeline_spec',
+    'build_dag',
+    'load_config',
+    'create_dags',
+    'release_modes',
+    'run_tables_sql',
+    'run_table_name',
+    'run_table_date',
+    'create_run_table_sql',
+    'scope_sql',
+    'release_run_table_sql',
+    'stale_run_tables',
+    'external_schema_sql',
+    'external_table_sql',
+    'external_tables_sql',
+    'add_partition_sql',
+    'external_sql',
+    'StatementBatch',
+    'data_api_target',
+    'data_api_client',
+    'submit_batch',
+    'batch_error',
+    'batch_query_stats',
+    'rollups',
+    'rollup_periods',
+    'rollup_refresh_sql',
+    'rollup_consistency_sql',
+    'next_watermark',
+    'serialize_watermark',
+    'deserialize_watermark',
+    'active_queries'
 ]
@@ -0,0 +1,97 @@
+""" Plan a catch-up backfill of an hourly DAG into batches of time windows that can run concurrently """
+
+import argparse
+from datetime import timedelta
+
+
+def plan_backfill(start, end, interval=timedelta(hours=1), batches=1):
+    """
+        Split [start, end) into [window_start, window_end) windows and group them into contiguous batches.
+
+        :param start: first window start (execution_date of the first run).
+        :type start: datetime
+        :param end: end of the last window.
+        :type end: datetime
+        :param interval: size of a window, the schedule interval of the DAG.
+        :type interval: timedelta
+        :param batches: number of batches to run concurrently.
+        :type batches: int
+
+        :return: list of batches, each a list of (window_start, window_end) tuples.
+    """
+    windows = []
+    window_start = start
+    while window_start < end:
+        windows.append((window_start, min(window_start + interval, end)))
+        window_start += interval
+
+    batches = max(min(batches, len(windows)), 1)
+    size, remainder = divmod(len(windows), batches)
+
+    plan = []
+    first = 0
+    for i in range(batches):
+        last = first + size + (1 if i < remainder else 0)
+        if last > first:
+            plan.append(windows[first:last])
+        first = last
+
+    return plan
+
+
+def backfill_commands(dag_id, plan, run_scoped_staging=False, max_active_runs=1):
+    """
+        One `airflow dags backfill` command per batch, the end date of a backfill is the last execution_date.
+
+        Concurrent runs of a DAG staging into the shared staging tables delete each other's rows: several batches
+        need a DAG staging into run-scoped tables, with more than one active run (the batches beyond
+        max_active_runs wait for a free run).
+
+        :param run_scoped_staging: whether the DAG stages into run-scoped tables.
+        :type run_scoped_staging: boolean
+        :param max_active_runs: max_active_runs of the DAG.
+        :type max_active_runs: int
+    """
+    if len(plan) > 1 and (not run_scoped_staging or max_active_runs < 2):
+        raise ValueError(
+            f"{dag_id} can't run {len(plan)} backfill batches concurrently: it needs run_scoped_staging and "
+            f"max_active_runs above 1 (it has {max_active_runs}), or use a single batch")
+    return ["airflow dags backfill -s {} -e {} {}".format(batch[0][0].isoformat(), batch[-1][0].isoformat(), dag_id)
+            for batch in plan]
+
+
+def tenant_settings(config_path, dag_id):
+    """ run_scoped_staging and max_active_runs of the tenant of a DAG in a tenants config file. """
+    from helpers.dag_factory import load_config, tenant_dag_id
+
+    for tenant in load_config(config_path)['tenants']:
+        if tenant_dag_id(tenant) == dag_id:
+            return bool(tenant.get('run_scoped_staging', False)), tenant.get('max_active_runs', 1)
+    raise ValueError(f"No tenant of {config_path} generates {dag_id}")
+
+
+if __name__ == '__main__':
+    from dateutil import parser
+
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('dag_id')
+    arg_parser.add_argument('start', help='first execution_date, e.g. 2020-05-10T00:00:00')
+    arg_parser.add_argument('end', help='end of the last window (exclusive)')
+    arg_parser.add_argument('--interval-hours', type=float, default=1)
+    arg_parser.add_argument('--batches', type=int, default=4)
+    arg_parser.add_argument('--config', help='tenants config file the run_scoped_staging and max_active_runs '
+                                             'of the DAG are read from')
+    arg_parser.add_argument('--run-scoped-staging', action='store_true', help='the DAG stages into run-scoped tables')
+    arg_parser.add_argument('--max-active-runs', type=int, default=1, help='max_active_runs of the DAG')
+    args = arg_parser.parse_args()
+
+    run_scoped_staging, max_active_runs = tenant_settings(args.config, args.dag_id) if args.config \
+        else (args.run_scoped_staging, args.max_active_runs)
+    backfill_plan = plan_backfill(parser.parse(args.start), parser.parse(args.end),
+                                  timedelta(hours=args.interval_hours), args.batches)
+    try:
+        commands = backfill_commands(args.dag_id, backfill_plan, run_scoped_staging, max_active_runs)
+    except ValueError as error:
+        arg_parser.error(str(error))
+    for command in commands:
+        print(command)
@@ -0,0 +1,116 @@
+class CopyFormat:
+    """
+        CopyFormat describes the input files of a Redshift COPY and renders the matching COPY clauses.
+
+        :param data_format: the input file format, one of 'json', 'csv', 'parquet' or 'orc'.
+        :type data_format: string
+            Default is 'json'
+
+        :param json_paths: 'auto' or the s3:// path of a JSONPaths file (mapping file), only used by 'json'.
+        :type json_paths: string
+            Default is 'auto'
+
+        :param compression: compression of the input files, one of 'gzip', 'bzip2', 'zstd' or None.
+        :type compression: string
+
+        :param time_format: format of the time values in the input files (TIMEFORMAT), not used by columnar formats.
+        :type time_format: string
+
+        :param delimiter: field delimiter of 'csv' files.
+        :type delimiter: string
+
+        :param ignore_header: number of header lines to skip in 'csv' files.
+        :type ignore_header: int
+
+        :param compupdate: if set, turns automatic compression analysis ON or OFF (COMPUPDATE).
+        :type compupdate: boolean
+
+        :param statupdate: if set, turns automatic statistics refresh ON or OFF (STATUPDATE).
+        :type statupdate: boolean
+
+        :param max_error: number of bad records COPY may skip before failing (MAXERROR).
+        :type max_error: int
+    """
+
+    row_formats = ('json', 'csv')
+    columnar_formats = ('parquet', 'orc')
+    compressions = ('gzip', 'bzip2', 'zstd')
+
+    def __init__(self,
+                 data_format='json',
+                 json_paths='auto',
+                 compression=None,
+                 time_format=None,
+                 delimiter=None,
+                 ignore_header=None,
+                 compupdate=None,
+                 statupdate=None,
+                 max_error=None):
+
+        self.data_format = data_format.lower()
+        self.json_paths = json_paths
+        self.compression = compression.lower() if compression else None
+        self.time_format = time_format
+        self.delimiter = delimiter
+        self.ignore_header = ignore_header
+        self.compupdate = compupdate
+        self.statupdate = statupdate
+        self.max_error = max_error
+
+        if self.data_format not in self.row_formats + self.columnar_formats:
+            raise ValueError(f"Unsupported COPY format: {data_format}")
+        if self.compression is not None and self.compression not in self.compressions:
+            raise ValueError(f"Unsupported COPY compression: {compression}")
+        if self.is_columnar and (self.compression or self.time_format or self.max_error is not None):
+            raise ValueError(
+                f"compression, time_format and max_error can't be used with {self.data_format.upper()} files")
+
+    @classmethod
+    def from_value(cls, value):
+        """ Build a CopyFormat from a CopyFormat, a dictionary of its arguments or None (plain JSON). """
+        if value is None:
+            return cls()
+        if isinstance(value, cls):
+            return value
+        return cls(**value)
+
+    @property
+    def is_columnar(self):
+        return self.data_format in self.columnar_formats
+
+    def with_compression(self, compression):
+        """ Copy of this format for input files compressed with `compression`. """
+        copy_format = CopyFormat(**vars(self))
+        copy_format.compression = compression
+        return copy_format
+
+    def copy_options(self, manifest=False):
+        """ Render the format related clauses of the COPY command. """
+        options = []
+
+        if manifest:
+            options.append("MANIFEST")
+
+        if self.data_format == 'json':
+            options.append(f"FORMAT AS JSON '{self.json_paths}'")
+        elif self.data_format == 'csv':
+            options.append("FORMAT AS CSV")
+            if self.delimiter is not None:
+                options.append(f"DELIMITER '{self.delimiter}'")
+            if self.ignore_header:
+                options.append(f"IGNOREHEADER {int(self.ignore_header)}")
+        else:
+            options.append(f"FORMAT AS {self.data_format.upper()}")
+
+        if self.compression:
+            options.append(self.compression.upper())
+        if self.time_format:
+            options.append(f"TIMEFORMAT AS '{self.time_format}'")
+        if self.max_error is not None:
+            options.append(f"MAXERROR {int(self.max_error)}")
+        if self.compupdate is not None:
+            options.append("COMPUPDATE {}".format('ON' if self.compupdate else 'OFF'))
+        if self.statupdate is not None:
+            options.append("STATUPDATE {}".format('ON' if self.statupdate else 'OFF'))
+
+        return "\n        ".join(options)
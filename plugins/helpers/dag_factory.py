@@ -0,0 +1,175 @@
+""" Generate one Sparkify pipeline DAG per tenant of a JSON or YAML config file """
+
+import argparse
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from helpers.pipeline_spec import pool_name, query_groups
+
+# arguments of helpers.pipeline_spec a tenant can set, the other tenant keys configure its DAG.
+tenant_spec_keys = ('s3_bucket', 'region', 'log_json_path', 'events_key', 'songs_key',
+                    'redshift_conn_id', 'aws_credentials_id', 'pool', 'run_scoped_staging',
+                    'staging_release_mode', 'time_dimension', 'calendar_grain', 'spectrum_staging',
+                    'spectrum_iam_role', 'spectrum_schema', 'spectrum_database', 'deferrable',
+                    'incremental_staging', 'manifest_bucket')
+
+_config_cache = {}
+_config_lock = threading.Lock()
+
+
+def load_config(path):
+    """
+        Read a tenants config file, parsed again only when its modification time changes.
+
+        The config has 'defaults' applied to every tenant, 'pools' ({name: {'slots', 'description'}})
+        shared by the tenants, and the 'tenants' list, each with a unique 'name' and its own 'redshift_conn_id'.
+
+        :param path: path of the .json, .yml or .yaml config file.
+        :type path: string
+
+        :return: the config dictionary, with the defaults applied to every tenant.
+    """
+    mtime = os.path.getmtime(path)
+    with _config_lock:
+        cached = _config_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    with open(path) as config_file:
+        if path.endswith(('.yml', '.yaml')):
+            import yaml
+
+            config = yaml.safe_load(config_file)
+        else:
+            config = json.load(config_file)
+
+    config = validate_config(config)
+    with _config_lock:
+        _config_cache[path] = (mtime, config)
+    return config
+
+
+def validate_config(config):
+    """ Apply the defaults to every tenant and check their names and pools. """
+    defaults = config.get('defaults', {})
+    pools = config.get('pools', {})
+
+    tenants = []
+    for tenant in config.get('tenants', []):
+        tenant = dict(defaults, **tenant)
+        if not tenant.get('name'):
+            raise ValueError(f"Every tenant needs a name: {tenant}")
+        undeclared = sorted({pool_name(tenant['pool'], query_group) for query_group in query_groups}
+                            - set(pools)) if tenant.get('pool') else []
+        if undeclared:
+            raise ValueError(f"Tenant {tenant['name']} uses the undeclared pools {', '.join(undeclared)}")
+        tenants.append(tenant)
+
+    names = [tenant['name'] for tenant in tenants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicated tenants: {', '.join(duplicates)}")
+
+    # the tenants load the same table names: on one database, their staging and dimension reloads would
+    # overwrite each other's rows.
+    connections = {}
+    for tenant in tenants:
+        connections.setdefault(tenant.get('redshift_conn_id', 'redshift'), []).append(tenant['name'])
+    shared = [f"{conn_id} ({', '.join(tenant_names)})"
+              for conn_id, tenant_names in sorted(connections.items()) if len(tenant_names) > 1]
+    if shared:
+        raise ValueError(f"Tenants sharing a Redshift connection: {'; '.join(shared)}")
+
+    return {'defaults': defaults, 'pools': pools, 'tenants': tenants}
+
+
+def tenant_dag_id(tenant):
+    return tenant.get('dag_id') or "sparkify_etl_{}".format(tenant['name'])
+
+
+def tenant_spec_args(tenant):
+    """ The helpers.pipeline_spec arguments of a tenant. """
+    # the tenant name keeps its data quality statistics and staging watermarks apart from the other tenants'.
+    return dict({key: tenant[key] for key in tenant_spec_keys if key in tenant}, tenant=tenant['name'])
+
+
+def warm_cache(path):
+    """
+        Parse a tenants config and build the spec of every tenant (and the SQL it embeds) into the caches.
+
+        The scheduler parses the DAG files in processes forked from it, which start with its caches and lose
+        what they add: warmed when the plugins are imported, before the forks, the caches are hits in every parse.
+        A missing config file is ignored.
+
+        :param path: path of the tenants config file.
+        :type path: string
+    """
+    from helpers.pipeline_spec import pipeline_spec
+
+    if not os.path.exists(path):
+        return
+    for tenant in load_config(path)['tenants']:
+        pipeline_spec(**tenant_spec_args(tenant))
+
+
+def create_tenant_dag(tenant):
+    """
+        The pipeline DAG of a tenant: its source, connections and pool from the config, the tasks from
+        helpers.pipeline_spec (built once per tenant, see warm_cache).
+    """
+    from airflow import DAG
+    from helpers.pipeline_spec import pipeline_spec, build_dag
+
+    default_args = {
+        'owner': tenant.get('owner', 'sparkify'),
+        'depends_on_past': False,
+        'retries': tenant.get('retries', 3),
+        'retry_delay': timedelta(seconds=tenant.get('retry_delay_seconds', 300)),
+        'email_on_failure': False
+    }
+    dag = DAG(tenant_dag_id(tenant),
+              default_args=default_args,
+              description=tenant.get('description',
+                                      "Load and transform the {} data in Redshift with Airflow".format(tenant['name'])),
+              start_date=datetime.strptime(tenant.get('start_date', '2020-05-10'), '%Y-%m-%d'),
+              schedule_interval=tenant.get('schedule_interval', '0 * * * *'),
+              catchup=tenant.get('catchup', False),
+              max_active_runs=tenant.get('max_active_runs', 1),
+              concurrency=tenant.get('concurrency', 4))
+
+    build_dag(dag, pipeline_spec(**tenant_spec_args(tenant)))
+    return dag
+
+
+def create_dags(path, namespace):
+    """
+        Create the DAG of every tenant of a config file into a module namespace, for the scheduler to find.
+
+        :param path: path of the tenants config file.
+        :type path: string
+        :param namespace: globals() of the DAG file.
+        :type namespace: dictionary
+
+        :return: list of the created DAGs.
+    """
+    dags = [create_tenant_dag(tenant) for tenant in load_config(path)['tenants']]
+    for dag in dags:
+        namespace[dag.dag_id] = dag
+    return dags
+
+
+def pool_commands(config):
+    """ `airflow pools set` commands (Airflow 2 CLI) creating the pools the tenants share. """
+    return ["airflow pools set {} {} '{}'".format(name, pool['slots'], pool.get('description', ''))
+            for name, pool in sorted(config['pools'].items())]
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('config', help='path of the tenants config file')
+    args = arg_parser.parse_args()
+
+    for command in pool_commands(load_config(args.config)):
+        print(command)
@@ -0,0 +1,367 @@
+""" Declarative spec of the Sparkify pipeline: built once per process, turned into DAG tasks on every parse """
+
+from functools import lru_cache
+from importlib import import_module
+
+# how the time dimension is loaded, see pipeline_spec.
+time_dimension_modes = ('window', 'incremental', 'calendar')
+
+# WLM query groups of the tasks running queries on Redshift, see helpers.redshift_session.
+query_groups = ('copy', 'transform', 'check', 'maintenance')
+
+# module of every operator a spec can use, imported the first time a DAG uses it.
+operator_modules = {
+    'DummyOperator': 'airflow.operators.dummy_operator',
+    'PostgresOperator': 'airflow.operators.postgres_operator',
+    'StageToRedshiftOperator': 'operators',
+    'LoadFactOperator': 'operators',
+    'LoadDimensionOperator': 'operators',
+    'LoadDimensionsOperator': 'operators',
+    'DataQualityOperator': 'operators',
+    'RedshiftMaintenanceOperator': 'operators',
+    'ReleaseStagingTablesOperator': 'operators',
+    'LoadCalendarOperator': 'operators',
+    'StageToSpectrumOperator': 'operators',
+    'DeferrableStageToRedshiftOperator': 'operators',
+    'DeferrableLoadFactOperator': 'operators',
+    'DeferrableLoadDimensionOperator': 'operators',
+    'LoadRollupsOperator': 'operators',
+}
+
+
+@lru_cache(maxsize=None)
+def operator_class(name):
+    """ The operator class of a spec 'operator' name. """
+    if name not in operator_modules:
+        raise ValueError(f"Unknown operator: {name}")
+    return getattr(import_module(operator_modules[name]), name)
+
+
+def task_spec(task_id, operator, upstream=(), **params):
+    return {'task_id': task_id, 'operator': operator, 'upstream': tuple(upstream), 'params': params}
+
+
+def pool_name(pool, query_group):
+    """ The Airflow pool of the tasks of a WLM query group. """
+    return pool.format(query_group=query_group)
+
+
+@lru_cache(maxsize=None)
+def pipeline_spec(s3_bucket='udacity-dend',
+                  region='us-west-2',
+                  log_json_path='s3://udacity-dend/log_json_path.json',
+                  events_key='log_data',
+                  songs_key='song_data/A/A/A/',
+                  redshift_conn_id='redshift',
+                  aws_credentials_id='aws_credentials',
+                  pool=None,
+                  run_scoped_staging=False,
+                  staging_release_mode='drop',
+                  time_dimension='window',
+                  calendar_grain='second',
+                  spectrum_staging=False,
+                  spectrum_iam_role='',
+                  spectrum_schema='spectrum',
+                  spectrum_database='sparkify',
+                  deferrable=False,
+                  incremental_staging=False,
+                  manifest_bucket='',
+                  tenant=''):
+    """
+        Tasks of sparkify_etl_dag, in dependency order: their operator, arguments and upstream tasks.
+
+        The spec, and the SQL it embeds, is built once per process and set of arguments; the scheduler
+        re-parsing the DAG file only instantiates the operators.
+
+        :param s3_bucket: Amazon S3 Bucket name of the log and song data.
+        :type s3_bucket: string
+        :param region: the region of the bucket.
+        :type region: string
+        :param log_json_path: s3:// path of the JSONPaths file of the log data.
+        :type log_json_path: string
+        :param events_key: key folder of the log data.
+        :type events_key: string
+        :param songs_key: key folder of the song data.
+        :type songs_key: string
+        :param redshift_conn_id: Connection id of the Redshift connection to use.
+        :type redshift_conn_id: string
+        :param aws_credentials_id: Connection id of the AWS credentials to use to access S3 data.
+        :type aws_credentials_id: string
+        :param pool: Airflow pool of the tasks running queries on Redshift, to limit their concurrency.
+                     A '{query_group}' placeholder gives every WLM query group its own pool,
+                     e.g. 'sparkify_{query_group}' for sparkify_copy, sparkify_transform...
+        :type pool: string
+        :param run_scoped_staging: if true, every run stages into and loads from its own staging tables,
+                                   released at the end of the run, so that runs can overlap.
+        :type run_scoped_staging: boolean
+        :param staging_release_mode: how the run-scoped staging tables are released, see helpers.run_tables.
+        :type staging_release_mode: string
+        :param time_dimension: how the time dimension is loaded: 'window' rewrites the time rows of the run window
+                               from songplays, 'incremental' only inserts the start times past the latest one
+                               (the start times of a backfilled or reloaded window are never added, backfill
+                               with 'window'), 'calendar' pre-generates a dense calendar ahead of the runs.
+        :type time_dimension: string
+        :param calendar_grain: step of the pre-generated calendar, only 'second': songplays.start_time joins
+                               the time rows at second precision, a coarser calendar would miss most plays.
+        :type calendar_grain: string
+        :param spectrum_staging: if true, the log and song data are registered as Redshift Spectrum external
+                                 tables and read in place by the loads, instead of copied into staging tables.
+        :type spectrum_staging: boolean
+        :param spectrum_iam_role: ARN of the IAM role Redshift assumes to read the external tables.
+        :type spectrum_iam_role: string
+        :param spectrum_schema: external schema of the external tables.
+        :type spectrum_schema: string
+        :param spectrum_database: AWS Glue data catalog database of the external schema.
+        :type spectrum_database: string
+        :param deferrable: if true, the staging COPY, the songplays load and the song lookup load are submitted
+                           through the Redshift Data API and awaited by the triggerer (Airflow 2.2+),
+                           without holding a worker slot.
+        :type deferrable: boolean
+        :param incremental_staging: if true, Stage_events only stages the log objects written since its high-water
+                                    mark, listing the <year>/<month>/ folders of events_key since then. Each run
+                                    stages the new objects only: use it when they hold the events of the run
+                                    window (e.g. hourly files), the loads only read the window.
+        :type incremental_staging: boolean
+        :param manifest_bucket: Amazon S3 Bucket the COPY manifests of the incremental staging are written to.
+        :type manifest_bucket: string
+        :param tenant: name of the tenant, the namespace of its data quality statistics and staging watermarks.
+        :type tenant: string
+
+        :return: tuple of dictionaries with the 'task_id', 'operator', 'upstream' task ids and 'params'.
+    """
+    from helpers.sql_queries import SqlQueries
+    from helpers.star_schema import create_schema_sql
+
+    def pooled(query_group):
+        """ Every task querying Redshift takes a slot of the pool of its WLM query group, when one is given. """
+        return {'pool': pool_name(pool, query_group)} if pool else {}
+
+    if run_scoped_staging and spectrum_staging:
+        raise ValueError("run_scoped_staging and spectrum_staging can't be used together")
+    if incremental_staging and (spectrum_staging or not manifest_bucket):
+        raise ValueError("incremental_staging needs a manifest_bucket, and can't be used with spectrum_staging")
+
+    user_columns = ['userid', 'first_name', 'last_name', 'gender', 'level']
+    # the loaders read the staging tables of their run, or the external tables.
+    staging_tables = ['staging_events', 'staging_songs'] if run_scoped_staging or spectrum_staging else []
+    scoped = {'staging_tables': staging_tables} if staging_tables else {}
+    user_window = {}
+    if spectrum_staging:
+        spectrum = {'redshift_conn_id': redshift_conn_id,
+                    'external_schema': spectrum_schema,
+                    'external_database': spectrum_database,
+                    'iam_role': spectrum_iam_role}
+        scoped['staging_schema'] = spectrum_schema
+        # the users are merged from the events of the window, not from every partition.
+        user_window = {'window_start': '{{ execution_date }}', 'window_end': '{{ next_execution_date }}'}
+
+    # the deferrable loaders submit their statements with the AWS credentials, in the region of the cluster.
+    stage_operator, fact_operator, lookup_operator = 'StageToRedshiftOperator', 'LoadFactOperator', \
+        'LoadDimensionOperator'
+    data_api = {}
+    if deferrable:
+        stage_operator, fact_operator, lookup_operator = 'DeferrableStageToRedshiftOperator', \
+            'DeferrableLoadFactOperator', 'DeferrableLoadDimensionOperator'
+        data_api = {'aws_credentials_id': aws_credentials_id, 'region': region}
+
+    if time_dimension not in time_dimension_modes:
+        raise ValueError(f"Unsupported time dimension mode: {time_dimension}")
+    if calendar_grain != 'second':
+        raise ValueError(
+            f"Unsupported calendar grain: {calendar_grain}, the time rows must match every songplays start_time")
+    time_loads = {
+        'window': [{'table': 'time', 'append_data': 'False', 'sql': SqlQueries.time_table_insert,
+                    'window_start': '{{ execution_date }}', 'window_end': '{{ next_execution_date }}',
+                    'table_window_column': 'start_time'}],
+        'incremental': [{'table': 'time', 'append_data': True, 'sql': SqlQueries.time_table_insert_newer}],
+        # the calendar task covers the day of the run and the next one, most runs find it already covered.
+        'calendar': [],
+    }[time_dimension]
+    if spectrum_staging:
+        # the files are read in place: the loads only list the partitions of the run window, nothing is copied.
+        stage_tasks = (
+            task_spec('Stage_events', 'StageToSpectrumOperator', ['Create_tables'],
+                      table='staging_events',
+                      s3_bucket=s3_bucket,
+                      s3_key=events_key,
+                      use_partitioning=True,
+                      window_start='{{ execution_date }}',
+                      window_end='{{ next_execution_date }}',
+                      **spectrum,
+                      **pooled('copy')),
+
+            task_spec('Stage_songs', 'StageToSpectrumOperator', ['Create_tables'],
+                      table='staging_songs',
+                      s3_bucket=s3_bucket,
+                      s3_key=songs_key,
+                      **spectrum,
+                      **pooled('copy')),
+        )
+    else:
+        stage_tasks = (
+            task_spec('Stage_events', stage_operator, ['Create_tables'],
+                      table='staging_events',
+                      time_format='epochmillisecs',
+                      region=region,
+                      format_type=log_json_path,
+                      s3_bucket=s3_bucket,
+                      s3_key=events_key,
+                      use_partitioning=False,
+                      run_scoped=run_scoped_staging,
+                      incremental=incremental_staging,
+                      manifest_bucket=manifest_bucket,
+                      month_folders=True,
+                      watermark_namespace=tenant,
+                      execution_date='{{ execution_date }}',
+                      redshift_conn_id=redshift_conn_id,
+                      aws_credentials_id=aws_credentials_id,
+                      **pooled('copy')),
+
+            task_spec('Stage_songs', stage_operator, ['Create_tables'],
+                      table='staging_songs',
+                      time_format='epochmillisecs',
+                      region=region,
+                      format_type='auto',
+                      s3_bucket=s3_bucket,
+                      s3_key=songs_key,
+                      use_partitioning=False,
+                      run_scoped=run_scoped_staging,
+                      watermark_namespace=tenant,
+                      execution_date='{{ execution_date }}',
+                      redshift_conn_id=redshift_conn_id,
+                      aws_credentials_id=aws_credentials_id,
+                      **pooled('copy')),
+        )
+
+    spec = (
+        task_spec('Begin_execution', 'DummyOperator'),
+
+        # the tables are created with the distribution, sort keys and encodings of helpers.star_schema.
+        task_spec('Create_tables', 'PostgresOperator', ['Begin_execution'],
+                  postgres_conn_id=redshift_conn_id,
+                  sql=create_schema_sql(),
+                  **pooled('transform')),
+    ) + stage_tasks + (
+        # only the (title, artist, duration) keys not seen before are added, songplays joins on the key.
+        task_spec('Load_song_lookup_table', lookup_operator, ['Stage_songs'],
+                  redshift_conn_id=redshift_conn_id,
+                  **data_api,
+                  table='song_lookup',
+                  append_data=True,
+                  sql=SqlQueries.song_lookup_insert,
+                  **scoped,
+                  **pooled('transform')),
+
+        task_spec('Load_songplays_fact_table', fact_operator, ['Stage_events', 'Load_song_lookup_table'],
+                  redshift_conn_id=redshift_conn_id,
+                  **data_api,
+                  table='songplays',
+                  append_data='False',
+                  sql=SqlQueries.songplay_table_insert,
+                  merge_key='playid',
+                  select_sql=SqlQueries.songplay_table_select,
+                  window_start='{{ execution_date }}',
+                  window_end='{{ next_execution_date }}',
+                  **scoped,
+                  **pooled('transform')),
+
+        task_spec('Load_dimension_tables', 'LoadDimensionsOperator', ['Load_songplays_fact_table'],
+                  redshift_conn_id=redshift_conn_id,
+                  dimensions=[
+                      dict({'table': 'users', 'scd_type': 1, 'select_sql': SqlQueries.user_table_latest_select,
+                            'key_columns': ['userid'], 'columns': user_columns}, **user_window),
+                      dict({'table': 'users_history', 'scd_type': 2,
+                            'select_sql': SqlQueries.user_table_latest_select,
+                            'key_columns': ['userid'], 'columns': user_columns,
+                            'tracked_columns': ['level']}, **user_window),
+                      {'table': 'songs', 'append_data': 'False', 'sql': SqlQueries.song_table_insert},
+                      {'table': 'artists', 'append_data': 'False', 'sql': SqlQueries.artist_table_insert},
+                  ] + time_loads,
+                  **scoped,
+                  **pooled('transform')),
+
+        task_spec('Run_data_quality_checks', 'DataQualityOperator',
+                  ['Load_dimension_tables'] + (['Load_calendar'] if time_dimension == 'calendar' else []),
+                  redshift_conn_id=redshift_conn_id,
+                  stats_namespace=tenant,
+                  data_quality_checks=[
+                      {'check_sql_query': "SELECT COUNT(*) FROM users WHERE userid is null",
+                       'targeted_table': 'users', 'test_against': 'null', 'expected_result': 0},
+                      {'targeted_table': 'songplays', 'column': 'playid', 'test_against': 'unique'},
+                      {'targeted_table': 'songplays', 'column': 'start_time', 'test_against': 'not_null'},
+                      {'targeted_table': 'songplays', 'column': 'start_time', 'test_against': 'freshness',
+                       'max_age_hours': 24},
+                      {'targeted_table': 'songplays', 'column': 'userid', 'test_against': 'referential_integrity',
+                       'references': 'users.userid'},
+                      {'targeted_table': 'songplays', 'test_against': 'row_count_delta', 'min_value': 0},
+                      {'targeted_table': 'songs', 'column': 'songid', 'test_against': 'null'},
+                      {'targeted_table': 'artists', 'column': 'artistid', 'test_against': 'null'},
+                      {'targeted_table': 'time', 'column': 'start_time', 'test_against': 'null'}],
+                  **pooled('check')),
+
+        # the dashboard rollups are recomputed for the periods of the run window, once its data is checked.
+        task_spec('Load_rollups', 'LoadRollupsOperator', ['Run_data_quality_checks'],
+                  redshift_conn_id=redshift_conn_id,
+                  window_start='{{ execution_date }}',
+                  window_end='{{ next_execution_date }}',
+                  **pooled('transform')),
+
+        # vacuums run after the loads of the run, off-peak, and never two at a time.
+        task_spec('Run_table_maintenance', 'RedshiftMaintenanceOperator', ['Load_rollups'],
+                  redshift_conn_id=redshift_conn_id,
+                  maintenance_hours=[1, 2, 3, 4],
+                  task_concurrency=1,
+                  **pooled('maintenance')),
+    )
+    if time_dimension == 'calendar':
+        # the time rows of the run exist before the data quality checks.
+        spec += (
+            task_spec('Load_calendar', 'LoadCalendarOperator', ['Create_tables'],
+                      redshift_conn_id=redshift_conn_id,
+                      table='time',
+                      start_date='{{ ds }}',
+                      end_date='{{ macros.ds_add(next_ds, 1) }}',
+                      grain=calendar_grain,
+                      **pooled('transform')),
+        )
+    if run_scoped_staging:
+        # the staging tables of the run are released once every task writing or reading them is done, whether
+        # they succeeded or not: a failed upstream task must not release them under a load still reading them.
+        spec += (
+            task_spec('Release_staging_tables', 'ReleaseStagingTablesOperator',
+                      ['Stage_events', 'Stage_songs', 'Load_song_lookup_table', 'Load_songplays_fact_table',
+                       'Load_dimension_tables'],
+                      redshift_conn_id=redshift_conn_id,
+                      tables=staging_tables,
+                      mode=staging_release_mode,
+                      **pooled('copy')),
+        )
+
+    # the maintenance is skipped outside of its hours, the run still succeeds.
+    return spec + (
+        task_spec('Stop_execution', 'DummyOperator',
+                  ['Run_table_maintenance'] + (['Release_staging_tables'] if run_scoped_staging else []),
+                  trigger_rule='none_failed'),
+    )
+
+
+def build_dag(dag, spec):
+    """
+        Instantiate the tasks of a spec in a DAG and set their dependencies.
+
+        :param dag: the DAG the tasks are added to.
+        :type dag: airflow.models.DAG
+        :param spec: tasks returned by pipeline_spec.
+        :type spec: tuple
+
+        :return: dictionary of task id to task.
+    """
+    tasks = {}
+    for task in spec:
+        tasks[task['task_id']] = operator_class(task['operator'])(
+            task_id=task['task_id'], dag=dag, **task['params'])
+    # the upstream tasks of a task may come after it in the spec.
+    for task in spec:
+        for upstream in task['upstream']:
+            tasks[upstream] >> tasks[task['task_id']]
+    return tasks
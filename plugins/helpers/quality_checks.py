@@ -0,0 +1,214 @@
+from collections import OrderedDict
+
+# aggregate computed for every column metric, all the metrics of a table are read in a single scan.
+metric_aggregates = {
+    'null': "SUM(CASE WHEN {column} IS NULL THEN 1 ELSE 0 END)",
+    'distinct': "COUNT(DISTINCT {column})",
+    'min': "MIN({column})",
+    'max': "MAX({column})"
+}
+
+# column metrics each check type needs from the aggregate query.
+check_metrics = {
+    'null': ['null'],
+    'not_null': ['null'],
+    'distinct': ['distinct'],
+    'unique': ['distinct', 'null'],
+    'min': ['min'],
+    'max': ['max'],
+    'freshness': ['max']
+}
+
+# check types served by the Redshift system tables, without scanning the table.
+system_table_checks = ('row_count_range', 'row_count_delta')
+
+system_row_count_sql = """
+    SELECT "table", estimated_visible_rows
+    FROM svv_table_info
+    WHERE "schema" = 'public' AND "table" IN ({})
+"""
+
+referential_integrity_sql = """
+    SELECT COUNT(*)
+    FROM {table} child
+    LEFT JOIN {parent_table} parent
+    ON child.{column} = parent.{parent_column}
+    WHERE child.{column} IS NOT NULL AND parent.{parent_column} IS NULL
+"""
+
+
+def metric_name(test_against, column=None):
+    """ Name of the result column holding a metric in the compiled table query. """
+    return f"{test_against}_{column}" if column else test_against
+
+
+def group_checks(checks):
+    """
+        Group the data quality checks by their 'targeted_table'.
+
+        :return: ordered dictionary of table -> list of (index, check) tuples.
+    """
+    tables = OrderedDict()
+    for i, check in enumerate(checks):
+        tables.setdefault(check.get('targeted_table'), []).append((i, check))
+    return tables
+
+
+def is_metric_check(check):
+    """ True if the check is served by the compiled table query, False if it runs its own SQL. """
+    return 'check_sql_query' not in check and check.get('test_against') not in \
+        system_table_checks + ('referential_integrity',)
+
+
+def needs_scan(checks):
+    """ True if one of the checks of a table can't be served by the Redshift system tables. """
+    return any(is_metric_check(check) for _, check in checks)
+
+
+def compile_table_query(table, checks):
+    """
+        Compile the metric checks of a table into one aggregate query.
+
+        :param table: the targeted table.
+        :type table: string
+        :param checks: (index, check) tuples returned by group_checks.
+        :type checks: list
+
+        :return: the query and the metric names of its result columns.
+    """
+    metrics = OrderedDict([('row_count', "COUNT(*)")])
+    for index, check in checks:
+        if not is_metric_check(check) or check.get('test_against') == 'row_count':
+            continue
+        if check.get('test_against') not in check_metrics or not check.get('column'):
+            raise ValueError(
+                f"Data quality check {index} on {table} needs a 'column' and a 'test_against' "
+                f"among row_count, {', '.join(check_metrics)}")
+
+        for metric in check_metrics[check['test_against']]:
+            metrics[metric_name(metric, check['column'])] = \
+                metric_aggregates[metric].format(column=check['column'])
+
+    sql = "SELECT {} FROM {}".format(
+        ", ".join(f"{aggregate} AS {name}" for name, aggregate in metrics.items()), table)
+    return sql, list(metrics.keys())
+
+
+def system_row_counts(get_records, tables):
+    """ Estimated visible rows of the tables, read from SVV_TABLE_INFO instead of counting them. """
+    if not tables:
+        return {}
+    records = get_records(system_row_count_sql.format(
+        ", ".join(f"'{table}'" for table in tables)))
+    return {table: rows for table, rows in records}
+
+
+def evaluate(index, check, actual):
+    """
+        Compare the measured value of a check to its expectation.
+
+        A check either has an 'expected_result' or a 'min_value' and/or 'max_value' range
+        ('max_age_hours' for 'freshness'), 'null', 'not_null', 'unique' and 'referential_integrity'
+        checks expect 0 by default.
+
+        :return: the structured result of the check.
+    """
+    expected_result = check.get('expected_result')
+    if expected_result is None and \
+            check.get('test_against') in ('null', 'not_null', 'unique', 'referential_integrity') \
+            and 'min_value' not in check and 'max_value' not in check:
+        expected_result = 0
+    max_value = check.get('max_age_hours', check.get('max_value'))
+
+    if actual is None:
+        passed = False
+    elif expected_result is not None:
+        passed = actual == expected_result
+    else:
+        passed = (check.get('min_value') is None or actual >= check['min_value']) and \
+                 (max_value is None or actual <= max_value)
+
+    return {'check': index,
+            'targeted_table': check.get('targeted_table'),
+            'column': check.get('column'),
+            'test_against': check.get('test_against'),
+            'expected_result': expected_result,
+            'min_value': check.get('min_value'),
+            'max_value': max_value,
+            'actual': actual,
+            'passed': passed}
+
+
+def run_table_checks(get_records, table, checks, system_rows=None, previous_stats=None, reference_time=None):
+    """
+        Run all the checks of one table.
+
+        The metric checks share one aggregate query, the row count checks are served by SVV_TABLE_INFO,
+        the SQL and referential integrity checks run their own query.
+        Every table gets an implicit 'row_count' check: a table must contain records.
+
+        :param get_records: callable running a query and returning its records.
+        :param table: the targeted table.
+        :type table: string
+        :param checks: (index, check) tuples returned by group_checks.
+        :type checks: list
+        :param system_rows: estimated visible rows of the table, from system_row_counts.
+        :type system_rows: int
+        :param previous_stats: statistics of the table saved by the previous run.
+        :type previous_stats: dictionary
+        :param reference_time: naive UTC time the 'freshness' checks are measured against.
+        :type reference_time: datetime
+
+        :return: list of structured results, the implicit row count check first,
+                 and the statistics of the table to save for the next run.
+    """
+    metrics = {}
+    if needs_scan(checks):
+        sql, names = compile_table_query(table, checks)
+        records = get_records(sql)
+        metrics = dict(zip(names, records[0])) if records else {}
+    row_count = metrics.get('row_count', system_rows)
+
+    results = [evaluate(None,
+                        {'targeted_table': table, 'test_against': 'row_count', 'min_value': 1},
+                        row_count)]
+
+    for index, check in checks:
+        test_against = check.get('test_against')
+        column = check.get('column')
+
+        if 'check_sql_query' in check:
+            check_records = get_records(check['check_sql_query'])
+            actual = check_records[0][0] if check_records and check_records[0] else None
+        elif test_against == 'row_count_range':
+            actual = system_rows
+        elif test_against == 'row_count_delta':
+            previous_rows = (previous_stats or {}).get('row_count')
+            if previous_rows is None or system_rows is None:
+                # nothing to compare to on the first run.
+                results.append(dict(evaluate(index, check, 0), actual=None, passed=True))
+                continue
+            actual = system_rows - previous_rows
+        elif test_against == 'referential_integrity':
+            parent_table, parent_column = check['references'].split('.')
+            check_records = get_records(referential_integrity_sql.format(
+                table=table, column=column, parent_table=parent_table, parent_column=parent_column))
+            actual = check_records[0][0] if check_records else None
+        elif test_against == 'unique':
+            # COUNT(DISTINCT) ignores NULLs: duplicated values = non null values - distinct values.
+            actual = metrics['row_count'] - metrics[metric_name('null', column)] - \
+                metrics[metric_name('distinct', column)]
+        elif test_against == 'freshness':
+            latest = metrics.get(metric_name('max', column))
+            actual = None if latest is None or reference_time is None else \
+                (reference_time - latest).total_seconds() / 3600.0
+        elif test_against == 'not_null':
+            actual = metrics.get(metric_name('null', column))
+        else:
+            actual = metrics.get(metric_name(test_against, column))
+
+        results.append(evaluate(index, check, actual))
+
+    # the delta checks compare estimated row counts, keep the same measure from run to run.
+    stats = dict(metrics, row_count=system_rows if system_rows is not None else row_count)
+    return results, stats
@@ -0,0 +1,80 @@
+import re
+
+scan_bytes_sql = """
+    SELECT query, SUM(bytes)
+    FROM svl_query_summary
+    WHERE query IN %s AND label LIKE 'scan%%'
+    GROUP BY query
+"""
+
+# the time a query waited for a slot of its WLM queue, and ran in it, in microseconds.
+wlm_times_sql = """
+    SELECT query, SUM(total_queue_time), SUM(total_exec_time)
+    FROM stl_wlm_query
+    WHERE query IN %s
+    GROUP BY query
+"""
+
+
+def statement_label(sql):
+    """ Short label of a statement for logs and metric names, e.g. 'insert', 'copy', 'create_temp_table'. """
+    words = re.findall(r"[A-Za-z_]+", sql)[:3]
+    if not words:
+        return 'statement'
+    if words[0].upper() == 'CREATE' and len(words) > 2 and words[1].upper() in ('TEMP', 'TEMPORARY'):
+        return 'create_temp_table'
+    if words[0].upper() == 'CREATE' and len(words) > 1:
+        return f"create_{words[1].lower()}"
+    return words[0].lower()
+
+
+def publish_query_stats(context, query_stats, table="", log=None):
+    """
+        Export the statistics of the statements a task ran: as the 'query_stats' XCom and as StatsD metrics.
+
+        The metrics are named sparkify.<dag_id>.<task_id>.<table>.<statement>.{duration,rows,bytes_scanned}
+        so that they can be mapped to tagged OpenMetrics series by a statsd exporter. The WLM queue wait
+        and execution time of the statements are also summed per query group, as
+        sparkify.<dag_id>.<task_id>.wlm.<query_group>.{queue_wait,execution}, to size the queue slots.
+
+        :param context: the task context.
+        :type context: dictionary
+        :param query_stats: statement statistics collected by RedshiftSession or RedshiftConnectionPool.
+        :type query_stats: list
+        :param table: the table the task loads or checks, unless a statement has its own 'table'.
+        :type table: string
+        :param log: logger of the calling operator.
+    """
+    from airflow.stats import Stats
+
+    ti = context['ti']
+
+    wlm_times = {}
+    for stats in query_stats:
+        stats_table = stats.get('table') or table or 'all'
+        if log is not None:
+            log.info(
+                "Query {} ({}) on {}: {}s, {} rows, {} bytes scanned".format(
+                    stats['query_id'], stats['statement'], stats_table,
+                    stats['seconds'], stats['rowcount'], stats['bytes_scanned']))
+
+        metric = "sparkify.{}.{}.{}.{}".format(ti.dag_id, ti.task_id, stats_table, stats['statement'])
+        Stats.timing(f"{metric}.duration", stats['seconds'] * 1000.0)
+        if stats['rowcount'] is not None and stats['rowcount'] >= 0:
+            Stats.gauge(f"{metric}.rows", stats['rowcount'])
+        if stats.get('bytes_scanned') is not None:
+            Stats.gauge(f"{metric}.bytes_scanned", stats['bytes_scanned'])
+        if stats.get('queue_seconds') is not None:
+            Stats.timing(f"{metric}.queue_wait", stats['queue_seconds'] * 1000.0)
+            queue_seconds, exec_seconds = wlm_times.get(stats.get('query_group') or 'default', (0, 0))
+            wlm_times[stats.get('query_group') or 'default'] = (queue_seconds + stats['queue_seconds'],
+                                                                exec_seconds + stats['exec_seconds'])
+
+    for query_group, (queue_seconds, exec_seconds) in sorted(wlm_times.items()):
+        if log is not None:
+            log.info(f"WLM query group {query_group}: {queue_seconds:.3f}s queued, {exec_seconds:.3f}s executing")
+        metric = "sparkify.{}.{}.wlm.{}".format(ti.dag_id, ti.task_id, query_group)
+        Stats.timing(f"{metric}.queue_wait", queue_seconds * 1000.0)
+        Stats.timing(f"{metric}.execution", exec_seconds * 1000.0)
+
+    ti.xcom_push(key='query_stats', value=query_stats)
@@ -0,0 +1,108 @@
+""" Statements submitted through the Redshift Data API: run by Redshift while no worker waits on a connection """
+
+from contextlib import contextmanager
+
+from helpers.query_stats import statement_label
+
+# statuses of a statement described by the Data API once it stopped running.
+finished_statuses = ('FINISHED',)
+failed_statuses = ('FAILED', 'ABORTED')
+
+
+class StatementBatch:
+    """
+        StatementBatch records the statements a loader would run on a RedshiftSession, to submit them
+        in one batch_execute_statement call instead: the batch runs in a single transaction.
+
+        It has the run() and transaction() methods of RedshiftSession, so the statements are built
+        by the same code as the synchronous operators.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def run(self, sql, parameters=None):
+        """ Record a statement, or a list of statements. """
+        if parameters:
+            raise ValueError("The statements of a batch can't have parameters")
+        self.statements.extend([sql] if isinstance(sql, str) else sql)
+        return -1
+
+    @contextmanager
+    def transaction(self):
+        """ The whole batch runs in one transaction, the block only groups statements. """
+        yield self
+
+
+def data_api_target(redshift_conn_id):
+    """
+        Cluster, database and user of the Data API calls, read from the Redshift connection:
+        the cluster identifier is the first label of its host, unless the extras set 'cluster_identifier';
+        the extras may set 'secret_arn' (AWS Secrets Manager) instead of the connection login.
+
+        :return: the keyword arguments of batch_execute_statement identifying the target.
+    """
+    from airflow.hooks.base_hook import BaseHook
+
+    conn = BaseHook.get_connection(redshift_conn_id)
+    extras = conn.extra_dejson
+    target = {'ClusterIdentifier': extras.get('cluster_identifier') or conn.host.split('.')[0],
+              'Database': extras.get('database') or conn.schema}
+    if extras.get('secret_arn'):
+        target['SecretArn'] = extras['secret_arn']
+    else:
+        target['DbUser'] = extras.get('db_user') or conn.login
+    return target
+
+
+def data_api_client(aws_conn_id, region_name=None):
+    """ boto3 'redshift-data' client of an AWS connection. """
+    try:
+        from airflow.providers.amazon.aws.hooks.base_aws import AwsBaseHook
+    except ImportError:
+        from airflow.contrib.hooks.aws_hook import AwsHook as AwsBaseHook
+
+    return AwsBaseHook(aws_conn_id).get_client_type('redshift-data', region_name=region_name)
+
+
+def submit_batch(client, target, statements, query_group=None):
+    """
+        Submit statements to run in one transaction, routed to a WLM query group.
+
+        :return: the id of the batch statement, polled with describe_statement.
+    """
+    if not statements:
+        raise ValueError("A batch needs at least one statement")
+    if query_group:
+        statements = [f"SET query_group TO '{query_group}'"] + list(statements)
+    return client.batch_execute_statement(Sqls=list(statements), **target)['Id']
+
+
+def batch_error(description):
+    """ Error message of a failed batch, with the failing statement, or None if it didn't fail. """
+    if description['Status'] not in failed_statuses:
+        return None
+    for sub_statement in description.get('SubStatements', []):
+        if sub_statement.get('Error'):
+            return "{} failed: {}".format(statement_label(sub_statement['QueryString']), sub_statement['Error'])
+    return description.get('Error') or f"The batch was {description['Status'].lower()}"
+
+
+def batch_query_stats(description, query_group=None):
+    """
+        Statistics of the statements of a described batch, in the format of RedshiftSession.query_stats
+        (the SET query_group statement is skipped). The Data API reports durations in nanoseconds.
+    """
+    query_stats = []
+    for sub_statement in description.get('SubStatements', []):
+        if sub_statement['QueryString'].lstrip().upper().startswith('SET QUERY_GROUP'):
+            continue
+        query_stats.append({'statement': statement_label(sub_statement['QueryString']),
+                            'query_group': query_group,
+                            'seconds': round(sub_statement.get('Duration', 0) / 1000000000.0, 3),
+                            'rowcount': sub_statement.get('ResultRows', -1),
+                            'query_id': sub_statement.get('RedshiftQueryId'),
+                            'bytes_scanned': None,
+                            'queue_seconds': None,
+                            'exec_seconds': None})
+    return query_stats
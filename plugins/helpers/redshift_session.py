@@ -0,0 +1,256 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from helpers.query_stats import statement_label, scan_bytes_sql, wlm_times_sql
+
+# concurrent statements per WLM query group in a task process, the other groups are not limited.
+# Each task runs in its own process: the concurrency across tasks is limited by the Airflow pools of the groups.
+query_group_slots = {
+    'copy': 2,
+    'transform': 3,
+    'check': 2,
+    'maintenance': 1,
+}
+
+_query_group_semaphores = {}
+_query_group_lock = threading.Lock()
+
+
+def query_group_semaphore(query_group):
+    """
+        The semaphore bounding the concurrent statements of a query group in this process, or None.
+
+        It only throttles the threads of one task (e.g. the concurrent data quality checks): tasks run in
+        separate processes, two tasks never share it. Their concurrency is bounded by the per query group pools.
+    """
+    if query_group not in query_group_slots:
+        return None
+    with _query_group_lock:
+        if query_group not in _query_group_semaphores:
+            _query_group_semaphores[query_group] = threading.BoundedSemaphore(query_group_slots[query_group])
+        return _query_group_semaphores[query_group]
+
+
+class RedshiftSession:
+    """
+        RedshiftSession reuses a single Redshift connection for every statement of a task.
+
+        Statements autocommit, unless they run inside `transaction()`, e.g. clearing a table and loading it.
+        The duration, row count and Redshift query id of every statement are collected in `query_stats`.
+
+        The statements are routed to the WLM queue of `query_group` ('copy', 'transform', 'check' or
+        'maintenance'), and at most `query_group_slots` of them run at the same time in the process. The slots only
+        throttle the threads of a task, the concurrent tasks are bounded by the Airflow pools of the query groups.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+
+        :param query_group: WLM query group of the statements of the session.
+        :type query_group: string
+
+        :param track_query_ids: if True, the query id of every statement is read with pg_last_query_id().
+        :type track_query_ids: boolean
+            Default is 'True'
+    """
+
+    query_group_sql = "SET query_group TO %s"
+
+    def __init__(self, redshift_conn_id, query_group=None, track_query_ids=True):
+        self.redshift_conn_id = redshift_conn_id
+        self.query_group = query_group
+        self.track_query_ids = track_query_ids
+        # imported on use, parsing a DAG doesn't load psycopg2.
+        from airflow.hooks.postgres_hook import PostgresHook
+
+        self.hook = PostgresHook(postgres_conn_id=redshift_conn_id)
+        self.query_stats = []
+        self._conn = None
+        self._in_transaction = False
+
+    @property
+    def conn(self):
+        """ The connection of the session, opened on first use. """
+        if self._conn is None or self._conn.closed:
+            self._conn = self.hook.get_conn()
+            self._conn.autocommit = True
+            if self.query_group:
+                with self._conn.cursor() as cursor:
+                    cursor.execute(self.query_group_sql, (self.query_group,))
+        return self._conn
+
+    def _execute(self, sql, parameters=None, fetch=None):
+        """ Execute one statement, fetch its records ('all' or 'one') and record its statistics. """
+        semaphore = query_group_semaphore(self.query_group)
+        with self.conn.cursor() as cursor:
+            if semaphore is not None:
+                semaphore.acquire()
+            try:
+                started = time.monotonic()
+                cursor.execute(sql, parameters)
+                records = cursor.fetchall() if fetch == 'all' else cursor.fetchone() if fetch == 'one' else None
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+
+            stats = {'statement': statement_label(sql),
+                     'query_group': self.query_group,
+                     'seconds': round(time.monotonic() - started, 3),
+                     'rowcount': cursor.rowcount,
+                     'query_id': None,
+                     'bytes_scanned': None,
+                     'queue_seconds': None,
+                     'exec_seconds': None}
+
+            if self.track_query_ids:
+                cursor.execute("SELECT pg_last_query_id()")
+                stats['query_id'] = cursor.fetchone()[0]
+
+        self.query_stats.append(stats)
+        return stats['rowcount'] if fetch is None else records
+
+    def run(self, sql, parameters=None):
+        """
+            Execute a statement, or a list of statements, on the session connection.
+
+            :return: the row count of the last statement.
+        """
+        statements = [sql] if isinstance(sql, str) else sql
+        rowcount = -1
+        for statement in statements:
+            rowcount = self._execute(statement, parameters)
+        return rowcount
+
+    def get_records(self, sql, parameters=None):
+        """ Execute a query and return all its records. """
+        return self._execute(sql, parameters, fetch='all')
+
+    def get_first(self, sql, parameters=None):
+        """ Execute a query and return its first record. """
+        return self._execute(sql, parameters, fetch='one')
+
+    def collect_system_stats(self):
+        """
+            Fill the bytes scanned (SVL_QUERY_SUMMARY) and the WLM queue wait and execution time (STL_WLM_QUERY)
+            of the recorded statements, one query each.
+        """
+        query_ids = tuple(stats['query_id'] for stats in self.query_stats
+                          if stats['query_id'] is not None and stats['query_id'] >= 0)
+        if not query_ids:
+            return self.query_stats
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(scan_bytes_sql, (query_ids,))
+            scanned = dict(cursor.fetchall())
+            cursor.execute(wlm_times_sql, (query_ids,))
+            wlm_times = {query_id: (queue_time, exec_time) for query_id, queue_time, exec_time in cursor.fetchall()}
+
+        for stats in self.query_stats:
+            if stats['query_id'] in scanned:
+                stats['bytes_scanned'] = int(scanned[stats['query_id']])
+            if stats['query_id'] in wlm_times:
+                # STL_WLM_QUERY times are in microseconds.
+                queue_time, exec_time = wlm_times[stats['query_id']]
+                stats['queue_seconds'] = round(queue_time / 1000000.0, 3)
+                stats['exec_seconds'] = round(exec_time / 1000000.0, 3)
+        return self.query_stats
+
+    @contextmanager
+    def transaction(self):
+        """ Run the statements of the block in one transaction, committed at the end or rolled back on error. """
+        if self._in_transaction:
+            yield self
+            return
+
+        conn = self.conn
+        conn.autocommit = False
+        self._in_transaction = True
+        try:
+            yield self
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._in_transaction = False
+            conn.autocommit = True
+
+    def close(self):
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RedshiftConnectionPool:
+    """
+        RedshiftConnectionPool hands out at most `max_size` RedshiftSession at a time, for parallelism inside a task.
+
+        Sessions are opened lazily and reused by the next caller once released.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+
+        :param max_size: maximum number of connections open at the same time.
+        :type max_size: int
+            Default is 4
+
+        :param query_group: WLM query group of the statements of the sessions.
+        :type query_group: string
+    """
+
+    def __init__(self, redshift_conn_id, max_size=4, query_group=None):
+        self.redshift_conn_id = redshift_conn_id
+        self.query_group = query_group
+        self.max_size = max(max_size, 1)
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        """ Borrow a session, blocks while `max_size` sessions are in use. """
+        with self._slots:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = RedshiftSession(self.redshift_conn_id, query_group=self.query_group)
+                with self._lock:
+                    self._sessions.append(session)
+            try:
+                yield session
+            finally:
+                self._idle.put(session)
+
+    @property
+    def query_stats(self):
+        """ Statement statistics of every session of the pool. """
+        with self._lock:
+            return [stats for session in self._sessions for stats in session.query_stats]
+
+    def collect_system_stats(self):
+        """ Fill the bytes scanned and WLM times of the statements of every session of the pool. """
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.collect_system_stats()
+        return self.query_stats
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
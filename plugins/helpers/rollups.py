@@ -0,0 +1,103 @@
+""" Rollups of songplays for the dashboards: plays per period, maintained from the windows the runs load """
+
+from datetime import timedelta
+
+from helpers.star_schema import star_schema, quote
+
+# every rollup: its period column, the grain the play start times are truncated to, and its grouping columns.
+rollups = {
+    'plays_hourly_by_level': {'period': 'play_hour', 'grain': 'hour', 'dimensions': ['level']},
+    'plays_hourly_by_location': {'period': 'play_hour', 'grain': 'hour', 'dimensions': ['location']},
+    'plays_daily_by_song': {'period': 'play_date', 'grain': 'day', 'dimensions': ['songid', 'artistid']},
+    'plays_daily_by_artist': {'period': 'play_date', 'grain': 'day', 'dimensions': ['artistid']},
+}
+
+# period of a play start time, and the literal of a period bound.
+period_expressions = {
+    'hour': ("DATE_TRUNC('hour', start_time)", '%Y-%m-%d %H:%M:%S'),
+    'day': ("CAST(DATE_TRUNC('day', start_time) AS date)", '%Y-%m-%d'),
+}
+
+
+def rollup_definition(rollup):
+    """ The definition of a rollup, checked against its star schema table. """
+    if rollup not in rollups or rollup not in star_schema:
+        raise ValueError(f"Unknown rollup: {rollup}")
+    return rollups[rollup]
+
+
+def rollup_periods(window, grain):
+    """
+        The [start, end) range of the periods a time window overlaps: its start truncated to the grain,
+        its end rounded up to the next period.
+    """
+    start, end = window
+    if grain == 'hour':
+        floor = start.replace(minute=0, second=0, microsecond=0)
+        ceiling = end.replace(minute=0, second=0, microsecond=0)
+        step = timedelta(hours=1)
+    elif grain == 'day':
+        floor = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        ceiling = end.replace(hour=0, minute=0, second=0, microsecond=0)
+        step = timedelta(days=1)
+    else:
+        raise ValueError(f"Unsupported rollup grain: {grain}")
+    return floor, ceiling if ceiling == end else ceiling + step
+
+
+def _bounds(rollup, window):
+    """ The period range of a rollup covering a window, as SQL literals, None without a window. """
+    if window is None:
+        return None
+    grain = rollup_definition(rollup)['grain']
+    period_format = period_expressions[grain][1]
+    return tuple(bound.strftime(period_format) for bound in rollup_periods(window, grain))
+
+
+def rollup_refresh_sql(rollup, window=None):
+    """
+        Statements recomputing the periods of a rollup overlapped by a time window from songplays,
+        every period without a window (full rebuild). Run them in one transaction.
+
+        Only the songplays of the covered periods are read, a range of the start_time sort key: for an hourly
+        rollup and an hourly run, exactly the rows the fact load wrote in the window. The periods are
+        recomputed rather than incremented, so a retried run or a reloaded window never counts a play twice.
+    """
+    definition = rollup_definition(rollup)
+    period_expression = period_expressions[definition['grain']][0]
+    dimensions = ", ".join(quote(column) for column in definition['dimensions'])
+    group_by = ", ".join(str(position) for position in range(1, len(definition['dimensions']) + 2))
+
+    bounds = _bounds(rollup, window)
+    if bounds is None:
+        delete_sql, source_filter = f"DELETE FROM {rollup}", ""
+    else:
+        delete_sql = "DELETE FROM {} WHERE {} >= '{}' AND {} < '{}'".format(
+            rollup, definition['period'], bounds[0], definition['period'], bounds[1])
+        source_filter = "\n        WHERE start_time >= '{}' AND start_time < '{}'".format(*bounds)
+
+    return [delete_sql, """
+        INSERT INTO {} ({}, {}, plays)
+        SELECT {}, {}, COUNT(*)
+        FROM songplays{}
+        GROUP BY {}
+    """.format(rollup, definition['period'], dimensions, period_expression, dimensions, source_filter, group_by)]
+
+
+def rollup_consistency_sql(rollup, window=None):
+    """
+        Query counting the songplays of the periods of a rollup overlapped by a window (every period without one)
+        and the plays the rollup holds for them: both counts are equal when the rollup is consistent.
+    """
+    definition = rollup_definition(rollup)
+    bounds = _bounds(rollup, window)
+    source_filter = rollup_filter = ""
+    if bounds is not None:
+        source_filter = " WHERE start_time >= '{}' AND start_time < '{}'".format(*bounds)
+        rollup_filter = " WHERE {} >= '{}' AND {} < '{}'".format(
+            definition['period'], bounds[0], definition['period'], bounds[1])
+
+    return """
+        SELECT (SELECT COUNT(*) FROM songplays{}),
+               (SELECT COALESCE(SUM(plays), 0) FROM {}{})
+    """.format(source_filter, rollup, rollup_filter)
@@ -0,0 +1,91 @@
+""" Run-scoped staging tables: every DAG run stages into, and loads from, its own copy of the staging tables """
+
+import re
+from datetime import datetime
+
+from helpers.spectrum import external_sql
+
+# how a run-scoped table is released when the run ends:
+# - 'drop': the table is dropped.
+# - 'append': its rows are moved into the shared table with ALTER TABLE APPEND (no copy, no ghost rows).
+# - 'swap': it replaces the shared table, renamed in one transaction.
+release_modes = ('drop', 'append', 'swap')
+
+run_tables_sql = """
+    SELECT tablename
+    FROM pg_tables
+    WHERE schemaname = 'public' AND tablename LIKE %s
+"""
+
+
+def run_table_name(table, ts_nodash):
+    """ Name of the copy of a table scoped to a DAG run, e.g. staging_events_20200510t000000. """
+    return "{}_{}".format(table, ts_nodash.lower())
+
+
+def run_table_date(table, name):
+    """ Execution date of a run-scoped copy of a table, None if `name` is not one. """
+    match = re.match(r"^{}_(\d{{8}}t\d{{6}})$".format(re.escape(table)), name)
+    return datetime.strptime(match.group(1), '%Y%m%dt%H%M%S') if match else None
+
+
+def create_run_table_sql(table, run_table):
+    """
+        Statements (re)creating the empty run-scoped copy of a table. LIKE keeps the distribution style,
+        sort key and encodings of the shared table; a retried task starts again from an empty table.
+    """
+    return [f"DROP TABLE IF EXISTS {run_table}",
+            f"CREATE TABLE {run_table} (LIKE {table})"]
+
+
+def scope_sql(sql, tables, ts_nodash, external_schema=""):
+    """
+        Replace the given tables by their run-scoped copies in a statement, or a list of statements;
+        by their Spectrum external tables when an external schema is given.
+
+        :param sql: the statement(s) reading the shared tables.
+        :type sql: string or list
+        :param tables: the tables read through their run-scoped copy, e.g. ['staging_events'].
+        :type tables: list
+        :param ts_nodash: the ts_nodash of the run.
+        :type ts_nodash: string
+        :param external_schema: external schema of the tables staged by StageToSpectrumOperator.
+        :type external_schema: string
+    """
+    if external_schema:
+        return external_sql(sql, tables, external_schema)
+    if not tables or not sql:
+        return sql
+    if not isinstance(sql, str):
+        return type(sql)(scope_sql(statement, tables, ts_nodash) for statement in sql)
+
+    for table in tables:
+        sql = re.sub(r"\b{}\b".format(re.escape(table)), run_table_name(table, ts_nodash), sql)
+    return sql
+
+
+def release_run_table_sql(table, run_table, mode='drop'):
+    """
+        Statements releasing the run-scoped copy of a table, see release_modes.
+
+        :return: list of (statements, in_transaction) pairs: ALTER TABLE APPEND can't run in a transaction block.
+    """
+    if mode not in release_modes:
+        raise ValueError(f"Unsupported release mode: {mode}")
+
+    if mode == 'append':
+        return [([f"ALTER TABLE {table} APPEND FROM {run_table}"], False),
+                ([f"DROP TABLE {run_table}"], False)]
+    if mode == 'swap':
+        # readers of the shared table see the old rows until the commit, then the rows of the run.
+        replaced = f"{run_table}_replaced"
+        return [([f"ALTER TABLE {table} RENAME TO {replaced}",
+                  f"ALTER TABLE {run_table} RENAME TO {table}",
+                  f"DROP TABLE {replaced}"], True)]
+    return [([f"DROP TABLE IF EXISTS {run_table}"], False)]
+
+
+def stale_run_tables(table, names, before):
+    """ The run-scoped copies of a table, among `names`, of the runs before `before`: left over by crashed runs. """
+    return sorted(name for name in names
+                  if run_table_date(table, name) is not None and run_table_date(table, name) < before)
@@ -0,0 +1,299 @@
+import gzip
+import heapq
+import json
+import math
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from airflow.models import Variable
+
+# how far before the high-water mark the objects are listed again: the LastModified of a multipart upload is
+# the time it started, an object whose upload started before the last run but completed after it is only
+# listed by the next run, with a LastModified older than the watermark. It must exceed the longest upload.
+default_watermark_lookback = timedelta(hours=1)
+
+
+def watermark_variable_key(table, namespace=""):
+    """
+        Name of the Airflow Variable holding the staging high-water mark of `table`,
+        e.g. udacity.staging_events_staging_watermark for the tenant 'udacity'.
+    """
+    return f"{namespace}.{table}_staging_watermark" if namespace else f"{table}_staging_watermark"
+
+
+def load_watermark(table, namespace=""):
+    """
+        Read the staging high-water mark of a table.
+
+        :param table: Redshift staging table name.
+        :type table: string
+        :param namespace: the tenant the watermark belongs to, tenants staging the same table
+                          from different S3 sources keep their own watermark.
+        :type namespace: string
+
+        :return: dictionary with 'last_modified' (datetime) and 'key' of the last staged object, and the
+                 'staged_keys' ({key: last_modified}) staged within the lookback before it,
+                 or None when the table was never staged incrementally.
+    """
+    watermark = Variable.get(watermark_variable_key(table, namespace),
+                             default_var=None, deserialize_json=True)
+    if not watermark:
+        return None
+    return deserialize_watermark(watermark)
+
+
+def save_watermark(table, watermark, namespace=""):
+    """ Persist the high-water mark returned by next_watermark as the new one of `table`. """
+    Variable.set(watermark_variable_key(table, namespace), serialize_watermark(watermark), serialize_json=True)
+
+
+def serialize_watermark(watermark):
+    """ JSON serializable copy of a high-water mark, its datetimes in ISO format. """
+    serialized = {'last_modified': watermark['last_modified'].isoformat(), 'key': watermark['key']}
+    if watermark.get('staged_keys') is not None:
+        serialized['staged_keys'] = {key: last_modified.isoformat()
+                                     for key, last_modified in watermark['staged_keys'].items()}
+    return serialized
+
+
+def deserialize_watermark(watermark):
+    """ High-water mark of its serialize_watermark copy. The watermarks saved before 'staged_keys' have none. """
+    deserialized = {'last_modified': datetime.fromisoformat(watermark['last_modified']), 'key': watermark['key']}
+    if watermark.get('staged_keys') is not None:
+        deserialized['staged_keys'] = {key: datetime.fromisoformat(last_modified)
+                                       for key, last_modified in watermark['staged_keys'].items()}
+    return deserialized
+
+
+def next_watermark(staged_objects, watermark=None, lookback=default_watermark_lookback):
+    """
+        The high-water mark after staging objects: the last of them, and every key staged within
+        `lookback` before it, which the next listings skip.
+
+        :param staged_objects: the objects returned by list_new_objects, in order.
+        :type staged_objects: list
+        :param watermark: the high-water mark the objects were listed after, its staged keys are carried over.
+        :type watermark: dictionary
+    """
+    last_object = staged_objects[-1]
+    staged_keys = dict((watermark or {}).get('staged_keys') or {})
+    staged_keys.update((obj['key'], obj['last_modified']) for obj in staged_objects)
+    cutoff = last_object['last_modified'] - lookback
+    return {'last_modified': last_object['last_modified'],
+            'key': last_object['key'],
+            'staged_keys': {key: last_modified for key, last_modified in staged_keys.items()
+                            if last_modified >= cutoff}}
+
+
+def month_prefixes(prefix, start, end):
+    """ The <prefix>/<year>/<month>/ folders (the use_partitioning layout) of the months from start to end. """
+    from helpers.time_window import window_months
+
+    # the end month is listed as well.
+    return ["{}/{}/{}/".format(prefix.rstrip('/'), year, month)
+            for year, month in window_months((start, end + timedelta(microseconds=1)))]
+
+
+def list_new_objects(s3_hook, bucket, prefix, watermark=None, lookback=default_watermark_lookback,
+                     month_folders=False):
+    """
+        List the objects under an S3 prefix that were not staged yet.
+
+        The objects are listed from `lookback` before the high-water mark, and the keys it staged are skipped:
+        an object listed late, with a LastModified older than the watermark, is still staged once.
+        Objects are ordered by (last_modified, key), so the last element is the next watermark.
+
+        :param s3_hook: S3Hook used to access the bucket.
+        :param bucket: Amazon S3 Bucket name.
+        :type bucket: string
+        :param prefix: key prefix to scan.
+        :type prefix: string
+        :param watermark: high-water mark returned by load_watermark, None lists every object.
+        :type watermark: dictionary
+        :param lookback: how far before the watermark the objects are listed again.
+        :type lookback: timedelta
+        :param month_folders: if true, the objects are in <prefix>/<year>/<month>/ folders written during their
+                              month (e.g. log_data), and only the folders of the months from `lookback` before
+                              the watermark to now are listed, not the whole history of the prefix.
+        :type month_folders: boolean
+
+        :return: list of dictionaries with 'key', 'last_modified' and 'size' of each object.
+    """
+    prefixes = [prefix]
+    if month_folders and watermark is not None:
+        prefixes = month_prefixes(prefix, watermark['last_modified'] - lookback,
+                                  max(datetime.now(timezone.utc), watermark['last_modified']))
+
+    bucket_objects = s3_hook.get_bucket(bucket).objects
+    new_objects = []
+    for s3_object in (s3_object for listed_prefix in prefixes
+                      for s3_object in bucket_objects.filter(Prefix=listed_prefix)):
+        # skip the "folder" placeholders some S3 clients create.
+        if s3_object.key.endswith('/'):
+            continue
+
+        if watermark is not None:
+            if watermark.get('staged_keys') is None:
+                # a watermark saved before the staged keys: only the objects after it are new.
+                if (s3_object.last_modified, s3_object.key) <= (watermark['last_modified'], watermark['key']):
+                    continue
+            elif s3_object.last_modified < watermark['last_modified'] - lookback or \
+                    s3_object.key in watermark['staged_keys']:
+                continue
+
+        new_objects.append({'key': s3_object.key,
+                            'last_modified': s3_object.last_modified,
+                            'size': s3_object.size})
+
+    return sorted(new_objects, key=lambda obj: (obj['last_modified'], obj['key']))
+
+
+def balance_objects(objects, num_groups):
+    """
+        Split S3 objects into `num_groups` groups holding a similar number of bytes.
+
+        Objects are placed largest first on the group with the fewest bytes so far,
+        which keeps the groups within one object size of each other.
+
+        :param objects: objects as returned by list_new_objects.
+        :type objects: list
+        :param num_groups: number of groups, e.g. the number of slices of the cluster.
+        :type num_groups: int
+
+        :return: list of `num_groups` lists of objects.
+    """
+    groups = [[] for _ in range(max(num_groups, 1))]
+    heap = [(0, i) for i in range(len(groups))]
+
+    for obj in sorted(objects, key=lambda obj: obj['size'], reverse=True):
+        group_bytes, i = heapq.heappop(heap)
+        groups[i].append(obj)
+        heapq.heappush(heap, (group_bytes + obj['size'], i))
+
+    return groups
+
+
+def slice_metrics(groups):
+    """ File count and byte count of every group returned by balance_objects. """
+    return [{'slice': i,
+             'files': len(group),
+             'bytes': sum(obj['size'] for obj in group)}
+            for i, group in enumerate(groups)]
+
+
+def skip_lines(body, lines, chunk_size=65536):
+    """
+        Read past the first `lines` lines of a stream, e.g. the CSV header of an object.
+
+        :return: the bytes read after the skipped lines.
+    """
+    remainder = b''
+    while lines > 0:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            return b''
+        remainder += chunk
+        while lines > 0 and b'\n' in remainder:
+            remainder = remainder.split(b'\n', 1)[1]
+            lines -= 1
+    return remainder
+
+
+def coalesce_objects(s3_hook, bucket, objects, num_slices, max_batch_bytes,
+                     target_bucket, target_prefix, header_lines=0, data_format='json', chunk_size=65536):
+    """
+        Coalesce many small S3 objects into a few gzip'd batch objects before a COPY.
+
+        The number of batches is a multiple of `num_slices` and every batch holds a similar
+        number of bytes, so that each slice loads the same amount of data. Objects are streamed
+        one by one into the batch file, a whole object is never held in memory.
+
+        :param s3_hook: S3Hook used to access the buckets.
+        :param bucket: Amazon S3 Bucket name the objects belong to.
+        :type bucket: string
+        :param objects: objects as returned by list_new_objects.
+        :type objects: list
+        :param num_slices: number of slices of the Redshift cluster.
+        :type num_slices: int
+        :param max_batch_bytes: upper bound of uncompressed bytes per batch.
+        :type max_batch_bytes: int
+        :param target_bucket: Amazon S3 Bucket name where the batches are written.
+        :type target_bucket: string
+        :param target_prefix: key folder inside target_bucket where the batches are written.
+        :type target_prefix: string
+        :param header_lines: number of header lines of every object (CSV IGNOREHEADER). Only the header of the
+                             first object of a batch is kept, COPY skips it once per batch file.
+        :type header_lines: int
+        :param data_format: format of the objects, 'json' or 'csv', the extension of the batches.
+        :type data_format: string
+            Default is 'json'
+
+        :return: the batch objects, with the same fields as list_new_objects plus their 'bucket'.
+    """
+    total_bytes = sum(obj['size'] for obj in objects)
+    num_slices = max(num_slices, 1)
+    num_batches = num_slices * \
+        max(math.ceil(total_bytes / float(num_slices * max_batch_bytes)), 1)
+
+    batches = []
+    for i, group in enumerate(balance_objects(objects, num_batches)):
+        if not group:
+            continue
+
+        extension = ".{}.gz".format(data_format)
+        batch_key = "{}/batch_{:05d}{}".format(target_prefix, i, extension)
+        with tempfile.NamedTemporaryFile(suffix=extension) as batch_file:
+            with gzip.open(batch_file, 'wb') as gzip_file:
+                last_byte = b'\n'
+                for position, obj in enumerate(group):
+                    body = s3_hook.get_key(obj['key'], bucket_name=bucket).get()['Body']
+                    # the headers of the next objects would be loaded as data rows.
+                    chunk = skip_lines(body, header_lines, chunk_size) if header_lines and position > 0 else b''
+                    while True:
+                        if chunk:
+                            gzip_file.write(chunk)
+                            last_byte = chunk[-1:]
+                        chunk = body.read(chunk_size)
+                        if not chunk:
+                            break
+                    # an object not ending with a newline would run into the next one; a blank line is a
+                    # CSV row missing its delimiters, the separator is only written when needed.
+                    if last_byte != b'\n':
+                        gzip_file.write(b'\n')
+                        last_byte = b'\n'
+            batch_file.flush()
+
+            s3_hook.load_file(batch_file.name, key=batch_key,
+                              bucket_name=target_bucket, replace=True)
+            batches.append({'bucket': target_bucket,
+                            'key': batch_key,
+                            'last_modified': max(obj['last_modified'] for obj in group),
+                            'size': os.path.getsize(batch_file.name)})
+
+    return batches
+
+
+def build_manifest(bucket, objects):
+    """
+        Build a Redshift COPY manifest listing the given S3 objects.
+
+        :param bucket: Amazon S3 Bucket name the objects belong to, unless an object has its own 'bucket'.
+        :type bucket: string
+        :param objects: objects as returned by list_new_objects.
+        :type objects: list
+
+        :return: the manifest as a JSON string.
+    """
+    return json.dumps({
+        'entries': [{'url': f"s3://{obj.get('bucket', bucket)}/{obj['key']}",
+                     'mandatory': True,
+                     'meta': {'content_length': obj['size']}}
+                    for obj in objects]
+    })
+
+
+def upload_manifest(s3_hook, manifest, bucket, key):
+    """ Upload a manifest to S3 and return its s3:// url for the COPY command. """
+    s3_hook.load_string(manifest, key=key, bucket_name=bucket, replace=True)
+    return f"s3://{bucket}/{key}"
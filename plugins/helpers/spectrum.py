@@ -0,0 +1,102 @@
+""" Redshift Spectrum external tables over the staging data in S3, read in place by the loads instead of copied """
+
+import re
+
+from helpers.star_schema import table_columns, quote
+
+# partition columns of the partitioned external tables: the year/month folders of the S3 prefix.
+partition_columns = [('part_year', 'int'), ('part_month', 'int')]
+
+# window placeholder of the statements reading a table, followed by the partitions covering the window.
+partition_placeholders = {
+    'staging_events': ('{events_window}', '{events_partitions}'),
+}
+
+external_types = {'int2': 'smallint', 'int4': 'int', 'int8': 'bigint'}
+
+external_tables_sql = """
+    SELECT tablename
+    FROM svv_external_tables
+    WHERE schemaname = %s
+"""
+
+
+def external_type(column_type):
+    """ Spectrum type of a star schema column type, e.g. int8 -> bigint, numeric(18,0) -> decimal(18,0). """
+    if column_type.startswith('numeric'):
+        return 'decimal' + column_type[len('numeric'):]
+    return external_types.get(column_type, column_type)
+
+
+def external_schema_sql(schema, database, iam_role):
+    """ CREATE EXTERNAL SCHEMA statement of a schema of the AWS Glue data catalog. """
+    return """
+        CREATE EXTERNAL SCHEMA IF NOT EXISTS {}
+        FROM DATA CATALOG DATABASE '{}'
+        IAM_ROLE '{}'
+        CREATE EXTERNAL DATABASE IF NOT EXISTS
+    """.format(schema, database, iam_role)
+
+
+def external_table_sql(table, schema, location, partitioned=False):
+    """
+        CREATE EXTERNAL TABLE statement reading the JSON files of an S3 prefix with the columns of a staging table.
+
+        The JSON keys are matched to the columns case insensitively (e.g. sessionId -> sessionid).
+
+        :param table: the staging table of the star schema the external table mirrors.
+        :type table: string
+        :param schema: the external schema.
+        :type schema: string
+        :param location: s3:// prefix of the files.
+        :type location: string
+        :param partitioned: if true, the table is partitioned on the year/month folders of the prefix,
+                            registered with add_partition_sql.
+        :type partitioned: boolean
+    """
+    columns = ",\n            ".join(f"{quote(column)} {external_type(column_type)}"
+                                    for column, column_type in table_columns(table))
+    partitions = "\n        PARTITIONED BY ({})".format(
+        ", ".join(f"{column} {column_type}" for column, column_type in partition_columns)) if partitioned else ""
+    return """
+        CREATE EXTERNAL TABLE {}.{} (
+            {}
+        ){}
+        ROW FORMAT SERDE 'org.openx.data.jsonserde.JsonSerDe'
+        WITH SERDEPROPERTIES ('ignore.malformed.json' = 'true')
+        STORED AS TEXTFILE
+        LOCATION '{}'
+    """.format(schema, table, columns, partitions, location)
+
+
+def partition_location(location, year, month):
+    """ s3:// prefix of the files of a month, in the <prefix>/<year>/<month> layout of use_partitioning. """
+    return "{}/{}/{}/".format(location.rstrip('/'), year, month)
+
+
+def add_partition_sql(table, schema, location, year, month):
+    """ Statement registering the folder of a month as a partition of an external table, if it isn't yet. """
+    return "ALTER TABLE {}.{} ADD IF NOT EXISTS PARTITION (part_year={}, part_month={}) LOCATION '{}'".format(
+        schema, table, year, month, partition_location(location, year, month))
+
+
+def external_sql(sql, tables, schema):
+    """
+        Read the given staging tables from their external tables in `schema`, in a statement or a list of statements.
+
+        The window placeholder of a partitioned table is followed by its partition placeholder,
+        so that Spectrum only lists the partitions of the window (see helpers.render_window).
+    """
+    if not tables or not sql:
+        return sql
+    if not isinstance(sql, str):
+        return type(sql)(external_sql(statement, tables, schema) for statement in sql)
+
+    for table in tables:
+        if re.search(r"\b{}\b".format(re.escape(table)), sql) is None:
+            continue
+        sql = re.sub(r"(?<![.\w]){}\b".format(re.escape(table)), f"{schema}.{table}", sql)
+        if table in partition_placeholders:
+            window_placeholder, partitions_placeholder = partition_placeholders[table]
+            sql = sql.replace(window_placeholder, f"{window_placeholder} {partitions_placeholder}")
+    return sql
@@ -0,0 +1,322 @@
+""" Compose the INSERT ... SELECT and merge statements of the star schema tables from their source definitions """
+
+from datetime import timedelta
+from functools import lru_cache
+
+from helpers.star_schema import star_schema, quote
+
+
+def song_key(title, artist_name, duration):
+    """ SQL expression of the song_lookup key: the md5 of the (title, artist name, duration) the events are matched on. """
+    return f"md5({title} || CHR(31) || {artist_name} || CHR(31) || CAST({duration} AS varchar))"
+
+
+# where the rows of every table come from:
+# - 'source': FROM clause, it may hold its own window placeholder.
+# - 'columns': (table column, source expression) pairs, in the table column order.
+# - 'filter': WHERE predicate on the source, 'window': name of the window placeholder appended to it,
+#   e.g. 'events' for {events_window}, see helpers.time_window.window_filters.
+# - 'distinct': if true, duplicate source rows are dropped.
+# - 'order_by': ordering of the source rows of a key, the first one is kept by the 'latest' and 'insert_new' modes.
+# - 'merge_window_column': time column bounding the rows looked up by the 'merge' mode.
+# - 'incremental_column': ever increasing column, the 'insert_newer' mode only inserts the rows past its maximum.
+table_sources = {
+    'songplays': {
+        'source': """(SELECT TIMESTAMP 'epoch' + ts/1000 * interval '1 second' AS start_time, *
+            FROM staging_events
+            WHERE page='NextSong' {events_window}) events
+            LEFT JOIN song_lookup songs
+            ON songs.song_key = """ + song_key('events.song', 'events.artist', 'events.length'),
+        'columns': [('playid', "md5(events.sessionid || events.start_time)"),
+                    ('start_time', "events.start_time"),
+                    ('userid', "events.userid"),
+                    ('level', "events.level"),
+                    ('songid', "songs.song_id"),
+                    ('artistid', "songs.artist_id"),
+                    ('sessionid', "events.sessionid"),
+                    ('location', "events.location"),
+                    ('user_agent', "events.useragent")],
+        'merge_window_column': 'start_time',
+    },
+    'users': {
+        'source': "staging_events",
+        'columns': [('userid', "userid"),
+                    ('first_name', "firstname"),
+                    ('last_name', "lastname"),
+                    ('gender', "gender"),
+                    ('level', "level")],
+        'filter': "page='NextSong'",
+        'window': 'events',
+        'distinct': True,
+        'order_by': "ts DESC",
+    },
+    'song_lookup': {
+        'source': "staging_songs",
+        'columns': [('song_key', song_key('title', 'artist_name', 'duration')),
+                    ('song_id', "song_id"),
+                    ('artist_id', "artist_id")],
+        'filter': "title IS NOT NULL AND artist_name IS NOT NULL AND duration IS NOT NULL",
+        'order_by': "song_id",
+    },
+    'songs': {
+        'source': "staging_songs",
+        'columns': [('songid', "song_id"),
+                    ('title', "title"),
+                    ('artistid', "artist_id"),
+                    ('year', "year"),
+                    ('duration', "duration")],
+        'distinct': True,
+    },
+    'artists': {
+        'source': "staging_songs",
+        'columns': [('artistid', "artist_id"),
+                    ('name', "artist_name"),
+                    ('location', "artist_location"),
+                    ('lattitude', "artist_latitude"),
+                    ('longitude', "artist_longitude")],
+        'distinct': True,
+    },
+    'time': {
+        'source': "songplays",
+        'columns': [('start_time', "start_time"),
+                    ('hour', "extract(hour from start_time)"),
+                    ('day', "extract(day from start_time)"),
+                    ('week', "extract(week from start_time)"),
+                    ('month', "extract(month from start_time)"),
+                    ('year', "extract(year from start_time)"),
+                    ('weekday', "extract(dayofweek from start_time)")],
+        'filter': "start_time IS NOT NULL",
+        'window': 'songplays',
+        'distinct': True,
+        'incremental_column': 'start_time',
+    },
+}
+
+merge_sql = [
+    "CREATE TEMP TABLE {table}_merge (LIKE {table})",
+    "INSERT INTO {table}_merge {select_sql}",
+    """
+    DELETE FROM {table}
+    USING {table}_merge
+    WHERE {table}.{merge_key} = {table}_merge.{merge_key}
+        AND {table}.{window_column} BETWEEN (SELECT MIN({window_column}) FROM {table}_merge)
+                                        AND (SELECT MAX({window_column}) FROM {table}_merge)
+    """,
+    "INSERT INTO {table} SELECT * FROM {table}_merge",
+    "DROP TABLE {table}_merge"
+]
+
+query_modes = ('select', 'insert', 'latest', 'insert_new', 'insert_newer', 'merge')
+
+# seconds per step of a pre-generated calendar.
+calendar_grains = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+def merge_statements(table, select_sql, merge_key, window_column):
+    """
+        Statements upserting the rows of select_sql into a table on merge_key, through a temp table.
+
+        Only the rows of the time range covered by the new rows (on window_column) are looked up for deletion.
+
+        :return: list of statements, to run in one transaction.
+    """
+    return [statement.format(table=table, select_sql=select_sql,
+                             merge_key=merge_key, window_column=window_column)
+            for statement in merge_sql]
+
+
+def source_where(source, extra_predicates=()):
+    """ WHERE clause of a source: its filter, extra predicates and its window placeholder. """
+    predicates = [source['filter']] if source.get('filter') else []
+    predicates += list(extra_predicates)
+    window = " {%s_window}" % source['window'] if source.get('window') else ""
+    if not predicates:
+        return "\n        WHERE TRUE" + window if window else ""
+    return "\n        WHERE " + " AND ".join(predicates) + window
+
+
+def select_columns(table, columns=None):
+    """ (column, expression) pairs of the projected columns of a table, every column by default. """
+    source_columns = table_sources[table]['columns']
+    if columns is None:
+        return source_columns
+
+    expressions = dict(source_columns)
+    unknown = [column for column in columns if column not in expressions]
+    if unknown:
+        raise ValueError(f"Unknown columns of {table}: {', '.join(unknown)}")
+    return [(column, expressions[column]) for column in columns]
+
+
+def select_sql(table, columns=None, extra_predicates=()):
+    """ SELECT of the rows of a table from its source. """
+    source = table_sources[table]
+    projection = ",\n            ".join(f"{expression} AS {quote(column)}"
+                                       for column, expression in select_columns(table, columns))
+    return "\n        SELECT {}{}\n        FROM {}{}\n    ".format(
+        "DISTINCT " if source.get('distinct') else "", projection, source['source'],
+        source_where(source, extra_predicates))
+
+
+def newer_rows_predicate(table):
+    """
+        Predicate keeping the source rows past the maximum of the incremental column in the table. The source
+        being sorted on that column, the scan skips every block older than the maximum.
+    """
+    column = table_sources[table].get('incremental_column')
+    if not column:
+        raise ValueError(f"{table} has no incremental_column to insert the newer rows on")
+    expression = dict(table_sources[table]['columns'])[column]
+    return "{} > (SELECT COALESCE(MAX({}), TIMESTAMP '1900-01-01') FROM {})".format(
+        expression, quote(column), quote(table))
+
+
+def latest_sql(table, columns=None, only_new=False):
+    """ One row per primary key, the first one in 'order_by' order; only the keys missing from the table if only_new. """
+    source = table_sources[table]
+    key_columns = star_schema[table]['primary_key']
+    expressions = dict(source['columns'])
+    projected = select_columns(table, columns)
+    for key in key_columns:
+        if key not in dict(projected):
+            projected = [(key, expressions[key])] + projected
+
+    projection = ",\n            ".join(f"{expression} AS {quote(column)}" for column, expression in projected)
+    partition = ", ".join(expressions[key] for key in key_columns)
+    new_keys = ""
+    if only_new:
+        key_match = " AND ".join(f"{quote(table)}.{quote(key)} = latest.{quote(key)}" for key in key_columns)
+        new_keys = f"\n            AND NOT EXISTS (SELECT 1 FROM {quote(table)} WHERE {key_match})"
+
+    return """
+        SELECT {}
+        FROM (SELECT {},
+            ROW_NUMBER() OVER (PARTITION BY {} ORDER BY {}) AS version
+            FROM {}{}) latest
+        WHERE version = 1{}
+    """.format(", ".join(quote(column) for column, _ in select_columns(table, columns)),
+               projection, partition, source['order_by'], source['source'],
+               source_where(source, [f"{expressions[key]} IS NOT NULL" for key in key_columns]),
+               new_keys)
+
+
+def build_query(table, mode='insert', columns=None):
+    """
+        Build the statement loading a table of the star schema, cached per (table, mode, columns).
+
+        The statements keep their time window placeholders, to be replaced by helpers.render_window at run time.
+
+        :param table: the table to load.
+        :type table: string
+        :param mode: 'select' the rows of the table, 'insert' them, 'latest' selects one row per primary key,
+                     'insert_new' inserts the latest row of the keys missing from the table, 'insert_newer'
+                     inserts the rows past the maximum of the incremental column of the table, 'merge' upserts
+                     the rows on the primary key (a tuple of statements).
+        :type mode: string
+        :param columns: the columns to project, every column of the table by default.
+        :type columns: list or tuple
+
+        :return: the statement, or a tuple of statements for 'merge'.
+    """
+    # the cache keys must be hashable, a list of columns is cached as a tuple.
+    return _build_query(table, mode, tuple(columns) if columns is not None else None)
+
+
+@lru_cache(maxsize=None)
+def _build_query(table, mode, columns):
+    if table not in table_sources:
+        raise ValueError(f"No source definition for {table}")
+    if mode not in query_modes:
+        raise ValueError(f"Unsupported query mode: {mode}")
+
+    column_list = ", ".join(quote(column) for column, _ in select_columns(table, columns))
+    if mode == 'select':
+        return select_sql(table, columns)
+    if mode == 'latest':
+        return latest_sql(table, columns)
+    if mode == 'insert':
+        return f"\n        INSERT INTO {quote(table)} ({column_list})" + select_sql(table, columns)
+    if mode == 'insert_new':
+        return f"\n        INSERT INTO {quote(table)} ({column_list})" + latest_sql(table, columns, only_new=True)
+    if mode == 'insert_newer':
+        return f"\n        INSERT INTO {quote(table)} ({column_list})" + select_sql(table, columns,
+                                                                                  [newer_rows_predicate(table)])
+
+    if not table_sources[table].get('merge_window_column'):
+        raise ValueError(f"{table} has no merge_window_column to merge on")
+    return tuple(merge_statements(quote(table), select_sql(table, columns),
+                                  merge_key=star_schema[table]['primary_key'][0],
+                                  window_column=table_sources[table]['merge_window_column']))
+
+
+def calendar_sql(start, end, grain='second', table='time'):
+    """
+        INSERT of every step of a dense calendar into a time dimension, for the [start, end) range.
+
+        The steps are numbered with a cross join of digits (generate_series only runs on the leader node),
+        and their columns are computed with the expressions of the table source; the steps already in the
+        table are skipped.
+
+        :param start: first step of the calendar.
+        :type start: datetime
+        :param end: end of the calendar, excluded.
+        :type end: datetime
+        :param grain: 'second', 'minute' or 'hour'.
+        :type grain: string
+        :param table: the time dimension.
+        :type table: string
+
+        :return: the statement, None if the range is empty.
+    """
+    if grain not in calendar_grains:
+        raise ValueError(f"Unsupported calendar grain: {grain}")
+    steps = int((end - start).total_seconds() // calendar_grains[grain])
+    if steps <= 0:
+        return None
+
+    digit_count = len(str(steps - 1))
+    digits = "(SELECT 0 AS d UNION ALL {})".format(" UNION ALL ".join(f"SELECT {d}" for d in range(1, 10)))
+    number = " + ".join(f"d{i}.d * {10 ** i}" if i else "d0.d" for i in range(digit_count))
+    joins = "\n                CROSS JOIN ".join(f"{digits} d{i}" for i in range(digit_count))
+
+    columns = table_sources[table]['columns']
+    return """
+        INSERT INTO {table} ({column_list})
+        SELECT {projection}
+        FROM (SELECT DATEADD({grain}, numbers.n, TIMESTAMP '{start}') AS start_time
+            FROM (SELECT {number} AS n
+                FROM {joins}) numbers
+            WHERE numbers.n < {steps}) calendar
+        WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.start_time = calendar.start_time)
+    """.format(table=quote(table),
+               column_list=", ".join(quote(column) for column, _ in columns),
+               projection=", ".join(expression for _, expression in columns),
+               grain=grain,
+               start=start.strftime('%Y-%m-%d %H:%M:%S'),
+               number=number,
+               joins=joins,
+               steps=steps)
+
+
+def calendar_coverage_sql(grain='second', table='time'):
+    """ Count of the calendar steps of a [%s, %s) range present in a time dimension. """
+    if grain not in calendar_grains:
+        raise ValueError(f"Unsupported calendar grain: {grain}")
+    return """
+        SELECT COUNT(DISTINCT DATE_TRUNC('{}', start_time))
+        FROM {}
+        WHERE start_time >= %s AND start_time < %s
+    """.format(grain, quote(table))
+
+
+def calendar_ranges(start, end, grain='second', max_steps=1000000):
+    """ Split [start, end) into ranges of at most max_steps calendar steps, inserted one statement each. """
+    if grain not in calendar_grains:
+        raise ValueError(f"Unsupported calendar grain: {grain}")
+    step = timedelta(seconds=calendar_grains[grain] * max_steps)
+    ranges = []
+    while start < end:
+        range_end = min(start + step, end)
+        ranges.append((start, range_end))
+        start = range_end
+    return ranges
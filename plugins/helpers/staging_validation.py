@@ -0,0 +1,241 @@
+import bz2
+import codecs
+import gzip
+import json
+import os
+import re
+import tempfile
+from decimal import Decimal, InvalidOperation
+
+from helpers.star_schema import table_columns
+
+# column types of the staging tables, as defined by the star schema.
+staging_columns = {table: table_columns(table) for table in ('staging_events', 'staging_songs')}
+
+integer_ranges = {
+    'int2': (-2 ** 15, 2 ** 15 - 1),
+    'int4': (-2 ** 31, 2 ** 31 - 1),
+    'int8': (-2 ** 63, 2 ** 63 - 1),
+}
+
+json_path_pattern = re.compile(r"^\$\[['\"](?P<key>.+)['\"]\]$|^\$\.(?P<dotted>\w+)$")
+
+
+def parse_json_paths(json_paths):
+    """ Top level keys of a JSONPaths file (its content as a string), in column order. """
+    keys = []
+    for path in json.loads(json_paths)['jsonpaths']:
+        match = json_path_pattern.match(path)
+        if match is None:
+            raise ValueError(f"Only top level JSONPaths can be validated, got {path}")
+        keys.append(match.group('key') or match.group('dotted'))
+    return keys
+
+
+def check_value(value, column_type):
+    """
+        Check that a JSON value loads into a Redshift column of `column_type`.
+
+        :return: the error message, or None when the value is valid.
+    """
+    if value is None:
+        return None
+
+    if column_type.startswith('varchar'):
+        if isinstance(value, (dict, list)):
+            return "nested value"
+        max_bytes = int(re.search(r"\((\d+)\)", column_type).group(1))
+        # varchar lengths are in bytes, not characters.
+        text = value if isinstance(value, str) else json.dumps(value)
+        if len(text.encode('utf-8')) > max_bytes:
+            return f"longer than {max_bytes} bytes"
+        return None
+
+    if isinstance(value, str):
+        if value == '':
+            # COPY loads empty strings of non character columns as NULL.
+            return None
+        try:
+            value = Decimal(value.strip())
+        except InvalidOperation:
+            return f"not a number: {value[:32]!r}"
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        return f"not a number: {type(value).__name__}"
+    else:
+        value = Decimal(str(value))
+
+    if not value.is_finite():
+        return "not a finite number"
+
+    if column_type in integer_ranges:
+        if value != int(value):
+            return "not an integer"
+        low, high = integer_ranges[column_type]
+        if not low <= int(value) <= high:
+            return f"out of {column_type} range"
+        return None
+
+    match = re.match(r"numeric\((\d+),(\d+)\)", column_type)
+    if match is not None:
+        precision, scale = int(match.group(1)), int(match.group(2))
+        if abs(int(value)) >= 10 ** (precision - scale):
+            return f"out of {column_type} range"
+    return None
+
+
+def check_record(record, columns, keys=None):
+    """
+        Check every column of a staging record.
+
+        :param record: the JSON document.
+        :param columns: (column, type) pairs of the staging table.
+        :type columns: list
+        :param keys: JSON key of every column (from a JSONPaths file), the column names when None ('auto').
+        :type keys: list
+
+        :return: list of the errors, empty when the record is valid.
+    """
+    if not isinstance(record, dict):
+        return ["not a JSON object"]
+
+    errors = []
+    for i, (column, column_type) in enumerate(columns):
+        key = keys[i] if keys is not None else column
+        error = check_value(record.get(key), column_type)
+        if error is not None:
+            errors.append(f"{column}: {error}")
+    return errors
+
+
+def iter_json_documents(stream, chunk_size=64 * 1024, max_document_bytes=1024 * 1024):
+    """
+        Incrementally parse the JSON documents of a stream, e.g. JSON lines or concatenated objects.
+
+        Only the document being parsed is held in memory. A malformed document is skipped up to
+        the end of its line.
+
+        :param stream: binary file-like object, e.g. the Body of an S3 object.
+        :param chunk_size: number of bytes read at a time.
+        :type chunk_size: int
+        :param max_document_bytes: documents larger than this are reported as malformed.
+        :type max_document_bytes: int
+
+        :return: generator of (document, None) for valid documents and (None, raw text) for malformed ones.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    at_end = False
+
+    while not at_end:
+        chunk = stream.read(chunk_size)
+        at_end = not chunk
+        buffer += text_decoder.decode(chunk or b'', final=at_end)
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                break
+
+            try:
+                document, position_after = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                # the error is past the last line break: the document may just be incomplete.
+                last_line_break = buffer.rfind('\n', position)
+                incomplete = error.pos > last_line_break and not at_end
+                if incomplete and len(buffer) - position <= max_document_bytes:
+                    break
+
+                line_end = buffer.find('\n', max(error.pos, position))
+                line_end = len(buffer) if line_end < 0 else line_end + 1
+                yield None, buffer[position:line_end].strip()
+                position = line_end
+                continue
+
+            yield document, None
+            position = position_after
+
+        buffer = buffer[position:]
+
+
+def validate_object(body, columns, keys=None, clean_file=None, quarantine_file=None, source=""):
+    """
+        Stream the documents of an S3 object, write the valid ones to `clean_file` and the others,
+        with their errors, to `quarantine_file`, both as JSON lines.
+
+        :return: dictionary with the number of 'valid' and 'invalid' records.
+    """
+    counts = {'valid': 0, 'invalid': 0}
+    for document, raw in iter_json_documents(body):
+        errors = ["malformed JSON"] if raw is not None else check_record(document, columns, keys)
+        if not errors:
+            counts['valid'] += 1
+            clean_file.write(json.dumps(document).encode('utf-8') + b'\n')
+        else:
+            counts['invalid'] += 1
+            quarantine_file.write(json.dumps({'source': source,
+                                              'errors': errors,
+                                              'record': document if raw is None else raw}).encode('utf-8') + b'\n')
+    return counts
+
+
+def open_body(body, compression=None):
+    """ Stream the decompressed content of an S3 object Body, compressed with 'gzip', 'bzip2' or None. """
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=body, mode='rb')
+    if compression == 'bzip2':
+        return bz2.BZ2File(body, mode='rb')
+    if compression is not None:
+        raise ValueError(f"Records compressed with {compression} can't be validated")
+    return body
+
+
+def validate_staging_object(s3_hook, bucket, obj, columns, keys, target_bucket, target_prefix,
+                            compression=None):
+    """
+        Validate one S3 object and upload its valid records and its quarantined records.
+
+        :param s3_hook: S3Hook used to access the buckets.
+        :param bucket: Amazon S3 Bucket name the object belongs to.
+        :type bucket: string
+        :param obj: object as returned by list_new_objects.
+        :type obj: dictionary
+        :param columns: (column, type) pairs of the staging table.
+        :type columns: list
+        :param keys: JSON key of every column, or None to match the column names.
+        :type keys: list
+        :param target_bucket: Amazon S3 Bucket name where the clean and quarantined records are written.
+        :type target_bucket: string
+        :param target_prefix: key folder inside target_bucket, with a 'clean' and a 'quarantine' folder.
+        :type target_prefix: string
+        :param compression: compression of the object, 'gzip', 'bzip2' or None. The clean records are uncompressed.
+        :type compression: string
+
+        :return: dictionary with the 'key', 'valid' and 'invalid' counts, the 'clean' object (same fields
+                 as list_new_objects plus its 'bucket', None without valid records) and the 'quarantine' key.
+    """
+    result = {'key': obj['key'], 'clean': None, 'quarantine': None}
+    with tempfile.NamedTemporaryFile(suffix='.json') as clean_file, \
+            tempfile.NamedTemporaryFile(suffix='.json') as quarantine_file:
+        body = open_body(s3_hook.get_key(obj['key'], bucket_name=bucket).get()['Body'], compression)
+        result.update(validate_object(body, columns, keys, clean_file, quarantine_file,
+                                      source=f"s3://{bucket}/{obj['key']}"))
+        clean_file.flush()
+        quarantine_file.flush()
+
+        if result['valid']:
+            clean_key = "{}/clean/{}".format(target_prefix, re.sub(r"\.(gz|bz2)$", "", obj['key']))
+            s3_hook.load_file(clean_file.name, key=clean_key,
+                              bucket_name=target_bucket, replace=True)
+            result['clean'] = {'bucket': target_bucket,
+                               'key': clean_key,
+                               'last_modified': obj['last_modified'],
+                               'size': os.path.getsize(clean_file.name)}
+        if result['invalid']:
+            result['quarantine'] = "{}/quarantine/{}".format(target_prefix, obj['key'])
+            s3_hook.load_file(quarantine_file.name, key=result['quarantine'],
+                              bucket_name=target_bucket, replace=True)
+
+    return result
@@ -0,0 +1,291 @@
+""" Star schema definitions of the Sparkify tables, and the Redshift DDL and deep copy migrations generated from them """
+
+import argparse
+
+# every table: its (column, type, not null) columns, primary key and physical layout.
+# - the dimensions are small: a copy on every node (DISTSTYLE ALL) makes their joins local.
+# - songplays and time are distributed and sorted on start_time, their join is collocated and
+#   the window filters and merges on start_time skip blocks.
+# - staging_songs and song_lookup are copied to every node so that the songplays select joins them locally.
+# - the plays_* rollups of songplays are sorted on their period, the dashboards read a range of periods.
+star_schema = {
+    'artists': {
+        'columns': [('artistid', 'varchar(256)', True),
+                    ('name', 'varchar(256)', False),
+                    ('location', 'varchar(256)', False),
+                    ('lattitude', 'numeric(18,0)', False),
+                    ('longitude', 'numeric(18,0)', False)],
+        'diststyle': 'ALL',
+        'sortkey': ['artistid'],
+    },
+    'plays_daily_by_artist': {
+        'columns': [('play_date', 'date', True),
+                    ('artistid', 'varchar(256)', False),
+                    ('plays', 'int8', True)],
+        'diststyle': 'EVEN',
+        'sortkey': ['play_date'],
+    },
+    'plays_daily_by_song': {
+        'columns': [('play_date', 'date', True),
+                    ('songid', 'varchar(256)', False),
+                    ('artistid', 'varchar(256)', False),
+                    ('plays', 'int8', True)],
+        'diststyle': 'EVEN',
+        'sortkey': ['play_date'],
+    },
+    'plays_hourly_by_level': {
+        'columns': [('play_hour', 'timestamp', True),
+                    ('level', 'varchar(256)', False),
+                    ('plays', 'int8', True)],
+        'diststyle': 'ALL',
+        'sortkey': ['play_hour'],
+    },
+    'plays_hourly_by_location': {
+        'columns': [('play_hour', 'timestamp', True),
+                    ('location', 'varchar(256)', False),
+                    ('plays', 'int8', True)],
+        'diststyle': 'EVEN',
+        'sortkey': ['play_hour'],
+    },
+    'songplays': {
+        'columns': [('playid', 'varchar(32)', True),
+                    ('start_time', 'timestamp', True),
+                    ('userid', 'int4', True),
+                    ('level', 'varchar(256)', False),
+                    ('songid', 'varchar(256)', False),
+                    ('artistid', 'varchar(256)', False),
+                    ('sessionid', 'int4', False),
+                    ('location', 'varchar(256)', False),
+                    ('user_agent', 'varchar(256)', False)],
+        'primary_key': ['playid'],
+        'diststyle': 'KEY',
+        'distkey': 'start_time',
+        'sortkey': ['start_time'],
+    },
+    'songs': {
+        'columns': [('songid', 'varchar(256)', True),
+                    ('title', 'varchar(256)', False),
+                    ('artistid', 'varchar(256)', False),
+                    ('year', 'int4', False),
+                    ('duration', 'numeric(18,0)', False)],
+        'primary_key': ['songid'],
+        'diststyle': 'ALL',
+        'sortkey': ['songid'],
+    },
+    'song_lookup': {
+        'columns': [('song_key', 'varchar(32)', True),
+                    ('song_id', 'varchar(256)', False),
+                    ('artist_id', 'varchar(256)', False)],
+        'primary_key': ['song_key'],
+        'diststyle': 'ALL',
+        'sortkey': ['song_key'],
+    },
+    'staging_events': {
+        'columns': [('artist', 'varchar(256)', False),
+                    ('auth', 'varchar(256)', False),
+                    ('firstname', 'varchar(256)', False),
+                    ('gender', 'varchar(256)', False),
+                    ('iteminsession', 'int4', False),
+                    ('lastname', 'varchar(256)', False),
+                    ('length', 'numeric(18,0)', False),
+                    ('level', 'varchar(256)', False),
+                    ('location', 'varchar(256)', False),
+                    ('method', 'varchar(256)', False),
+                    ('page', 'varchar(256)', False),
+                    ('registration', 'numeric(18,0)', False),
+                    ('sessionid', 'int4', False),
+                    ('song', 'varchar(256)', False),
+                    ('status', 'int4', False),
+                    ('ts', 'int8', False),
+                    ('useragent', 'varchar(256)', False),
+                    ('userid', 'int4', False)],
+        'diststyle': 'EVEN',
+        'sortkey': ['ts'],
+    },
+    'staging_songs': {
+        'columns': [('num_songs', 'int4', False),
+                    ('artist_id', 'varchar(256)', False),
+                    ('artist_name', 'varchar(256)', False),
+                    ('artist_latitude', 'numeric(18,0)', False),
+                    ('artist_longitude', 'numeric(18,0)', False),
+                    ('artist_location', 'varchar(256)', False),
+                    ('song_id', 'varchar(256)', False),
+                    ('title', 'varchar(256)', False),
+                    ('duration', 'numeric(18,0)', False),
+                    ('year', 'int4', False)],
+        'diststyle': 'ALL',
+        'sortkey': ['title'],
+    },
+    'time': {
+        'columns': [('start_time', 'timestamp', True),
+                    ('hour', 'int4', False),
+                    ('day', 'int4', False),
+                    ('week', 'int4', False),
+                    ('month', 'varchar(256)', False),
+                    ('year', 'int4', False),
+                    ('weekday', 'varchar(256)', False)],
+        'primary_key': ['start_time'],
+        'diststyle': 'KEY',
+        'distkey': 'start_time',
+        'sortkey': ['start_time'],
+    },
+    'users': {
+        'columns': [('userid', 'int4', True),
+                    ('first_name', 'varchar(256)', False),
+                    ('last_name', 'varchar(256)', False),
+                    ('gender', 'varchar(256)', False),
+                    ('level', 'varchar(256)', False)],
+        'primary_key': ['userid'],
+        'diststyle': 'ALL',
+        'sortkey': ['userid'],
+    },
+    'users_history': {
+        'columns': [('userid', 'int4', True),
+                    ('first_name', 'varchar(256)', False),
+                    ('last_name', 'varchar(256)', False),
+                    ('gender', 'varchar(256)', False),
+                    ('level', 'varchar(256)', False),
+                    ('valid_from', 'timestamp', True),
+                    ('valid_to', 'timestamp', False),
+                    ('is_current', 'boolean', True)],
+        'diststyle': 'ALL',
+        'sortkey': ['userid', 'valid_from'],
+    },
+}
+
+# names that have to be quoted in Redshift.
+reserved_words = {'level', 'method', 'year', 'hour', 'day', 'month', 'time'}
+
+az64_types = ('int2', 'int4', 'int8', 'numeric', 'timestamp', 'date')
+
+
+def quote(name):
+    return f'"{name}"' if name in reserved_words else name
+
+
+def column_encoding(table, column, column_type):
+    """
+        Compression encoding of a column: AZ64 for numbers and timestamps, ZSTD for strings.
+
+        The leading sort key column is left RAW, so that the zone maps filter on uncompressed blocks.
+    """
+    if star_schema[table]['sortkey'][:1] == [column] or column_type == 'boolean':
+        return 'RAW'
+    if column_type.startswith(az64_types):
+        return 'AZ64'
+    return 'ZSTD'
+
+
+def table_columns(table):
+    """ (column, type) pairs of a table, in order. """
+    return [(column, column_type) for column, column_type, _ in star_schema[table]['columns']]
+
+
+def expected_diststyle(table):
+    """ The distribution style of a table, as reported by SVV_TABLE_INFO, e.g. 'ALL' or 'KEY(start_time)'. """
+    definition = star_schema[table]
+    if definition['diststyle'] == 'KEY':
+        return "KEY({})".format(definition['distkey'])
+    return definition['diststyle']
+
+
+def create_table_sql(table, name=None, if_not_exists=True):
+    """
+        CREATE TABLE statement of a table of the star schema, with its distribution, sort key and encodings.
+
+        :param table: the table of the star schema.
+        :type table: string
+        :param name: name of the created table, `table` by default (e.g. the copy of a deep copy).
+        :type name: string
+        :param if_not_exists: if true, an existing table is left as it is.
+        :type if_not_exists: boolean
+    """
+    definition = star_schema[table]
+
+    lines = ["\t{} {}{} ENCODE {}".format(quote(column), column_type, " NOT NULL" if not_null else "",
+                                         column_encoding(table, column, column_type))
+             for column, column_type, not_null in definition['columns']]
+    if definition.get('primary_key'):
+        lines.append("\tPRIMARY KEY ({})".format(", ".join(map(quote, definition['primary_key']))))
+
+    layout = ["DISTSTYLE {}".format(definition['diststyle'])]
+    if definition['diststyle'] == 'KEY':
+        layout.append("DISTKEY ({})".format(quote(definition['distkey'])))
+    if definition.get('sortkey'):
+        layout.append("SORTKEY ({})".format(", ".join(map(quote, definition['sortkey']))))
+
+    return "CREATE TABLE {}public.{} (\n{}\n)\n{};".format(
+        "IF NOT EXISTS " if if_not_exists else "", quote(name or table), ",\n".join(lines), "\n".join(layout))
+
+
+def create_schema_sql(tables=None):
+    """ CREATE TABLE IF NOT EXISTS statements of the given tables, every table of the star schema by default. """
+    return [create_table_sql(table) for table in (tables or star_schema)]
+
+
+def deep_copy_sql(table):
+    """
+        Statements migrating an existing table to its star schema layout with a deep copy: the rows are
+        copied into a new table created with the target layout, which then replaces the old one.
+
+        Run them in one transaction, readers keep seeing the old table until the commit.
+    """
+    columns = ", ".join(quote(column) for column, _ in table_columns(table))
+    return [create_table_sql(table, name=f"{table}_deep_copy", if_not_exists=False),
+            "INSERT INTO public.{} ({}) SELECT {} FROM public.{};".format(
+                quote(f"{table}_deep_copy"), columns, columns, quote(table)),
+            "ALTER TABLE public.{} RENAME TO {};".format(quote(table), quote(f"{table}_before_deep_copy")),
+            "ALTER TABLE public.{} RENAME TO {};".format(quote(f"{table}_deep_copy"), quote(table)),
+            "DROP TABLE public.{};".format(quote(f"{table}_before_deep_copy"))]
+
+
+table_layout_sql = """
+    SELECT "table", diststyle, sortkey1
+    FROM svv_table_info
+    WHERE "schema" = 'public'
+"""
+
+
+def tables_to_migrate(get_records):
+    """
+        Tables of the star schema whose distribution style or leading sort key differ from their definition.
+
+        :param get_records: function running a query and returning its records, e.g. RedshiftSession.get_records.
+    """
+    layouts = {table: (diststyle, sortkey1) for table, diststyle, sortkey1 in get_records(table_layout_sql)}
+    return [table for table, definition in star_schema.items()
+            if table in layouts and layouts[table] != (expected_diststyle(table), definition['sortkey'][0])]
+
+
+def migrate_tables(redshift, log, tables=None):
+    """
+        Deep copy the existing tables whose layout differs from the star schema, one transaction per table.
+
+        :param redshift: RedshiftSession to run the statements on.
+        :param log: logger of the calling operator.
+        :param tables: tables to migrate, the ones reported by tables_to_migrate by default.
+        :type tables: list
+
+        :return: the migrated tables.
+    """
+    tables = tables_to_migrate(redshift.get_records) if tables is None else tables
+    for table in tables:
+        log.info(f"Deep copying {table} to DISTSTYLE {expected_diststyle(table)}")
+        with redshift.transaction():
+            redshift.run(deep_copy_sql(table))
+    return tables
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('command', choices=['ddl', 'migrate'],
+                            help='print the CREATE TABLE statements, or the deep copy migration of the tables')
+    arg_parser.add_argument('tables', nargs='*', help='tables of the star schema, all of them by default')
+    args = arg_parser.parse_args()
+
+    tables = args.tables or list(star_schema)
+    if args.command == 'ddl':
+        print("\n\n".join(create_schema_sql(tables)))
+    else:
+        for table in tables:
+            print("BEGIN;\n{}\nCOMMIT;\n".format("\n".join(deep_copy_sql(table))))
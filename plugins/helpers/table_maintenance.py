@@ -0,0 +1,91 @@
+table_health_sql = """
+    SELECT "table", unsorted, stats_off, tbl_rows, estimated_visible_rows
+    FROM svv_table_info
+    WHERE "schema" = 'public'
+"""
+
+# the running queries of the cluster, labelled with the query group of their session.
+active_queries_sql = """
+    SELECT TRIM(label), COUNT(*)
+    FROM stv_inflight
+    GROUP BY 1
+"""
+
+maintenance_statements = {
+    'vacuum_delete': "VACUUM DELETE ONLY public.{table} TO 100 PERCENT",
+    'vacuum_sort': "VACUUM SORT ONLY public.{table}",
+    'analyze': "ANALYZE public.{table} PREDICATE COLUMNS",
+}
+
+
+def table_health(get_records, tables=None):
+    """
+        Health metrics of the tables from SVV_TABLE_INFO, in one query.
+
+        :param get_records: function running a query and returning its records, e.g. RedshiftSession.get_records.
+        :param tables: tables to report, every table of the public schema when None.
+        :type tables: list
+
+        :return: dictionary of table name to its 'unsorted' and 'stats_off' percentages, 'tbl_rows' and
+                 'deleted_pct', the percentage of its rows marked for deletion.
+    """
+    health = {}
+    for table, unsorted, stats_off, tbl_rows, visible_rows in get_records(table_health_sql):
+        if tables is not None and table not in tables:
+            continue
+        tbl_rows = int(tbl_rows or 0)
+        deleted_rows = max(tbl_rows - int(visible_rows or 0), 0)
+        health[table] = {'unsorted': float(unsorted or 0),
+                         'stats_off': float(stats_off or 0),
+                         'tbl_rows': tbl_rows,
+                         'deleted_pct': round(100.0 * deleted_rows / tbl_rows, 2) if tbl_rows else 0.0}
+    return health
+
+
+def active_queries(get_records, query_groups):
+    """
+        Number of queries of the WLM query groups running on the cluster (STV_INFLIGHT), every tenant included.
+
+        :param get_records: function running a query and returning its records, e.g. RedshiftSession.get_records.
+        :param query_groups: the query groups to count, e.g. ('copy', 'transform') for the loads.
+        :type query_groups: list
+
+        :return: dictionary of query group to its number of running queries, the idle groups left out.
+    """
+    return {label: int(count) for label, count in get_records(active_queries_sql) if label in query_groups}
+
+
+def plan_maintenance(health, unsorted_threshold=10.0, stats_off_threshold=10.0, deleted_threshold=5.0):
+    """
+        Maintenance statements of the tables past the thresholds, in execution order per table:
+        reclaim the deleted rows, sort, then refresh the statistics.
+
+        :param health: metrics returned by table_health.
+        :type health: dictionary
+        :param unsorted_threshold: percentage of unsorted rows above which a table is sorted.
+        :type unsorted_threshold: float
+        :param stats_off_threshold: staleness percentage of the statistics above which a table is analyzed.
+        :type stats_off_threshold: float
+        :param deleted_threshold: percentage of rows marked for deletion above which they are reclaimed.
+        :type deleted_threshold: float
+
+        :return: list of dictionaries with the 'table', the 'operation', its 'sql' and the metric 'reason'.
+    """
+    plan = []
+    for table in sorted(health):
+        metrics = health[table]
+        operations = []
+        if metrics['deleted_pct'] > deleted_threshold:
+            operations.append(('vacuum_delete', f"{metrics['deleted_pct']}% deleted rows"))
+        if metrics['unsorted'] > unsorted_threshold:
+            operations.append(('vacuum_sort', f"{metrics['unsorted']}% unsorted"))
+        if metrics['stats_off'] > stats_off_threshold:
+            operations.append(('analyze', f"{metrics['stats_off']}% stats off"))
+
+        quoted_table = f'"{table}"'
+        plan.extend({'table': table,
+                     'operation': operation,
+                     'sql': maintenance_statements[operation].format(table=quoted_table),
+                     'reason': reason}
+                    for operation, reason in operations)
+    return plan
@@ -0,0 +1,78 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def default_stats_path():
+    """ Stats store kept next to the Airflow home of the worker. """
+    airflow_home = os.environ.get('AIRFLOW_HOME', os.path.expanduser('~/airflow'))
+    return os.path.join(airflow_home, 'sparkify_table_stats.json')
+
+
+class TableStatsStore:
+    """
+        TableStatsStore persists the statistics measured by the data quality checks in a local JSON file,
+        so that a run can compare its statistics to the previous run without re-querying history.
+
+        :param path: path of the JSON file, created on the first save.
+        :type path: string
+            Default is $AIRFLOW_HOME/sparkify_table_stats.json
+
+        :param namespace: the tenant the statistics belong to: the tenants sharing a file keep their own entries,
+                          keyed <namespace>.<table>.
+        :type namespace: string
+    """
+
+    def __init__(self, path="", namespace=""):
+        self.path = path or default_stats_path()
+        self.namespace = namespace
+        self._lock = threading.Lock()
+
+    def _key(self, table):
+        return f"{self.namespace}.{table}" if self.namespace else table
+
+    @contextmanager
+    def _locked(self):
+        """
+            Hold the store across threads and processes: the tasks of every DAG run and tenant on the worker
+            share the file, a flock on <path>.lock serializes their read-modify-writes.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as stats_file:
+            return json.load(stats_file)
+
+    def get(self, table):
+        """ Last statistics saved for `table`, or None. """
+        with self._locked():
+            return self._read().get(self._key(table))
+
+    def save(self, table, stats):
+        """ Replace the statistics of `table`, the file is swapped atomically. """
+        with self._locked():
+            all_stats = self._read()
+            all_stats[self._key(table)] = dict(stats, recorded_at=datetime.utcnow().isoformat())
+
+            # a temp file of its own, in the folder of the store for os.replace to stay on one filesystem.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=os.path.basename(self.path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as stats_file:
+                    json.dump(all_stats, stats_file, default=str, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
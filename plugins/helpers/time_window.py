@@ -0,0 +1,89 @@
+from datetime import timedelta, timezone
+
+# placeholders of SqlQueries statements, replaced by a predicate on the time column of their source.
+window_filters = {
+    # staging_events.ts holds epoch milliseconds.
+    '{events_window}': "AND ts >= {start_ms} AND ts < {end_ms}",
+    '{songplays_window}': "AND start_time >= '{start}' AND start_time < '{end}'",
+    # partitions of the Spectrum external staging_events table covering the window, see helpers.spectrum.
+    '{events_partitions}': "AND ({partitions})"
+}
+
+
+def window_months(window):
+    """ (year, month) of every month overlapping a [start, end) window. """
+    start, end = window
+    # the end is excluded: a window ending on the first of a month doesn't cover that month.
+    last = end - timedelta(microseconds=1)
+    year, month = start.year, start.month
+    months = []
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def parse_window(window_start, window_end):
+    """
+        Parse the (templated) bounds of a [window_start, window_end) time window.
+
+        :return: tuple of UTC datetimes, or None when no window is given.
+    """
+    if not window_start and not window_end:
+        return None
+    if not window_start or not window_end:
+        raise ValueError("window_start and window_end must be given together")
+
+    from dateutil import parser
+
+    bounds = []
+    for bound in (window_start, window_end):
+        if isinstance(bound, str):
+            bound = parser.parse(bound)
+        if bound.tzinfo is None:
+            bound = bound.replace(tzinfo=timezone.utc)
+        bounds.append(bound.astimezone(timezone.utc))
+
+    if bounds[0] >= bounds[1]:
+        raise ValueError(f"Empty time window [{bounds[0]}, {bounds[1]})")
+    return tuple(bounds)
+
+
+def has_window_filter(sql):
+    """ True if `sql` has a time window placeholder. """
+    return any(placeholder in sql for placeholder in window_filters)
+
+
+def render_window(sql, window=None):
+    """
+        Replace the time window placeholders of a statement.
+
+        :param sql: statement with {events_window} / {songplays_window} placeholders.
+        :type sql: string
+        :param window: tuple returned by parse_window, None removes the placeholders.
+        :type window: tuple
+
+        :return: the statement restricted to the window.
+    """
+    for placeholder, window_filter in window_filters.items():
+        predicate = ""
+        if window is not None:
+            start, end = window
+            predicate = window_filter.format(start=start.strftime('%Y-%m-%d %H:%M:%S'),
+                                             end=end.strftime('%Y-%m-%d %H:%M:%S'),
+                                             start_ms=int(start.timestamp() * 1000),
+                                             end_ms=int(end.timestamp() * 1000),
+                                             partitions=" OR ".join(
+                                                 f"(part_year = {year} AND part_month = {month})"
+                                                 for year, month in window_months(window)))
+        sql = sql.replace(placeholder, predicate)
+
+    return sql
+
+
+def window_delete_sql(table, column, window):
+    """ DELETE statement clearing the rows of `table` inside the time window. """
+    start, end = window
+    return "DELETE FROM {} WHERE {} >= '{}' AND {} < '{}'".format(
+        table, column, start.strftime('%Y-%m-%d %H:%M:%S'),
+        column, end.strftime('%Y-%m-%d %H:%M:%S'))
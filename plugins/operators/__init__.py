@@ -1,11 +1,28 @@
 from operators.stage_redshift import StageToRedshiftOperator
 from operators.load_fact import LoadFactOperator
 from operators.load_dimension import LoadDimensionOperator
+from operators.load_dimensions import LoadDimensionsOperator
 from operators.data_quality import DataQualityOperator
+from operators.table_maintenance import RedshiftMaintenanceOperator
+from operators.release_staging import ReleaseStagingTablesOperator
+from operators.load_calendar import LoadCalendarOperator
+from operators.stage_spectrum import StageToSpectrumOperator
+from operators.deferrable import (DeferrableStageToRedshiftOperator, DeferrableLoadFactOperator,
+                                  DeferrableLoadDimensionOperator)
+from operators.load_rollups import LoadRollupsOperator
 
 __all__ = [
     'StageToRedshiftOperator',
     'LoadFactOperator',
     'LoadDimensionOperator',
-    'DataQualityOperator'
+    'LoadDimensionsOperator',
+    'DataQualityOperator',
+    'RedshiftMaintenanceOperator',
+    'ReleaseStagingTablesOperator',
+    'LoadCalendarOperator',
+    'StageToSpectrumOperator',
+    'DeferrableStageToRedshiftOperator',
+    'DeferrableLoadFactOperator',
+    'DeferrableLoadDimensionOperator',
+    'LoadRollupsOperator'
 ]
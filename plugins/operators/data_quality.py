@@ -1,6 +1,11 @@
-from airflow.hooks.postgres_hook import PostgresHook
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from helpers import (group_checks, needs_scan, run_table_checks,
+                     system_row_counts, TableStatsStore, RedshiftConnectionPool,
+                     publish_query_stats)
 
 
 class DataQualityOperator(BaseOperator):
@@ -15,53 +20,110 @@ class DataQualityOperator(BaseOperator):
         :type data_quality_checks: list
         :args data_quality_checks[i]: dictionary 
         :type data_quality_checks[i]: dictionary
-        :dictionary args: 'check_sql_query': A query to check against it's condition.
+        :dictionary args: 'check_sql_query': A query to check against it's condition (optional).
                           'targeted_table': The targeted table name we need to apply a check on. 
                           'test_against': the criteria we need to test against as null.
                           'expected_result': the result we expect from the query we run against Redshift.
+                          'column': the column a check without check_sql_query is computed on.
+                          'min_value', 'max_value': accepted range of the result instead of expected_result.
+
+                          'references': the 'table.column' a 'referential_integrity' check points to.
+                          'max_age_hours': the accepted age of the latest 'freshness' value.
+
+        Built-in 'test_against' check types:
+            'row_count', or 'null', 'not_null', 'unique', 'distinct', 'min', 'max', 'freshness' of a 'column'
+                are compiled into a single aggregate query per targeted table.
+            'row_count_range', 'row_count_delta' (vs the previous run) are served by SVV_TABLE_INFO, no scan.
+            'referential_integrity' counts the 'column' values missing from 'references'.
+        The tables are checked concurrently and the structured result of every check is returned (XCom).
+
+        :param max_workers: maximum number of tables checked concurrently.
+        :type max_workers: int
+            Default is 4
+
+        :param stats_path: path of the local JSON stats store the table statistics are saved to after each run,
+                           for the tables whose checks all passed.
+        :type stats_path: string
+            Default is $AIRFLOW_HOME/sparkify_table_stats.json
+
+        :param stats_namespace: the tenant of the checked tables, its statistics are kept apart from the other
+                                tenants' in the stats store.
+        :type stats_namespace: string
     """
     ui_color = '#89DA59'
+    # WLM query group of the statements of the operator.
+    query_group = 'check'
 
     @apply_defaults
     def __init__(self,
                  redshift_conn_id="",
                  data_quality_checks=[],
+                 max_workers=4,
+                 stats_path="",
+                 stats_namespace="",
                  *args, **kwargs):
 
         super(DataQualityOperator, self).__init__(*args, **kwargs)
         self.redshift_conn_id = redshift_conn_id
         self.data_quality_checks = data_quality_checks
+        self.max_workers = max_workers
+        self.stats_path = stats_path
+        self.stats_namespace = stats_namespace
 
     def execute(self, context):
-        redshift = PostgresHook(self.redshift_conn_id)
+        tables = group_checks(self.data_quality_checks)
+        self.log.info(
+            f"Executing {len(self.data_quality_checks)} Data Quality Checks on {len(tables)} tables")
 
-        for i, dict_params in enumerate(self.data_quality_checks):
+        stats_store = TableStatsStore(self.stats_path, namespace=self.stats_namespace)
+        reference_time = context['next_execution_date'].astimezone(
+            timezone.utc).replace(tzinfo=None)
 
+        max_workers = max(min(self.max_workers, len(tables)), 1)
+        with RedshiftConnectionPool(self.redshift_conn_id, max_size=max_workers,
+                                    query_group=self.query_group) as pool:
+            # the row counts of every table come from one SVV_TABLE_INFO query.
+            with pool.session() as redshift:
+                system_rows = system_row_counts(redshift.get_records, [
+                    table for table, checks in tables.items()
+                    if not needs_scan(checks) or any(check.get('test_against') in ('row_count_range', 'row_count_delta')
+                                                     for _, check in checks)])
+
+            def run_checks(table):
+                # the tables are checked concurrently over the pooled connections.
+                with pool.session() as redshift:
+                    first_statement = len(redshift.query_stats)
+                    table_results, stats = run_table_checks(redshift.get_records, table, tables[table],
+                                                            system_rows=system_rows.get(table),
+                                                            previous_stats=stats_store.get(table),
+                                                            reference_time=reference_time)
+                    for query_stats in redshift.query_stats[first_statement:]:
+                        query_stats['table'] = table
+                # a failed table keeps its baseline: the next run compares against the last good stats.
+                if all(result['passed'] for result in table_results):
+                    stats_store.save(table, stats)
+                return table_results
+
+            results = []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for table_results in executor.map(run_checks, tables):
+                    results.extend(table_results)
+
+            publish_query_stats(context, pool.collect_system_stats(), log=self.log)
+
+        for result in results:
             self.log.info(
-                f"Executing Data Quality Check {i}: {dict_params.get('check_sql_query', default = 'This is Not A Valid Query')}")
-
-            test_against_criteria = redshift.get_records(dict_params.get(
-                'check_sql_query', default='This is Not A Valid Query'))
-
-            default_count_check_query = redshift.get_records(
-                f"SELECT COUNT(*) FROM {dict_params.get('targeted_table')}")
-
-            num_records = default_count_check_query[0][0]
-
-            if len(default_count_check_query) < 1 or len(default_count_check_query[0]) < 1:
-                raise ValueError(
-                    f"Data quality check FAILED. {dict_params.get('targeted_table')} table -> contains 0 rows")
-            elif num_records < 1:
-                raise ValueError(
-                    f"Data quality check FAILED. {dict_params.get('targeted_table')} -> contains 0 records")
-            elif dict_params.get('test_against') == 'null':
-                raise ValueError(
-                    "Data quality check {}. {} table -> contains {} {} values"
-                    .format('Passed' if dict_params.get('expected_result') == len(test_against_criteria) else "FAILED",
-                            dict_params.get('targeted_table'),
-                            dict_params.get('expected_result'),
-                            dict_params.get('test_against'))
-                )
-            else:
-                self.log.info(
-                    f"Data quality on table {dict_params.get('targeted_table')} PASSED with {num_records} records")
+                "Data quality check {} on {} table {}: {} {} = {}".format(
+                    result['check'] if result['check'] is not None else 'row_count',
+                    result['targeted_table'],
+                    'PASSED' if result['passed'] else 'FAILED',
+                    result['test_against'],
+                    result['column'] or '',
+                    result['actual']))
+
+        failed = [result for result in results if not result['passed']]
+        if failed:
+            raise ValueError(
+                "Data quality check FAILED for {} checks: {}".format(len(failed), failed))
+
+        return results
@@ -0,0 +1,139 @@
+from airflow.utils.decorators import apply_defaults
+from helpers import (StatementBatch, data_api_client, data_api_target, submit_batch,
+                     save_watermark, serialize_watermark, deserialize_watermark, publish_query_stats)
+from operators.stage_redshift import StageToRedshiftOperator
+from operators.load_fact import LoadFactOperator
+from operators.load_dimension import LoadDimensionOperator
+
+
+class DeferrableRedshiftMixin:
+    """
+        Submits the statements of a load through the Redshift Data API and defers the task to
+        triggers.RedshiftStatementTrigger: the worker slot is released while Redshift runs them.
+
+        Deferring needs Airflow 2.2+ and a running triggerer; the operator classes still import on Airflow 1.10.
+    """
+
+    def _defer_batch(self, context, batch, **kwargs):
+        """ Submit the recorded statements in one transaction and defer until they stop running. """
+        # imported when the task defers, the trigger module needs Airflow 2.2+.
+        from triggers.redshift_statement import RedshiftStatementTrigger
+
+        statement_id = submit_batch(data_api_client(self.aws_credentials_id, self.region or None),
+                                    data_api_target(self.redshift_conn_id),
+                                    batch.statements, self.query_group)
+        self.log.info(
+            f"Submitted {len(batch.statements)} statements of {self.table} as {statement_id}, deferring")
+        self.defer(trigger=RedshiftStatementTrigger(statement_id, self.aws_credentials_id, self.region or None,
+                                                    self.query_group, self.poll_interval),
+                   method_name='execute_complete',
+                   kwargs=kwargs)
+
+    def execute_complete(self, context, event=None):
+        """ Resume the task once the trigger fired: fail it if the batch failed, publish its statistics. """
+        if event['status'] != 'success':
+            raise ValueError(
+                f"Loading {self.table} failed ({event['statement_id']}): {event['error']}")
+
+        self.log.info(f"Statement {event['statement_id']} finished")
+        publish_query_stats(context, event['query_stats'], self.table, self.log)
+
+
+class DeferrableStageToRedshiftOperator(DeferrableRedshiftMixin, StageToRedshiftOperator):
+    """
+        DeferrableStageToRedshiftOperator is the deferrable StageToRedshiftOperator: the S3 listing and the
+        manifest are prepared by the worker, then the clearing and the COPY are submitted through the
+        Redshift Data API and awaited by the triggerer.
+
+        It takes the parameters of StageToRedshiftOperator, the Data API client uses aws_credentials_id and region;
+        the cluster, database and user are read from the Redshift connection (see helpers.data_api_target).
+
+        :param poll_interval: seconds between two polls of the statement by the triggerer.
+        :type poll_interval: float
+            Default is 15
+    """
+
+    @apply_defaults
+    def __init__(self, poll_interval=15, *args, **kwargs):
+        super(DeferrableStageToRedshiftOperator, self).__init__(*args, **kwargs)
+        self.poll_interval = poll_interval
+
+    def _copy(self, redshift, staging_table, copy_sql, context, new_objects):
+        batch = StatementBatch()
+        self._clear(batch, staging_table)
+        batch.run(copy_sql)
+
+        watermark = None
+        if self.incremental == True:
+            # the watermark is advanced once the COPY committed, it is passed to execute_complete as JSON.
+            watermark = serialize_watermark(self._next_watermark(new_objects))
+        self._defer_batch(context, batch, watermark=watermark)
+
+    def execute_complete(self, context, event=None, watermark=None):
+        super(DeferrableStageToRedshiftOperator, self).execute_complete(context, event)
+
+        if watermark is not None:
+            save_watermark(self.table, deserialize_watermark(watermark), self.watermark_namespace)
+
+
+class DeferrableLoadFactOperator(DeferrableRedshiftMixin, LoadFactOperator):
+    """
+        DeferrableLoadFactOperator is the deferrable LoadFactOperator: the statements of the load are submitted
+        in one transaction through the Redshift Data API and awaited by the triggerer.
+
+        It takes the parameters of LoadFactOperator, and:
+
+        :param aws_credentials_id: AWS connection of the Data API client.
+        :type aws_credentials_id: string
+
+        :param region: AWS region of the cluster.
+        :type region: string
+
+        :param poll_interval: seconds between two polls of the statement by the triggerer.
+        :type poll_interval: float
+            Default is 15
+    """
+
+    @apply_defaults
+    def __init__(self, aws_credentials_id="", region="", poll_interval=15, *args, **kwargs):
+        super(DeferrableLoadFactOperator, self).__init__(*args, **kwargs)
+        self.aws_credentials_id = aws_credentials_id
+        self.region = region
+        self.poll_interval = poll_interval
+
+    def execute(self, context):
+        batch = StatementBatch()
+        self.load(batch, context)
+        self._defer_batch(context, batch)
+
+
+class DeferrableLoadDimensionOperator(DeferrableRedshiftMixin, LoadDimensionOperator):
+    """
+        DeferrableLoadDimensionOperator is the deferrable LoadDimensionOperator: the statements of the load
+        (or of the slowly changing dimension merge) are submitted in one transaction through the
+        Redshift Data API and awaited by the triggerer.
+
+        It takes the parameters of LoadDimensionOperator, and:
+
+        :param aws_credentials_id: AWS connection of the Data API client.
+        :type aws_credentials_id: string
+
+        :param region: AWS region of the cluster.
+        :type region: string
+
+        :param poll_interval: seconds between two polls of the statement by the triggerer.
+        :type poll_interval: float
+            Default is 15
+    """
+
+    @apply_defaults
+    def __init__(self, aws_credentials_id="", region="", poll_interval=15, *args, **kwargs):
+        super(DeferrableLoadDimensionOperator, self).__init__(*args, **kwargs)
+        self.aws_credentials_id = aws_credentials_id
+        self.region = region
+        self.poll_interval = poll_interval
+
+    def execute(self, context):
+        batch = StatementBatch()
+        self.load(batch, context)
+        self._defer_batch(context, batch)
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import (parse_window, calendar_sql, calendar_coverage_sql, calendar_ranges,
+                     calendar_grains, RedshiftSession, publish_query_stats)
+
+
+class LoadCalendarOperator(BaseOperator):
+    """
+        LoadCalendarOperator is a custom operator that pre-generates a dense calendar into the time dimension:
+        one row per second (or minute, hour) of a date range, so that the hourly runs don't have to derive
+        the time rows from songplays.
+
+        Ranges already covered are skipped after one count on the sort key of the table, generating the
+        calendar ahead of the runs makes their cost near zero.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+            Default is 'redshift'
+
+        :param table: Redshift time dimension table name.
+        :type table: string
+            Default is 'time'
+
+        :param start_date: first day of the calendar (templated).
+        :type start_date: string
+
+        :param end_date: end of the calendar, excluded (templated).
+        :type end_date: string
+
+        :param grain: step of the calendar: 'second', 'minute' or 'hour'. It must match the precision of
+                      songplays.start_time for every play to have its time row (second for Sparkify).
+        :type grain: string
+            Default is 'second'
+
+        :param max_steps: maximum number of rows inserted by one statement.
+        :type max_steps: int
+            Default is 1000000
+    """
+
+    ui_color = '#80BD9E'
+    # WLM query group of the statements of the operator.
+    query_group = 'transform'
+
+    template_fields = ("start_date", "end_date")
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 table="time",
+                 start_date="",
+                 end_date="",
+                 grain="second",
+                 max_steps=1000000,
+                 *args, **kwargs):
+
+        super(LoadCalendarOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.table = table
+        self.start_date = start_date
+        self.end_date = end_date
+        self.grain = grain
+        self.max_steps = max_steps
+
+        if self.grain not in calendar_grains:
+            raise ValueError(
+                "grain must be one of {}, not {}".format(", ".join(calendar_grains), self.grain))
+
+    def execute(self, context):
+        start, end = parse_window(self.start_date, self.end_date)
+        step_seconds = calendar_grains[self.grain]
+        # the calendar starts on a step of its grain, the UTC bounds are compared to naive timestamps.
+        start = start.replace(microsecond=0) - timedelta(seconds=int(start.timestamp()) % step_seconds)
+        start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            inserted = 0
+            for range_start, range_end in calendar_ranges(start, end, self.grain, self.max_steps):
+                steps = int((range_end - range_start).total_seconds() // step_seconds)
+                covered = redshift.get_first(calendar_coverage_sql(self.grain, self.table),
+                                             (range_start, range_end))[0]
+                if covered >= steps:
+                    self.log.info(f"The calendar of {self.table} covers [{range_start}, {range_end})")
+                    continue
+
+                self.log.info(
+                    f"Generating the {self.grain} calendar of {self.table} for [{range_start}, {range_end})")
+                inserted += max(redshift.run(calendar_sql(range_start, range_end, self.grain, self.table)), 0)
+
+            publish_query_stats(context, redshift.collect_system_stats(), self.table, self.log)
+
+        self.log.info(f"{inserted} calendar rows inserted into {self.table}")
+        return inserted
@@ -1,6 +1,8 @@
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from helpers import (parse_window, render_window, window_delete_sql,
+                     RedshiftSession, publish_query_stats, scope_sql)
+from helpers.star_schema import quote
 
 
 class LoadDimensionOperator(BaseOperator):
@@ -20,9 +22,48 @@ class LoadDimensionOperator(BaseOperator):
 
         :param sql: Query representing data that will be inserted
         type sql: string
+
+        :param window_start: start of the [window_start, window_end) time window to load (templated),
+                             injected as a predicate on the {events_window}/{songplays_window} placeholders.
+        :type window_start: string
+
+        :param window_end: end of the time window to load (templated).
+        :type window_end: string
+
+        :param table_window_column: time column of the table, required when a window is given and data is
+                                    not appended: only the rows of the window are cleared from the table.
+        :type table_window_column: string
+
+        :param scd_type: if 1 or 2, the rows of select_sql are merged on key_columns and only the new or changed rows
+                         are applied: type 1 overwrites them, type 2 closes the current version
+                         (valid_to, is_current) and inserts a new one (valid_from).
+        :type scd_type: int
+
+        :param select_sql: Query selecting one candidate row per key, used when scd_type is set.
+        :type select_sql: string
+
+        :param key_columns: business key columns of the dimension, used when scd_type is set.
+        :type key_columns: list
+
+        :param columns: every column selected by select_sql, keys included, used when scd_type is set.
+        :type columns: list
+
+        :param tracked_columns: columns whose changes are applied, defaults to the non key columns.
+        :type tracked_columns: list
+
+        :param staging_tables: staging tables read through their run-scoped copy (StageToRedshiftOperator with
+                               run_scoped=True), e.g. ['staging_events'].
+        :type staging_tables: list
+
+        :param staging_schema: external schema the staging_tables are read from instead (StageToSpectrumOperator).
+        :type staging_schema: string
     """
 
     ui_color = '#80BD9E'
+    # WLM query group of the statements of the operator.
+    query_group = 'transform'
+
+    template_fields = ("window_start", "window_end")
 
     @apply_defaults
     def __init__(self,
@@ -30,6 +71,16 @@ class LoadDimensionOperator(BaseOperator):
                  table="",
                  append_data="",
                  sql="",
+                 window_start="",
+                 window_end="",
+                 table_window_column="",
+                 scd_type=None,
+                 select_sql="",
+                 key_columns=[],
+                 columns=[],
+                 tracked_columns=[],
+                 staging_tables=[],
+                 staging_schema="",
                  *args, **kwargs):
 
         super(LoadDimensionOperator, self).__init__(*args, **kwargs)
@@ -37,18 +88,165 @@ class LoadDimensionOperator(BaseOperator):
         self.table = table
         self.append_data = append_data
         self.sql = sql
+        self.window_start = window_start
+        self.window_end = window_end
+        self.table_window_column = table_window_column
+        self.scd_type = scd_type
+        self.select_sql = select_sql
+        self.key_columns = key_columns
+        self.columns = columns
+        self.tracked_columns = tracked_columns
+        self.staging_tables = staging_tables
+        self.staging_schema = staging_schema
 
     def execute(self, context):
-        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            self.load(redshift, context)
 
-        if self.append_data == True:
+            publish_query_stats(context, redshift.collect_system_stats(), self.table, self.log)
+
+    def load(self, redshift, context):
+        """ Run the statements of the load on a RedshiftSession (or a helpers.StatementBatch). """
+        window = parse_window(self.window_start, self.window_end)
+        if window is not None:
             self.log.info(
-                "Append Data to {} Dimension table".format(self.table))
-            redshift.run(self.sql)
+                f"Loading {self.table} for the window [{window[0]}, {window[1]})")
+
+        if self.scd_type:
+            merge_dimension(redshift, self.log, self.table,
+                            scope_sql(self.select_sql, self.staging_tables, context['ts_nodash'],
+                                      self.staging_schema),
+                            scd_type=self.scd_type,
+                            key_columns=self.key_columns,
+                            columns=self.columns,
+                            tracked_columns=self.tracked_columns,
+                            window=window,
+                            valid_from=window[0] if window is not None else context['execution_date'])
         else:
-            self.log.info("Clearing data from destination Redshift table")
-            redshift.run("DELETE FROM {}".format(self.table))
+            load_dimension(redshift, self.log, self.table,
+                           scope_sql(self.sql, self.staging_tables, context['ts_nodash'],
+                                     self.staging_schema),
+                           append_data=self.append_data,
+                           window=window,
+                           table_window_column=self.table_window_column)
 
-            self.log.info(
-                "Insert Data to {} Dimension table".format(self.table))
-            redshift.run(self.sql)
+
+def load_dimension(redshift, log, table, sql, append_data="", window=None, table_window_column=""):
+    """
+        Load a dimension table over a RedshiftSession, shared by LoadDimensionOperator and LoadDimensionsOperator.
+
+        :param redshift: the session to run the statements on.
+        :type redshift: RedshiftSession
+        :param log: logger of the calling operator.
+        :param table: Redshift dimension table name, where data will be inserted.
+        :type table: string
+        :param sql: Query representing data that will be inserted
+        :type sql: string
+        :param append_data: if True, we will Append data to the table.
+        :type append_data: Boolean
+        :param window: time window returned by helpers.parse_window, or None.
+        :type window: tuple
+        :param table_window_column: time column of the table, cleared for the window when data is not appended.
+        :type table_window_column: string
+    """
+    with redshift.transaction():
+        # clearing and inserting run in one transaction, readers never see an empty dimension.
+        if append_data == True:
+            log.info(
+                "Append Data to {} Dimension table".format(table))
+            redshift.run(render_window(sql, window))
+        else:
+            if window is not None:
+                if not table_window_column:
+                    raise ValueError(
+                        f"table_window_column is required to reload a window of {table}")
+
+                log.info(
+                    "Clearing the window from destination Redshift {} table".format(table))
+                redshift.run(window_delete_sql(
+                    table, table_window_column, window))
+            else:
+                log.info("Clearing data from destination Redshift {} table".format(table))
+                redshift.run("DELETE FROM {}".format(table))
+
+            log.info(
+                "Insert Data to {} Dimension table".format(table))
+            redshift.run(render_window(sql, window))
+
+
+def scd_merge_sql(table, select_sql, scd_type, key_columns, columns, tracked_columns=None, valid_from=None):
+    """
+        Statements merging the candidate rows of select_sql into a slowly changing dimension.
+
+        Candidate rows identical to the current version of their key are dropped first,
+        so the cost of the merge follows the churn of the dimension, not its size.
+
+        :return: list of statements, to run in one transaction.
+    """
+    if scd_type not in (1, 2):
+        raise ValueError(f"Unsupported slowly changing dimension type: {scd_type}")
+    if not key_columns or not columns:
+        raise ValueError(f"key_columns and columns are required to merge {table}")
+
+    stage = f"{table}_stage"
+    tracked_columns = tracked_columns or [column for column in columns if column not in key_columns]
+    # the names are quoted as in the statements of helpers.sql_builder, e.g. "level".
+    table = quote(table)
+    key_match = " AND ".join(f"{table}.{quote(column)} = {stage}.{quote(column)}" for column in key_columns)
+    unchanged = " AND ".join(
+        "({0}.{2} = {1}.{2} OR ({0}.{2} IS NULL AND {1}.{2} IS NULL))".format(table, stage, quote(column))
+        for column in tracked_columns)
+    column_list = ", ".join(quote(column) for column in columns)
+
+    statements = [f"CREATE TEMP TABLE {stage} AS {select_sql}"]
+
+    if scd_type == 1:
+        statements += [
+            f"DELETE FROM {stage} USING {table} WHERE {key_match} AND {unchanged}",
+            f"DELETE FROM {table} USING {stage} WHERE {key_match}",
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage}"
+        ]
+    else:
+        valid_from = valid_from.strftime('%Y-%m-%d %H:%M:%S')
+        statements += [
+            f"DELETE FROM {stage} USING {table} WHERE {key_match} AND {table}.is_current AND {unchanged}",
+            f"UPDATE {table} SET valid_to = '{valid_from}', is_current = FALSE "
+            f"FROM {stage} WHERE {key_match} AND {table}.is_current",
+            f"INSERT INTO {table} ({column_list}, valid_from, valid_to, is_current) "
+            f"SELECT {column_list}, '{valid_from}', NULL, TRUE FROM {stage}"
+        ]
+
+    statements.append(f"DROP TABLE {stage}")
+    return statements
+
+
+def merge_dimension(redshift, log, table, select_sql, scd_type, key_columns, columns,
+                    tracked_columns=None, window=None, valid_from=None):
+    """
+        Merge the rows of select_sql into a slowly changing dimension (type 1 or 2) over a RedshiftSession.
+
+        :param redshift: the session to run the statements on.
+        :type redshift: RedshiftSession
+        :param log: logger of the calling operator.
+        :param table: Redshift dimension table name.
+        :type table: string
+        :param select_sql: Query selecting one candidate row per key.
+        :type select_sql: string
+        :param scd_type: 1 overwrites changed rows, 2 keeps their history (valid_from, valid_to, is_current).
+        :type scd_type: int
+        :param key_columns: business key columns of the dimension.
+        :type key_columns: list
+        :param columns: every column selected by select_sql, keys included.
+        :type columns: list
+        :param tracked_columns: columns whose changes are applied, defaults to the non key columns.
+        :type tracked_columns: list
+        :param window: time window returned by helpers.parse_window, or None.
+        :type window: tuple
+        :param valid_from: start of validity of the new versions of a type 2 dimension.
+        :type valid_from: datetime
+    """
+    log.info(
+        "Merge Data into {} Dimension table (SCD type {}) on {}".format(table, scd_type, ", ".join(key_columns)))
+    with redshift.transaction():
+        redshift.run(scd_merge_sql(table, render_window(select_sql, window), int(scd_type),
+                                   key_columns, columns, tracked_columns, valid_from))
@@ -0,0 +1,124 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import parse_window, RedshiftConnectionPool, publish_query_stats, scope_sql
+from operators.load_dimension import load_dimension, merge_dimension
+
+
+class LoadDimensionsOperator(BaseOperator):
+
+    """
+        LoadDimensionsOperator is a custom operator that loads several dimension tables concurrently from one task.
+
+        Every dimension loads in its own transaction over a pooled connection: a failing dimension doesn't roll back
+        the others, the task fails once all of them are done, listing the failed ones.
+        The load time of every dimension is logged and returned (XCom).
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+            Default is 'redshift'
+
+        :param dimensions: the dimensions to load (templated).
+        :type dimensions: list
+        :args dimensions[i]: dictionary
+        :dictionary args: 'table': Redshift dimension table name, where data will be inserted.
+                          'sql': Query representing data that will be inserted.
+                          'append_data': if True, we will Append data to the table.
+                          'window_start', 'window_end': time window to load (optional).
+                          'table_window_column': time column of the table, cleared for the window (optional).
+                          'scd_type', 'select_sql', 'key_columns', 'columns', 'tracked_columns':
+                              slowly changing dimension merge, as for LoadDimensionOperator (optional).
+
+        :param max_workers: maximum number of dimensions loaded concurrently.
+        :type max_workers: int
+            Default is 4
+
+        :param staging_tables: staging tables read through their run-scoped copy (StageToRedshiftOperator with
+                               run_scoped=True), e.g. ['staging_events'].
+        :type staging_tables: list
+
+        :param staging_schema: external schema the staging_tables are read from instead (StageToSpectrumOperator).
+        :type staging_schema: string
+    """
+
+    ui_color = '#80BD9E'
+    # WLM query group of the statements of the operator.
+    query_group = 'transform'
+
+    template_fields = ("dimensions",)
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 dimensions=[],
+                 max_workers=4,
+                 staging_tables=[],
+                 staging_schema="",
+                 *args, **kwargs):
+
+        super(LoadDimensionsOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.dimensions = dimensions
+        self.max_workers = max_workers
+        self.staging_tables = staging_tables
+        self.staging_schema = staging_schema
+
+    def execute(self, context):
+        max_workers = max(min(self.max_workers, len(self.dimensions)), 1)
+
+        with RedshiftConnectionPool(self.redshift_conn_id, max_size=max_workers,
+                                    query_group=self.query_group) as pool:
+
+            def load(dimension):
+                started = time.monotonic()
+                try:
+                    window = parse_window(dimension.get('window_start'), dimension.get('window_end'))
+                    with pool.session() as redshift:
+                        first_statement = len(redshift.query_stats)
+                        if dimension.get('scd_type'):
+                            merge_dimension(redshift, self.log, dimension['table'],
+                                            scope_sql(dimension['select_sql'], self.staging_tables,
+                                                      context['ts_nodash'], self.staging_schema),
+                                            scd_type=dimension['scd_type'],
+                                            key_columns=dimension['key_columns'],
+                                            columns=dimension['columns'],
+                                            tracked_columns=dimension.get('tracked_columns'),
+                                            window=window,
+                                            valid_from=window[0] if window is not None else context['execution_date'])
+                        else:
+                            load_dimension(redshift, self.log, dimension['table'],
+                                           scope_sql(dimension['sql'], self.staging_tables,
+                                                     context['ts_nodash'], self.staging_schema),
+                                           append_data=dimension.get('append_data', ""),
+                                           window=window,
+                                           table_window_column=dimension.get('table_window_column', ""))
+                        for stats in redshift.query_stats[first_statement:]:
+                            stats['table'] = dimension['table']
+                    error = None
+                except Exception as e:
+                    self.log.exception(f"Loading {dimension['table']} Dimension table FAILED")
+                    error = str(e)
+
+                return {'table': dimension['table'],
+                        'seconds': round(time.monotonic() - started, 3),
+                        'passed': error is None,
+                        'error': error}
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                timings = list(executor.map(load, self.dimensions))
+
+            publish_query_stats(context, pool.collect_system_stats(), log=self.log)
+
+        for timing in timings:
+            self.log.info(
+                "{} Dimension table {} in {} seconds".format(
+                    timing['table'], 'loaded' if timing['passed'] else 'FAILED', timing['seconds']))
+
+        failed = [timing['table'] for timing in timings if not timing['passed']]
+        if failed:
+            raise ValueError(
+                "Loading Dimension tables FAILED for: {}".format(", ".join(failed)))
+
+        return timings
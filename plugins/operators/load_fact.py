@@ -1,6 +1,7 @@
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from helpers import (parse_window, render_window, window_delete_sql,
+                     merge_statements, RedshiftSession, publish_query_stats, scope_sql)
 
 
 class LoadFactOperator(BaseOperator):
@@ -21,9 +22,44 @@ class LoadFactOperator(BaseOperator):
 
         :param append_data: if True, we will Append data to the table.
         :type append_data: Boolean
+
+        :param merge_key: if set, the rows of select_sql are merged (upserted) on this key column instead of
+                          appending or clearing the whole table.
+        :type merge_key: string
+
+        :param select_sql: Query selecting the rows to merge, used when merge_key is set.
+        :type select_sql: string
+
+        :param merge_window_column: time column of the table, the merge only deletes the rows of the
+                                    time range covered by the new rows.
+        :type merge_window_column: string
+            Default is 'start_time'
+
+        :param window_start: start of the [window_start, window_end) time window to load (templated),
+                             injected as a predicate on the {events_window}/{songplays_window} placeholders.
+        :type window_start: string
+
+        :param window_end: end of the time window to load (templated).
+        :type window_end: string
+
+        :param table_window_column: time column of the table, when a window is given and data is not appended
+                                    only the rows of the window are cleared from the table.
+        :type table_window_column: string
+            Default is 'start_time'
+
+        :param staging_tables: staging tables read through their run-scoped copy (StageToRedshiftOperator with
+                               run_scoped=True), e.g. ['staging_events'].
+        :type staging_tables: list
+
+        :param staging_schema: external schema the staging_tables are read from instead (StageToSpectrumOperator).
+        :type staging_schema: string
     """
 
     ui_color = '#F98866'
+    # WLM query group of the statements of the operator.
+    query_group = 'transform'
+
+    template_fields = ("window_start", "window_end")
 
     @apply_defaults
     def __init__(self,
@@ -31,6 +67,14 @@ class LoadFactOperator(BaseOperator):
                  table="",
                  sql="",
                  append_data="",
+                 merge_key="",
+                 select_sql="",
+                 merge_window_column="start_time",
+                 window_start="",
+                 window_end="",
+                 table_window_column="start_time",
+                 staging_tables=[],
+                 staging_schema="",
                  *args, **kwargs):
 
         super(LoadFactOperator, self).__init__(*args, **kwargs)
@@ -38,19 +82,59 @@ class LoadFactOperator(BaseOperator):
         self.table = table
         self.sql = sql
         self.append_data = append_data
+        self.merge_key = merge_key
+        self.select_sql = select_sql
+        self.merge_window_column = merge_window_column
+        self.window_start = window_start
+        self.window_end = window_end
+        self.table_window_column = table_window_column
+        self.staging_tables = staging_tables
+        self.staging_schema = staging_schema
 
     def execute(self, context):
-        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            self.load(redshift, context)
 
-        if self.append_data == True:
-            self.log.info(
-                "Append Data to {} Fact table".format(self.table))
-            redshift.run(self.sql)
-        else:
-            self.log.info(
-                "Clearing data from destination Redshift {} table".format(self.table))
-            redshift.run("DELETE FROM {}".format(self.table))
+            publish_query_stats(context, redshift.collect_system_stats(), self.table, self.log)
 
+    def load(self, redshift, context):
+        """ Run the statements of the load on a RedshiftSession (or a helpers.StatementBatch), in one transaction. """
+        if self.merge_key and not self.select_sql:
+            raise ValueError(
+                f"select_sql is required to merge data into {self.table}")
+
+        window = parse_window(self.window_start, self.window_end)
+        if window is not None:
             self.log.info(
-                "Insert Data to {} Fact table".format(self.table))
-            redshift.run(self.sql)
+                f"Loading {self.table} for the window [{window[0]}, {window[1]})")
+        sql, select_sql = [scope_sql(statement, self.staging_tables, context['ts_nodash'], self.staging_schema)
+                           for statement in (self.sql, self.select_sql)]
+
+        with redshift.transaction():
+            # every statement of the load runs in one transaction, a retried run never duplicates rows.
+            if self.merge_key:
+                self.log.info(
+                    "Merge Data into {} Fact table on {}".format(self.table, self.merge_key))
+                redshift.run(merge_statements(self.table,
+                                              render_window(select_sql, window),
+                                              merge_key=self.merge_key,
+                                              window_column=self.merge_window_column))
+            elif self.append_data == True:
+                self.log.info(
+                    "Append Data to {} Fact table".format(self.table))
+                redshift.run(render_window(sql, window))
+            else:
+                if window is not None:
+                    # only the rows of the window are rewritten, the other windows can load concurrently.
+                    self.log.info(
+                        "Clearing the window from destination Redshift {} table".format(self.table))
+                    redshift.run(window_delete_sql(
+                        self.table, self.table_window_column, window))
+                else:
+                    self.log.info(
+                        "Clearing data from destination Redshift {} table".format(self.table))
+                    redshift.run("DELETE FROM {}".format(self.table))
+
+                self.log.info(
+                    "Insert Data to {} Fact table".format(self.table))
+                redshift.run(render_window(sql, window))
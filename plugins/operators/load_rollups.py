@@ -0,0 +1,114 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import (parse_window, rollups, rollup_refresh_sql, rollup_consistency_sql,
+                     RedshiftSession, publish_query_stats)
+
+
+class LoadRollupsOperator(BaseOperator):
+    """
+        LoadRollupsOperator is a custom operator that maintains the plays_* rollup tables of songplays
+        (helpers.rollups), so that the dashboards read small pre-aggregated tables instead of grouping songplays.
+
+        Only the periods overlapped by the time window of the run are recomputed, from the songplays the fact
+        load wrote for them; without a window, or with full_refresh, every period is rebuilt. Each rollup is then
+        checked against songplays: a rollup whose plays don't add up to the songplays count is rebuilt once,
+        and the task fails if it is still inconsistent.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+            Default is 'redshift'
+
+        :param tables: the rollups to maintain, every rollup of helpers.rollups by default.
+        :type tables: list
+
+        :param window_start: start of the [window_start, window_end) time window loaded by the run (templated).
+        :type window_start: string
+
+        :param window_end: end of the time window (templated).
+        :type window_end: string
+
+        :param full_refresh: if true, the rollups are rebuilt from the whole songplays table.
+        :type full_refresh: boolean
+            Default is 'False'
+
+        :param full_check: if true, the whole rollup is checked against songplays, not only the periods of the
+                           window: it also catches the windows that were never rolled up (e.g. loaded before the
+                           rollup existed), use it with a single active run.
+        :type full_check: boolean
+            Default is 'False'
+
+        :param rebuild_on_mismatch: if true, an inconsistent rollup is rebuilt before the task fails.
+        :type rebuild_on_mismatch: boolean
+            Default is 'True'
+    """
+
+    ui_color = '#80BD9E'
+    # WLM query group of the statements of the operator.
+    query_group = 'transform'
+
+    template_fields = ("window_start", "window_end")
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 tables=[],
+                 window_start="",
+                 window_end="",
+                 full_refresh=False,
+                 full_check=False,
+                 rebuild_on_mismatch=True,
+                 *args, **kwargs):
+
+        super(LoadRollupsOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.tables = tables or list(rollups)
+        self.window_start = window_start
+        self.window_end = window_end
+        self.full_refresh = full_refresh
+        self.full_check = full_check
+        self.rebuild_on_mismatch = rebuild_on_mismatch
+
+        unknown = [table for table in self.tables if table not in rollups]
+        if unknown:
+            raise ValueError(
+                "Unknown rollups: {}".format(", ".join(unknown)))
+
+    def execute(self, context):
+        window = None if self.full_refresh == True else parse_window(self.window_start, self.window_end)
+
+        results = {}
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            for table in self.tables:
+                if window is None:
+                    self.log.info(f"Rebuilding the {table} rollup from songplays")
+                else:
+                    self.log.info(f"Refreshing the {table} rollup for the window [{window[0]}, {window[1]})")
+                self._refresh(redshift, table, window)
+                mode = 'full_refresh' if window is None else 'incremental'
+
+                check_window = None if self.full_check == True else window
+                source_rows, rollup_rows = redshift.get_first(rollup_consistency_sql(table, check_window))
+                # a rebuilt rollup is not rebuilt again.
+                if source_rows != rollup_rows and self.rebuild_on_mismatch == True and window is not None:
+                    self.log.warning(
+                        f"{table} holds {rollup_rows} plays for {source_rows} songplays, rebuilding it")
+                    self._refresh(redshift, table, None)
+                    mode = 'full_refresh'
+                    source_rows, rollup_rows = redshift.get_first(rollup_consistency_sql(table, check_window))
+
+                results[table] = {'mode': mode, 'songplays': source_rows, 'plays': rollup_rows,
+                                  'consistent': source_rows == rollup_rows}
+                self.log.info(f"{table} ({mode}): {rollup_rows} plays for {source_rows} songplays")
+
+            publish_query_stats(context, redshift.collect_system_stats(), log=self.log)
+
+        inconsistent = [table for table, result in results.items() if not result['consistent']]
+        if inconsistent:
+            raise ValueError(
+                "Rollups inconsistent with songplays: {}".format(", ".join(inconsistent)))
+        return results
+
+    def _refresh(self, redshift, table, window):
+        """ Recompute the periods of the window, every period without one, in one transaction. """
+        with redshift.transaction():
+            redshift.run(rollup_refresh_sql(table, window))
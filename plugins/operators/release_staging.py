@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from airflow.models import BaseOperator, DagRun
+from airflow.utils import timezone
+from airflow.utils.decorators import apply_defaults
+from airflow.utils.state import State
+from helpers import (release_modes, run_tables_sql, run_table_name, run_table_date,
+                     release_run_table_sql, stale_run_tables, RedshiftSession, publish_query_stats)
+
+
+class ReleaseStagingTablesOperator(BaseOperator):
+    """
+        ReleaseStagingTablesOperator is a custom operator that releases the run-scoped staging tables
+        of a DAG run (StageToRedshiftOperator with run_scoped=True) once its loads are done.
+
+        It runs once every upstream task is done, whether they succeeded or not (trigger_rule 'all_done'),
+        and also drops the run-scoped tables left over by older runs that are no longer running.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+            Default is 'redshift'
+
+        :param tables: the shared staging tables whose run-scoped copies are released.
+        :type tables: list
+
+        :param mode: 'drop' the run-scoped tables, 'append' their rows to the shared tables (ALTER TABLE APPEND),
+                     or 'swap' them with the shared tables.
+        :type mode: string
+            Default is 'drop'
+
+        :param stale_after_hours: the run-scoped tables of the runs older than this many hours before
+                                  the execution date are dropped, unless their DAG run is still running
+                                  (e.g. an earlier batch of a parallel backfill).
+        :type stale_after_hours: int
+            Default is 24
+    """
+
+    ui_color = '#EDEDED'
+    # WLM query group of the statements of the operator.
+    query_group = 'copy'
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 tables=[],
+                 mode="drop",
+                 stale_after_hours=24,
+                 *args, **kwargs):
+
+        kwargs.setdefault('trigger_rule', 'all_done')
+        super(ReleaseStagingTablesOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.tables = tables
+        self.mode = mode
+        self.stale_after_hours = stale_after_hours
+
+        if self.mode not in release_modes:
+            raise ValueError(
+                "mode must be one of {}, not {}".format(", ".join(release_modes), self.mode))
+
+    def execute(self, context):
+        stale_before = context['execution_date'].astimezone(timezone.utc).replace(tzinfo=None) - \
+            timedelta(hours=self.stale_after_hours)
+
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            for table in self.tables:
+                run_table = run_table_name(table, context['ts_nodash'])
+                names = [name for name, in redshift.get_records(run_tables_sql, (f"{table}_%",))]
+
+                if run_table not in names:
+                    self.log.info(f"No {run_table} table to release")
+                else:
+                    self.log.info(f"Releasing {run_table} ({self.mode})")
+                    for statements, in_transaction in release_run_table_sql(table, run_table, self.mode):
+                        if in_transaction:
+                            with redshift.transaction():
+                                redshift.run(statements)
+                        else:
+                            redshift.run(statements)
+
+                for stale_table in stale_run_tables(table, names, stale_before):
+                    if self._is_running(context, run_table_date(table, stale_table)):
+                        self.log.info(f"Keeping {stale_table}, its run is still running")
+                        continue
+                    self.log.info(f"Dropping {stale_table}, left over by an older run")
+                    redshift.run(f"DROP TABLE IF EXISTS {stale_table}")
+
+            publish_query_stats(context, redshift.collect_system_stats(), log=self.log)
+
+    def _is_running(self, context, execution_date):
+        """ True if the DAG run of a run-scoped table (its UTC execution date) is still running. """
+        return len(DagRun.find(dag_id=context['dag'].dag_id,
+                               execution_date=execution_date.replace(tzinfo=timezone.utc),
+                               state=State.RUNNING)) > 0
@@ -1,9 +1,13 @@
-from airflow.contrib.hooks.aws_hook import AwsHook
-# from airflow.providers.amazon.aws.hooks.base_aws import AwsBaseHook
-from airflow.hooks.postgres_hook import PostgresHook
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
-from dateutil import parser
+from helpers import (load_watermark, save_watermark, next_watermark, list_new_objects,
+                     balance_objects, slice_metrics, coalesce_objects,
+                     build_manifest, upload_manifest, CopyFormat, RedshiftSession,
+                     publish_query_stats, staging_columns, parse_json_paths,
+                     validate_staging_object, run_table_name, create_run_table_sql)
 
 
 class StageToRedshiftOperator(BaseOperator):
@@ -43,9 +47,75 @@ class StageToRedshiftOperator(BaseOperator):
 
         :param execution_date: Logical execution date of DAG run (templated -> loaded at run time)
         :type execution_date: string
+
+        :param incremental: If true, only the S3 objects written after the table high-water mark are staged,
+                            through a COPY manifest, and the high-water mark is moved forward after the COPY.
+        :type incremental: boolean
+            Default is 'False'
+
+        :param manifest_bucket: Amazon S3 Bucket name where the COPY manifests are written (required when
+                                incremental or use_manifest).
+        :type manifest_bucket: string
+
+        :param manifest_prefix: Amazon S3 key folder inside manifest_bucket where the COPY manifests are written.
+        :type manifest_prefix: string
+            Default is 'manifests'
+
+        :param use_manifest: If true, the S3 prefix is listed and COPY runs against a manifest instead of the prefix,
+                             the file count and byte count per slice are pushed as the 'slice_metrics' XCom.
+        :type use_manifest: boolean
+            Default is 'False'
+
+        :param coalesce_small_files: If true, the listed objects are coalesced into gzip'd batches of similar size,
+                                     a multiple of the number of slices, before the COPY.
+        :type coalesce_small_files: boolean
+            Default is 'False'
+
+        :param max_batch_bytes: upper bound of uncompressed bytes per coalesced batch.
+        :type max_batch_bytes: int
+            Default is 128 MB
+
+        :param copy_format: format of the input files (JSON/CSV with GZIP/BZIP2/ZSTD compression, PARQUET or ORC)
+                            and COPY controls (COMPUPDATE, STATUPDATE, MAXERROR), see helpers.CopyFormat.
+                            When not set, the files are loaded as JSON with format_type and time_format.
+        :type copy_format: CopyFormat or dictionary
+
+        :param validate_records: If true, the listed objects are streamed and every record is checked against the
+                                 column types of the staging table before the COPY. Invalid records are written to
+                                 a quarantine folder next to the manifest, only the clean records are copied.
+        :type validate_records: boolean
+            Default is 'False'
+
+        :param validation_workers: number of objects validated concurrently.
+        :type validation_workers: int
+            Default is 4
+
+        :param run_scoped: If true, the data is staged into a copy of the table created for the DAG run
+                           (<table>_<ts_nodash>, see helpers.run_tables) instead of clearing the shared table,
+                           so that DAG runs can overlap. ReleaseStagingTablesOperator releases it.
+        :type run_scoped: boolean
+            Default is 'False'
+
+        :param watermark_namespace: the tenant of the incremental high-water mark, so that tenants staging
+                                    from different S3 sources don't share it.
+        :type watermark_namespace: string
+
+        :param watermark_lookback_minutes: how far before the high-water mark the S3 objects are listed again,
+                                           skipping the keys already staged: a multipart upload is dated by its
+                                           start, so it must exceed the longest upload of the source.
+        :type watermark_lookback_minutes: integer
+            Default is 60
+
+        :param month_folders: If true, the objects of the prefix are in <year>/<month>/ folders written during their
+                              month (e.g. log_data): an incremental load only lists the folders of the months
+                              since the high-water mark, instead of the whole prefix.
+        :type month_folders: boolean
+            Default is 'False'
     """
 
     ui_color = '#358140'
+    # WLM query group of the statements of the operator.
+    query_group = 'copy'
 
     template_fields = ("s3_key", "execution_date")
 
@@ -54,9 +124,8 @@ class StageToRedshiftOperator(BaseOperator):
         FROM '{}'
         ACCESS_KEY_ID '{}'
         SECRET_ACCESS_KEY '{}'
-        TIMEFORMAT AS '{}'
         REGION '{}'
-        FORMAT AS JSON '{}' 
+        {}
     """
 
     @apply_defaults
@@ -71,6 +140,19 @@ class StageToRedshiftOperator(BaseOperator):
                  format_type="",
                  use_partitioning="",
                  execution_date="",
+                 incremental=False,
+                 manifest_bucket="",
+                 manifest_prefix="manifests",
+                 use_manifest=False,
+                 coalesce_small_files=False,
+                 max_batch_bytes=128 * 1024 * 1024,
+                 copy_format=None,
+                 validate_records=False,
+                 validation_workers=4,
+                 run_scoped=False,
+                 watermark_namespace="",
+                 watermark_lookback_minutes=60,
+                 month_folders=False,
                  *args, **kwargs):
         """ __init__ is an OOP function in python that intialize the object behviour -> (constructor). """
 
@@ -85,43 +167,245 @@ class StageToRedshiftOperator(BaseOperator):
         self.format_type = format_type
         self.use_partitioning = use_partitioning
         self.execution_date = execution_date
+        self.incremental = incremental
+        self.manifest_bucket = manifest_bucket
+        self.manifest_prefix = manifest_prefix
+        self.use_manifest = use_manifest
+        self.coalesce_small_files = coalesce_small_files
+        self.max_batch_bytes = max_batch_bytes
+        self.validate_records = validate_records
+        self.validation_workers = validation_workers
+        self.run_scoped = run_scoped
+        self.watermark_namespace = watermark_namespace
+        self.watermark_lookback = timedelta(minutes=watermark_lookback_minutes)
+        self.month_folders = month_folders
+
+        if copy_format is None:
+            # the original JSON staging: format_type is 'auto' or the JSONPaths file.
+            copy_format = CopyFormat('json',
+                                     json_paths=format_type or 'auto',
+                                     time_format=time_format or None)
+        self.copy_format = CopyFormat.from_value(copy_format)
+
+        if self.coalesce_small_files == True and \
+                (self.copy_format.is_columnar or self.copy_format.compression):
+            raise ValueError(
+                "coalesce_small_files only supports uncompressed JSON or CSV files")
+
+        if self.validate_records == True and \
+                (self.copy_format.data_format != 'json' or self.copy_format.compression == 'zstd'):
+            raise ValueError(
+                "validate_records only supports JSON files, uncompressed or compressed with GZIP or BZIP2")
 
     def execute(self, context):
+        staged_through_manifest = self.incremental == True or self.use_manifest == True or \
+            self.validate_records == True
+        if staged_through_manifest and not self.manifest_bucket:
+            raise ValueError(
+                f"manifest_bucket is required to stage {self.table} through a manifest")
+
+        # the hooks are imported when the task runs, parsing the DAG doesn't load boto3.
+        from airflow.contrib.hooks.aws_hook import AwsHook
+        # from airflow.providers.amazon.aws.hooks.base_aws import AwsBaseHook
+        from dateutil import parser
+
         aws_hook = AwsHook(self.aws_credentials_id)
         credentials = aws_hook.get_credentials()
-        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+
+        staging_table = self.table
+        if self.run_scoped == True:
+            staging_table = run_table_name(self.table, context['ts_nodash'])
+            self.log.info(f"Staging into the run-scoped table {staging_table}")
+
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            execution_date = parser.parse(self.execution_date)
+            self.log.info(f"Execution Date: {execution_date}")
+            self.log.info(f"Execution Year: {execution_date.year}")
+            self.log.info(f"Execution Month: {execution_date.month}")
+            self.log.info(f"Use Partitioning: {self.use_partitioning}")
+
+            rendered_key = self.s3_key.format(**context)
+
+            if self.use_partitioning == True:
+                # If we are using partitioning, setup S3 path to use year and month of execution_date
+                s3_path = "s3://{}/{}/{}/{}".format(
+                    self.s3_bucket, rendered_key, execution_date.year, execution_date.month)
+            else:
+                s3_path = "s3://{}/{}".format(self.s3_bucket, rendered_key)
+
+            copy_format = self.copy_format
+            use_manifest = False
+            new_objects = []
+            if staged_through_manifest:
+                s3_path, new_objects = self._stage_manifest(
+                    redshift, s3_path, context)
+                if s3_path is None:
+                    self._clear(redshift, staging_table)
+                    publish_query_stats(context, redshift.collect_system_stats(), self.table, self.log)
+                    if self.incremental == True and new_objects:
+                        # every record was quarantined, the objects are not staged again.
+                        save_watermark(self.table, self._next_watermark(new_objects), self.watermark_namespace)
+                    return
+                use_manifest = True
+                if self.validate_records == True:
+                    # the clean records are written uncompressed.
+                    copy_format = copy_format.with_compression(None)
+                if self.coalesce_small_files == True:
+                    copy_format = copy_format.with_compression('gzip')
+
+            # create the copy command for the staging events table.
+            formatted_sql = StageToRedshiftOperator.copy_sql.format(
+                staging_table,  # table name
+                s3_path,
+                credentials.access_key,
+                credentials.secret_key,
+                self.region,
+                copy_format.copy_options(manifest=use_manifest)
+            )
+
+            self._copy(redshift, staging_table, formatted_sql, context, new_objects)
+
+    def _copy(self, redshift, staging_table, copy_sql, context, new_objects):
+        """
+            Clear the staging table and run the COPY, then advance the watermark of an incremental load.
+
+            :param new_objects: the objects listed by an incremental load, staged into the next watermark.
+        """
+        # clearing and copying run in one transaction, readers never see an empty staging table.
+        with redshift.transaction():
+            self._clear(redshift, staging_table)
+
+            self.log.info(
+                "Copying data from S3 to {} table in Redshift".format(staging_table))
+            # execute the 'formatted_sql' command on Redshift.
+            redshift.run(copy_sql)
+
+        publish_query_stats(context, redshift.collect_system_stats(), self.table, self.log)
+
+        if self.incremental == True:
+            save_watermark(self.table, self._next_watermark(new_objects), self.watermark_namespace)
+
+    def _next_watermark(self, new_objects):
+        """ The high-water mark once the listed objects are staged, with the keys staged within the lookback. """
+        return next_watermark(new_objects, load_watermark(self.table, self.watermark_namespace),
+                              self.watermark_lookback)
+
+    def _clear(self, redshift, staging_table):
+        """ Empty the staging table: a new run-scoped table, or the rows of the shared table deleted. """
+        if self.run_scoped == True:
+            self.log.info(
+                "Creating the {} Redshift table like {}".format(staging_table, self.table))
+            redshift.run(create_run_table_sql(self.table, staging_table))
+        else:
+            self.log.info(
+                "Clearing data from {} Redshift table".format(self.table))
+            redshift.run("DELETE FROM {}".format(self.table))
+
+    def _s3_hook(self):
+        from airflow.hooks.S3_hook import S3Hook
+
+        return S3Hook(aws_conn_id=self.aws_credentials_id)
+
+    def _stage_manifest(self, redshift, s3_path, context):
+        """
+            List the S3 objects to stage, balance them across the cluster slices and write the COPY manifest.
+
+            :return: the manifest s3:// url and the listed objects, or None as url when there is nothing to stage.
+        """
+        s3_hook = self._s3_hook()
+        s3_prefix = s3_path[len("s3://{}/".format(self.s3_bucket)):]
+
+        watermark = None
+        if self.incremental == True:
+            # stage only the objects written since the last run.
+            watermark = load_watermark(self.table, self.watermark_namespace)
+            if watermark is not None:
+                self.log.info(f"High-water mark of {self.table}: {watermark['key']} "
+                              f"({watermark['last_modified']}), listing from {self.watermark_lookback} before it")
+
+        new_objects = list_new_objects(
+            s3_hook, self.s3_bucket, s3_prefix, watermark, self.watermark_lookback,
+            month_folders=self.month_folders == True)
+        if not new_objects:
+            self.log.info(
+                f"No new S3 objects under {s3_path}, nothing to stage into {self.table}")
+            return None, []
+
+        num_slices = redshift.get_first("SELECT COUNT(*) FROM stv_slices")[0]
+        manifest_folder = "{}/{}/{}".format(
+            self.manifest_prefix, self.table, context['ts_nodash'])
+
+        objects = new_objects
+        if self.validate_records == True:
+            objects = self._validate_objects(objects, "{}/validation".format(manifest_folder), context)
+            if not objects:
+                self.log.info(
+                    f"No valid records under {s3_path}, nothing to stage into {self.table}")
+                return None, new_objects
+
+        if self.coalesce_small_files == True:
+            self.log.info(
+                f"Coalescing {len(objects)} S3 objects into gzip'd batches for {num_slices} slices")
+            objects = coalesce_objects(s3_hook, self.s3_bucket, objects, num_slices,
+                                       self.max_batch_bytes, self.manifest_bucket,
+                                       "{}/batches".format(manifest_folder),
+                                       header_lines=int(self.copy_format.ignore_header or 0),
+                                       data_format=self.copy_format.data_format)
+
+        metrics = slice_metrics(balance_objects(objects, num_slices))
+        for slice_metric in metrics:
+            self.log.info(
+                "Slice {slice}: {files} files, {bytes} bytes".format(**slice_metric))
+        context['ti'].xcom_push(key='slice_metrics', value=metrics)
+
+        self.log.info(
+            f"Staging {len(objects)} S3 objects into {self.table} through a manifest")
+        manifest_path = upload_manifest(s3_hook,
+                                        build_manifest(self.s3_bucket, objects),
+                                        self.manifest_bucket,
+                                        "{}.manifest".format(manifest_folder))
+        return manifest_path, new_objects
+
+    def _validate_objects(self, objects, target_prefix, context):
+        """
+            Validate the records of the listed objects concurrently, quarantine the invalid ones
+            and push the counts as the 'record_validation' XCom.
+
+            :return: the objects holding the clean records.
+        """
+        if self.table not in staging_columns:
+            raise ValueError(f"No column types to validate {self.table} against")
+        columns = staging_columns[self.table]
+
+        keys = None
+        if self.copy_format.json_paths != 'auto':
+            # the JSONPaths file maps the JSON keys to the columns, in order.
+            paths_bucket, _, paths_key = self.copy_format.json_paths[len("s3://"):].partition('/')
+            keys = parse_json_paths(self._s3_hook().read_key(paths_key, bucket_name=paths_bucket))
+
+        def validate(obj):
+            # boto3 sessions are not thread safe, every object gets its own hook.
+            return validate_staging_object(self._s3_hook(), self.s3_bucket, obj,
+                                           columns, keys, self.manifest_bucket, target_prefix,
+                                           compression=self.copy_format.compression)
 
         self.log.info(
-            "Clearing data from {} Redshift table".format(self.table))
-        redshift.run("DELETE FROM {}".format(self.table))
+            f"Validating {len(objects)} S3 objects against the {self.table} columns")
+
+        with ThreadPoolExecutor(max_workers=max(self.validation_workers, 1)) as executor:
+            results = list(executor.map(validate, objects))
 
-        execution_date = parser.parse(self.execution_date)
-        self.log.info(f"Execution Date: {execution_date}")
-        self.log.info(f"Execution Year: {execution_date.year}")
-        self.log.info(f"Execution Month: {execution_date.month}")
-        self.log.info(f"Use Partitioning: {self.use_partitioning}")
+        for result in results:
+            if result['invalid']:
+                self.log.warning(
+                    "{invalid} invalid records of {key} quarantined to {quarantine}".format(**result))
 
+        summary = {'valid': sum(result['valid'] for result in results),
+                   'invalid': sum(result['invalid'] for result in results),
+                   'quarantine': ["s3://{}/{}".format(self.manifest_bucket, result['quarantine'])
+                                  for result in results if result['quarantine']]}
         self.log.info(
-            "Copying data from S3 to {} table in Redshift".format(self.table))
-        rendered_key = self.s3_key.format(**context)
+            "{valid} valid and {invalid} invalid records in {table}".format(table=self.table, **summary))
+        context['ti'].xcom_push(key='record_validation', value=summary)
 
-        if self.use_partitioning == True:
-            # If we are using partitioning, setup S3 path to use year and month of execution_date
-            s3_path = "s3://{}/{}/{}/{}".format(
-                self.s3_bucket, rendered_key, execution_date.year, execution_date.month)
-        else:
-            s3_path = "s3://{}/{}".format(self.s3_bucket, rendered_key)
-
-        # create the copy command for the staging events table.
-        formatted_sql = StageToRedshiftOperator.copy_sql.format(
-            self.table,  # table name
-            s3_path,
-            credentials.access_key,
-            credentials.secret_key,
-            self.time_format,
-            self.region,
-            self.format_type
-        )
-
-        # execute the 'formatted_sql' command on Redshift.
-        redshift.run(formatted_sql)
+        return [result['clean'] for result in results if result['clean']]
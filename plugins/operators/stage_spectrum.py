@@ -0,0 +1,116 @@
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from helpers import (parse_window, window_months, external_schema_sql, external_table_sql,
+                     external_tables_sql, add_partition_sql, RedshiftSession, publish_query_stats)
+
+
+class StageToSpectrumOperator(BaseOperator):
+    """
+
+        StageToSpectrumOperator is a custom operator that registers an S3 prefix as a Redshift Spectrum external
+        table, the sibling of StageToRedshiftOperator when the loads read the files in place instead of a COPY.
+
+        The loaders read the external table with staging_schema set; a partitioned table only lists the
+        partitions of their time window.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+            Default is 'redshift'
+
+        :param table: Redshift staging table name the external table mirrors (its columns).
+        :type table: string
+
+        :param s3_bucket: Amazon S3 Bucket name where we read the staging data from.
+        :type s3_bucket: string
+
+        :param s3_key: Amazon S3 key folder that exist inside the S3 bucket that conatians that staging data we need.
+        :type s3_key: string
+
+        :param external_schema: the external schema of the table.
+        :type external_schema: string
+            Default is 'spectrum'
+
+        :param external_database: AWS Glue data catalog database of the external schema, created if missing.
+        :type external_database: string
+            Default is 'sparkify'
+
+        :param iam_role: ARN of the IAM role Redshift assumes to read the catalog and the S3 files.
+        :type iam_role: string
+
+        :param use_partitioning: If true, the table is partitioned on the <year>/<month> folders of the S3 key,
+                                 and the months of the window are registered as partitions.
+        :type use_partitioning: boolean
+            Default is 'False'
+
+        :param window_start: start of the [window_start, window_end) time window whose partitions are registered
+                             (templated).
+        :type window_start: string
+
+        :param window_end: end of the time window (templated).
+        :type window_end: string
+    """
+
+    ui_color = '#358140'
+    # WLM query group of the statements of the operator.
+    query_group = 'copy'
+
+    template_fields = ("s3_key", "window_start", "window_end")
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 table="",
+                 s3_bucket="",
+                 s3_key="",
+                 external_schema="spectrum",
+                 external_database="sparkify",
+                 iam_role="",
+                 use_partitioning=False,
+                 window_start="",
+                 window_end="",
+                 *args, **kwargs):
+
+        super(StageToSpectrumOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.table = table
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self.external_schema = external_schema
+        self.external_database = external_database
+        self.iam_role = iam_role
+        self.use_partitioning = use_partitioning
+        self.window_start = window_start
+        self.window_end = window_end
+
+    def execute(self, context):
+        if not self.iam_role:
+            raise ValueError(
+                f"iam_role is required to register {self.table} as an external table")
+
+        window = parse_window(self.window_start, self.window_end)
+        if self.use_partitioning == True and window is None:
+            raise ValueError(
+                f"window_start and window_end are required to register the partitions of {self.table}")
+
+        location = "s3://{}/{}".format(self.s3_bucket, self.s3_key.format(**context))
+
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            # external DDL can't run in a transaction block, every statement autocommits.
+            redshift.run(external_schema_sql(self.external_schema, self.external_database, self.iam_role))
+
+            external_tables = [name for name, in redshift.get_records(external_tables_sql, (self.external_schema,))]
+            if self.table not in external_tables:
+                self.log.info(
+                    f"Creating the external table {self.external_schema}.{self.table} over {location}")
+                redshift.run(external_table_sql(self.table, self.external_schema, location,
+                                                partitioned=self.use_partitioning == True))
+
+            partitions = window_months(window) if self.use_partitioning == True else []
+            for year, month in partitions:
+                self.log.info(
+                    f"Registering the {year}/{month} partition of {self.external_schema}.{self.table}")
+                redshift.run(add_partition_sql(self.table, self.external_schema, location, year, month))
+
+            publish_query_stats(context, redshift.collect_system_stats(), self.table, self.log)
+
+        return partitions
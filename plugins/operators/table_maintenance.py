@@ -0,0 +1,111 @@
+from airflow.exceptions import AirflowSkipException
+from airflow.models import BaseOperator
+from airflow.utils import timezone
+from airflow.utils.decorators import apply_defaults
+from helpers import (star_schema, table_health, plan_maintenance, active_queries,
+                     RedshiftSession, publish_query_stats)
+
+
+class RedshiftMaintenanceOperator(BaseOperator):
+    """
+        RedshiftMaintenanceOperator is a custom operator that vacuums and analyzes the tables whose health
+        metrics in SVV_TABLE_INFO are past the thresholds.
+
+        The statements run one at a time, outside of any transaction (VACUUM can't run in one). Before each of
+        them the operator checks the loads running on the cluster (STV_INFLIGHT queries of the load query groups,
+        of any DAG run or tenant): if there are some, the rest of the maintenance is skipped until the next run,
+        rather than holding a worker and a maintenance pool slot while they finish.
+
+        :param redshift_conn_id: Connection id of the Redshift connection to use
+        :type redshift_conn_id: string
+            Default is 'redshift'
+
+        :param tables: tables to maintain.
+        :type tables: list
+            Default is every table of the star schema
+
+        :param unsorted_threshold: percentage of unsorted rows above which VACUUM SORT ONLY runs.
+        :type unsorted_threshold: float
+            Default is 10
+
+        :param stats_off_threshold: staleness percentage of the statistics above which ANALYZE PREDICATE COLUMNS runs.
+        :type stats_off_threshold: float
+            Default is 10
+
+        :param deleted_threshold: percentage of rows marked for deletion (tbl_rows vs estimated_visible_rows)
+                                  above which VACUUM DELETE ONLY runs.
+        :type deleted_threshold: float
+            Default is 5
+
+        :param maintenance_hours: UTC hours the maintenance may run in, e.g. range(1, 5); the task is skipped
+                                  outside of them, so that vacuums don't compete with the heavy loads.
+        :type maintenance_hours: list
+            Default is every hour
+
+        :param load_query_groups: WLM query groups of the loads the statements never run next to.
+        :type load_query_groups: list
+            Default is ['copy', 'transform']
+    """
+
+    ui_color = '#C5CAE9'
+    # WLM query group of the statements of the operator.
+    query_group = 'maintenance'
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 tables=None,
+                 unsorted_threshold=10.0,
+                 stats_off_threshold=10.0,
+                 deleted_threshold=5.0,
+                 maintenance_hours=None,
+                 load_query_groups=('copy', 'transform'),
+                 *args, **kwargs):
+
+        super(RedshiftMaintenanceOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.tables = tables or list(star_schema)
+        self.unsorted_threshold = unsorted_threshold
+        self.stats_off_threshold = stats_off_threshold
+        self.deleted_threshold = deleted_threshold
+        self.maintenance_hours = maintenance_hours
+        self.load_query_groups = list(load_query_groups)
+
+    def execute(self, context):
+        current_hour = timezone.utcnow().hour
+        if self.maintenance_hours is not None and current_hour not in self.maintenance_hours:
+            raise AirflowSkipException(
+                f"{current_hour}h UTC is outside of the maintenance hours {list(self.maintenance_hours)}")
+
+        with RedshiftSession(self.redshift_conn_id, query_group=self.query_group) as redshift:
+            health = table_health(redshift.get_records, self.tables)
+            for table, metrics in sorted(health.items()):
+                self.log.info(
+                    "{}: {unsorted}% unsorted, {stats_off}% stats off, {deleted_pct}% deleted of {tbl_rows} rows"
+                    .format(table, **metrics))
+
+            plan = plan_maintenance(health,
+                                    unsorted_threshold=self.unsorted_threshold,
+                                    stats_off_threshold=self.stats_off_threshold,
+                                    deleted_threshold=self.deleted_threshold)
+            if not plan:
+                self.log.info("Every table is within the maintenance thresholds")
+
+            remaining = len(plan)
+            loads = {}
+            for step in plan:
+                loads = active_queries(redshift.get_records, self.load_query_groups)
+                if loads:
+                    break
+                self.log.info("{operation} on {table} ({reason})".format(**step))
+                redshift.run(step['sql'])
+                remaining -= 1
+
+            publish_query_stats(context, redshift.collect_system_stats(), log=self.log)
+
+        if remaining:
+            raise AirflowSkipException(
+                "Loads running ({}), {} of {} maintenance statements skipped until the next run".format(
+                    ", ".join(f"{count} {query_group}" for query_group, count in sorted(loads.items())),
+                    remaining, len(plan)))
+        return plan
@@ -0,0 +1,2 @@
+# The triggers are imported by the deferrable operators when they defer, and by the triggerer (Airflow 2.2+)
+# from the classpath they serialize to: importing this package doesn't load Airflow 2.
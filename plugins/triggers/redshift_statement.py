@@ -0,0 +1,65 @@
+import asyncio
+from functools import partial
+
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+from helpers.redshift_data import (data_api_client, finished_statuses, failed_statuses,
+                                   batch_error, batch_query_stats)
+
+
+class RedshiftStatementTrigger(BaseTrigger):
+    """
+        RedshiftStatementTrigger polls a statement submitted through the Redshift Data API until it stops running,
+        in the asyncio loop of the triggerer: hundreds of statements are awaited without holding a worker slot.
+
+        The event holds the 'status' ('success' or 'error'), the 'error' message of a failed statement and the
+        'query_stats' of its sub-statements.
+
+        :param statement_id: id returned by batch_execute_statement.
+        :type statement_id: string
+
+        :param aws_conn_id: AWS connection of the Data API client.
+        :type aws_conn_id: string
+
+        :param region_name: AWS region of the cluster.
+        :type region_name: string
+
+        :param query_group: WLM query group the statements were routed to, reported in the statistics.
+        :type query_group: string
+
+        :param poll_interval: seconds between two describe_statement calls.
+        :type poll_interval: float
+            Default is 15
+    """
+
+    def __init__(self, statement_id, aws_conn_id, region_name=None, query_group=None, poll_interval=15):
+        super(RedshiftStatementTrigger, self).__init__()
+        self.statement_id = statement_id
+        self.aws_conn_id = aws_conn_id
+        self.region_name = region_name
+        self.query_group = query_group
+        self.poll_interval = poll_interval
+
+    def serialize(self):
+        return ("triggers.redshift_statement.RedshiftStatementTrigger",
+                {'statement_id': self.statement_id,
+                 'aws_conn_id': self.aws_conn_id,
+                 'region_name': self.region_name,
+                 'query_group': self.query_group,
+                 'poll_interval': self.poll_interval})
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        # boto3 is blocking: the client is created and called in the default executor, not in the event loop.
+        client = await loop.run_in_executor(None, data_api_client, self.aws_conn_id, self.region_name)
+        while True:
+            description = await loop.run_in_executor(
+                None, partial(client.describe_statement, Id=self.statement_id))
+            if description['Status'] in finished_statuses + failed_statuses:
+                break
+            self.log.info(f"Statement {self.statement_id} is {description['Status']}")
+            await asyncio.sleep(self.poll_interval)
+
+        yield TriggerEvent({'statement_id': self.statement_id,
+                            'status': 'error' if description['Status'] in failed_statuses else 'success',
+                            'error': batch_error(description),
+                            'query_stats': batch_query_stats(description, self.query_group)})
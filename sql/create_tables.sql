@@ -1,83 +1,154 @@
 CREATE TABLE IF NOT EXISTS public.artists (
-	artistid varchar(256) NOT NULL,
-	name varchar(256),
-	location varchar(256),
-	lattitude numeric(18,0),
-	longitude numeric(18,0)
-);
+	artistid varchar(256) NOT NULL ENCODE RAW,
+	name varchar(256) ENCODE ZSTD,
+	location varchar(256) ENCODE ZSTD,
+	lattitude numeric(18,0) ENCODE AZ64,
+	longitude numeric(18,0) ENCODE AZ64
+)
+DISTSTYLE ALL
+SORTKEY (artistid);
+
+CREATE TABLE IF NOT EXISTS public.plays_daily_by_artist (
+	play_date date NOT NULL ENCODE RAW,
+	artistid varchar(256) ENCODE ZSTD,
+	plays int8 NOT NULL ENCODE AZ64
+)
+DISTSTYLE EVEN
+SORTKEY (play_date);
+
+CREATE TABLE IF NOT EXISTS public.plays_daily_by_song (
+	play_date date NOT NULL ENCODE RAW,
+	songid varchar(256) ENCODE ZSTD,
+	artistid varchar(256) ENCODE ZSTD,
+	plays int8 NOT NULL ENCODE AZ64
+)
+DISTSTYLE EVEN
+SORTKEY (play_date);
+
+CREATE TABLE IF NOT EXISTS public.plays_hourly_by_level (
+	play_hour timestamp NOT NULL ENCODE RAW,
+	"level" varchar(256) ENCODE ZSTD,
+	plays int8 NOT NULL ENCODE AZ64
+)
+DISTSTYLE ALL
+SORTKEY (play_hour);
+
+CREATE TABLE IF NOT EXISTS public.plays_hourly_by_location (
+	play_hour timestamp NOT NULL ENCODE RAW,
+	location varchar(256) ENCODE ZSTD,
+	plays int8 NOT NULL ENCODE AZ64
+)
+DISTSTYLE EVEN
+SORTKEY (play_hour);
 
 CREATE TABLE IF NOT EXISTS public.songplays (
-	playid varchar(32) NOT NULL,
-	start_time timestamp NOT NULL,
-	userid int4 NOT NULL,
-	"level" varchar(256),
-	songid varchar(256),
-	artistid varchar(256),
-	sessionid int4,
-	location varchar(256),
-	user_agent varchar(256),
-	CONSTRAINT songplays_pkey PRIMARY KEY (playid)
-);
+	playid varchar(32) NOT NULL ENCODE ZSTD,
+	start_time timestamp NOT NULL ENCODE RAW,
+	userid int4 NOT NULL ENCODE AZ64,
+	"level" varchar(256) ENCODE ZSTD,
+	songid varchar(256) ENCODE ZSTD,
+	artistid varchar(256) ENCODE ZSTD,
+	sessionid int4 ENCODE AZ64,
+	location varchar(256) ENCODE ZSTD,
+	user_agent varchar(256) ENCODE ZSTD,
+	PRIMARY KEY (playid)
+)
+DISTSTYLE KEY
+DISTKEY (start_time)
+SORTKEY (start_time);
 
 CREATE TABLE IF NOT EXISTS public.songs (
-	songid varchar(256) NOT NULL,
-	title varchar(256),
-	artistid varchar(256),
-	"year" int4,
-	duration numeric(18,0),
-	CONSTRAINT songs_pkey PRIMARY KEY (songid)
-);
+	songid varchar(256) NOT NULL ENCODE RAW,
+	title varchar(256) ENCODE ZSTD,
+	artistid varchar(256) ENCODE ZSTD,
+	"year" int4 ENCODE AZ64,
+	duration numeric(18,0) ENCODE AZ64,
+	PRIMARY KEY (songid)
+)
+DISTSTYLE ALL
+SORTKEY (songid);
+
+CREATE TABLE IF NOT EXISTS public.song_lookup (
+	song_key varchar(32) NOT NULL ENCODE RAW,
+	song_id varchar(256) ENCODE ZSTD,
+	artist_id varchar(256) ENCODE ZSTD,
+	PRIMARY KEY (song_key)
+)
+DISTSTYLE ALL
+SORTKEY (song_key);
 
 CREATE TABLE IF NOT EXISTS public.staging_events (
-	artist varchar(256),
-	auth varchar(256),
-	firstname varchar(256),
-	gender varchar(256),
-	iteminsession int4,
-	lastname varchar(256),
-	length numeric(18,0),
-	"level" varchar(256),
-	location varchar(256),
-	"method" varchar(256),
-	page varchar(256),
-	registration numeric(18,0),
-	sessionid int4,
-	song varchar(256),
-	status int4,
-	ts int8,
-	useragent varchar(256),
-	userid int4
-);
+	artist varchar(256) ENCODE ZSTD,
+	auth varchar(256) ENCODE ZSTD,
+	firstname varchar(256) ENCODE ZSTD,
+	gender varchar(256) ENCODE ZSTD,
+	iteminsession int4 ENCODE AZ64,
+	lastname varchar(256) ENCODE ZSTD,
+	length numeric(18,0) ENCODE AZ64,
+	"level" varchar(256) ENCODE ZSTD,
+	location varchar(256) ENCODE ZSTD,
+	"method" varchar(256) ENCODE ZSTD,
+	page varchar(256) ENCODE ZSTD,
+	registration numeric(18,0) ENCODE AZ64,
+	sessionid int4 ENCODE AZ64,
+	song varchar(256) ENCODE ZSTD,
+	status int4 ENCODE AZ64,
+	ts int8 ENCODE RAW,
+	useragent varchar(256) ENCODE ZSTD,
+	userid int4 ENCODE AZ64
+)
+DISTSTYLE EVEN
+SORTKEY (ts);
 
 CREATE TABLE IF NOT EXISTS public.staging_songs (
-	num_songs int4,
-	artist_id varchar(256),
-	artist_name varchar(256),
-	artist_latitude numeric(18,0),
-	artist_longitude numeric(18,0),
-	artist_location varchar(256),
-	song_id varchar(256),
-	title varchar(256),
-	duration numeric(18,0),
-	"year" int4
-);
+	num_songs int4 ENCODE AZ64,
+	artist_id varchar(256) ENCODE ZSTD,
+	artist_name varchar(256) ENCODE ZSTD,
+	artist_latitude numeric(18,0) ENCODE AZ64,
+	artist_longitude numeric(18,0) ENCODE AZ64,
+	artist_location varchar(256) ENCODE ZSTD,
+	song_id varchar(256) ENCODE ZSTD,
+	title varchar(256) ENCODE RAW,
+	duration numeric(18,0) ENCODE AZ64,
+	"year" int4 ENCODE AZ64
+)
+DISTSTYLE ALL
+SORTKEY (title);
 
 CREATE TABLE IF NOT EXISTS public."time" (
-	start_time timestamp NOT NULL,
-	"hour" int4,
-	"day" int4,
-	week int4,
-	"month" varchar(256),
-	"year" int4,
-	weekday varchar(256),
-	CONSTRAINT time_pkey PRIMARY KEY (start_time)
-) ;
+	start_time timestamp NOT NULL ENCODE RAW,
+	"hour" int4 ENCODE AZ64,
+	"day" int4 ENCODE AZ64,
+	week int4 ENCODE AZ64,
+	"month" varchar(256) ENCODE ZSTD,
+	"year" int4 ENCODE AZ64,
+	weekday varchar(256) ENCODE ZSTD,
+	PRIMARY KEY (start_time)
+)
+DISTSTYLE KEY
+DISTKEY (start_time)
+SORTKEY (start_time);
 
 CREATE TABLE IF NOT EXISTS public.users (
-	userid int4 NOT NULL,
-	first_name varchar(256),
-	last_name varchar(256),
-	gender varchar(256),
-	"level" varchar(256),
-	CONSTRAINT users_pkey PRIMARY KEY (userid)
-);
+	userid int4 NOT NULL ENCODE RAW,
+	first_name varchar(256) ENCODE ZSTD,
+	last_name varchar(256) ENCODE ZSTD,
+	gender varchar(256) ENCODE ZSTD,
+	"level" varchar(256) ENCODE ZSTD,
+	PRIMARY KEY (userid)
+)
+DISTSTYLE ALL
+SORTKEY (userid);
+
+CREATE TABLE IF NOT EXISTS public.users_history (
+	userid int4 NOT NULL ENCODE RAW,
+	first_name varchar(256) ENCODE ZSTD,
+	last_name varchar(256) ENCODE ZSTD,
+	gender varchar(256) ENCODE ZSTD,
+	"level" varchar(256) ENCODE ZSTD,
+	valid_from timestamp NOT NULL ENCODE AZ64,
+	valid_to timestamp ENCODE AZ64,
+	is_current boolean NOT NULL ENCODE RAW
+)
+DISTSTYLE ALL
+SORTKEY (userid, valid_from);
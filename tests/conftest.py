@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the plugins are imported the way Airflow loads them: helpers and operators are top-level packages.
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ('plugins', 'benchmarks'):
+    sys.path.insert(0, os.path.join(root, folder))
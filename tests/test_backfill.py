@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers import plan_backfill, backfill_commands
+
+
+def test_backfill_commands():
+    plan = plan_backfill(datetime(2020, 5, 10), datetime(2020, 5, 10, 4), batches=2)
+
+    assert backfill_commands('sparkify_etl_dag', plan, run_scoped_staging=True, max_active_runs=2) == [
+        "airflow dags backfill -s 2020-05-10T00:00:00 -e 2020-05-10T01:00:00 sparkify_etl_dag",
+        "airflow dags backfill -s 2020-05-10T02:00:00 -e 2020-05-10T03:00:00 sparkify_etl_dag"]
+
+
+def test_concurrent_batches_need_run_scoped_staging_and_active_runs():
+    plan = plan_backfill(datetime(2020, 5, 10), datetime(2020, 5, 10, 4), batches=2)
+
+    with pytest.raises(ValueError):
+        backfill_commands('sparkify_etl_dag', plan)
+    with pytest.raises(ValueError):
+        backfill_commands('sparkify_etl_dag', plan, run_scoped_staging=True, max_active_runs=1)
+    assert len(backfill_commands('sparkify_etl_dag', plan[:1])) == 1
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers.dag_factory import pool_commands, validate_config
+
+
+def test_pool_commands():
+    config = {'pools': {'sparkify_transform': {'slots': 3, 'description': 'Sparkify loads'},
+                        'sparkify_copy': {'slots': 2}}}
+
+    assert pool_commands(config) == ["airflow pools set sparkify_copy 2 ''",
+                                     "airflow pools set sparkify_transform 3 'Sparkify loads'"]
+
+
+def test_tenants_sharing_a_redshift_connection_are_rejected():
+    config = {'defaults': {'redshift_conn_id': 'redshift'},
+              'tenants': [{'name': 'udacity'}, {'name': 'acme'}, {'name': 'globex', 'redshift_conn_id': 'globex'}]}
+
+    with pytest.raises(ValueError, match="redshift \\(udacity, acme\\)"):
+        validate_config(config)
+
+    config['tenants'][1]['redshift_conn_id'] = 'acme'
+    assert [tenant['name'] for tenant in validate_config(config)['tenants']] == ['udacity', 'acme', 'globex']
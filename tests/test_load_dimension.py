@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from operators.load_dimension import scd_merge_sql
+
+
+def test_scd_merge_sql_quotes_the_reserved_columns():
+    statements = scd_merge_sql('users', 'SELECT 1', 2, ['userid'], ['userid', 'first_name', 'level'],
+                               tracked_columns=['level'], valid_from=datetime(2018, 11, 1))
+
+    assert statements[1] == 'DELETE FROM users_stage USING users WHERE users.userid = users_stage.userid ' \
+                            'AND users.is_current AND (users."level" = users_stage."level" ' \
+                            'OR (users."level" IS NULL AND users_stage."level" IS NULL))'
+    assert statements[3] == "INSERT INTO users (userid, first_name, \"level\", valid_from, valid_to, is_current) " \
+                            "SELECT userid, first_name, \"level\", '2018-11-01 00:00:00', NULL, TRUE FROM users_stage"
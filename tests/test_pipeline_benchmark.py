@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("airflow")
+pytest.importorskip("psycopg2")
+
+dsn = os.environ.get('SPARKIFY_BENCHMARK_DSN')
+benchmark = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'benchmarks', 'pipeline_benchmark.py')
+
+pytestmark = pytest.mark.skipif(not dsn, reason="SPARKIFY_BENCHMARK_DSN is not set")
+
+
+def test_benchmark_reports_every_operator(tmp_path):
+    report_path = str(tmp_path / 'bench_output.json')
+    subprocess.run([sys.executable, benchmark, '--dsn', dsn, '--events', '2000', '--songs', '200',
+                    '--hours', '2', '--memory-pass', '--data-dir', str(tmp_path / 's3'), '--report', report_path],
+                   check=True)
+
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+
+    operators = {result['task_id']: result for result in report['operators']}
+    assert list(operators) == ['Stage_events', 'Stage_songs', 'Load_song_lookup_table',
+                               'Load_songplays_fact_table', 'Load_dimension_tables',
+                               'Run_data_quality_checks', 'Load_rollups']
+    assert operators['Stage_events']['rows'] > 0
+    assert operators['Load_songplays_fact_table']['rows'] > 0
+    for result in operators.values():
+        assert result['seconds'] > 0
+        assert result['rss_delta_mb'] >= 0
+        assert result['peak_python_memory_mb'] >= 0
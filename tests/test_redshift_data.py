@@ -0,0 +1,180 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers import StatementBatch, batch_error, batch_query_stats, serialize_watermark
+
+finished = {'Id': 'batch', 'Status': 'FINISHED',
+            'SubStatements': [{'QueryString': "SET query_group TO 'copy'", 'Duration': 1000000},
+                              {'QueryString': "DELETE FROM staging_events", 'Duration': 250000000,
+                               'ResultRows': 10, 'RedshiftQueryId': 1},
+                              {'QueryString': "COPY staging_events FROM 's3://udacity-dend/manifest'",
+                               'Duration': 1500000000, 'ResultRows': 8056, 'RedshiftQueryId': 2}]}
+failed = {'Id': 'batch', 'Status': 'FAILED', 'Error': "The batch failed",
+          'SubStatements': [{'QueryString': "DELETE FROM staging_events", 'Status': 'FINISHED'},
+                            {'QueryString': "COPY staging_events FROM 's3://udacity-dend/manifest'",
+                             'Status': 'FAILED', 'Error': "Load into table 'staging_events' failed"}]}
+
+
+def test_statement_batch_records_the_statements():
+    batch = StatementBatch()
+    with batch.transaction() as transaction:
+        transaction.run("DELETE FROM staging_events")
+        transaction.run(["DELETE FROM songplays", "INSERT INTO songplays SELECT 1"])
+
+    assert batch.statements == ["DELETE FROM staging_events", "DELETE FROM songplays",
+                                "INSERT INTO songplays SELECT 1"]
+    with pytest.raises(ValueError):
+        batch.run("DELETE FROM songplays WHERE playid = %s", ('a',))
+
+
+def test_batch_error():
+    assert batch_error(finished) is None
+    assert batch_error(failed) == "copy failed: Load into table 'staging_events' failed"
+    assert batch_error({'Status': 'FAILED', 'Error': "Connection lost"}) == "Connection lost"
+    assert batch_error({'Status': 'ABORTED'}) == "The batch was aborted"
+
+
+def test_batch_query_stats():
+    query_stats = batch_query_stats(finished, 'copy')
+
+    assert [(stats['statement'], stats['seconds'], stats['rowcount'], stats['query_id']) for stats in query_stats] == \
+        [('delete', 0.25, 10, 1), ('copy', 1.5, 8056, 2)]
+    assert {stats['query_group'] for stats in query_stats} == {'copy'}
+
+
+class ScriptedDataApiClient:
+    """ describe_statement returns the scripted descriptions in turn, the last one once they're exhausted. """
+
+    def __init__(self, *descriptions):
+        self.descriptions = list(descriptions)
+        self.calls = 0
+
+    def describe_statement(self, Id):
+        self.calls += 1
+        return self.descriptions.pop(0) if len(self.descriptions) > 1 else self.descriptions[0]
+
+
+def first_event(trigger):
+    async def run():
+        async for event in trigger.run():
+            return event.payload
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('description, status, error', [
+    (finished, 'success', None),
+    (failed, 'error', "copy failed: Load into table 'staging_events' failed"),
+])
+def test_trigger_polls_until_the_batch_stops_running(monkeypatch, description, status, error):
+    pytest.importorskip("airflow.triggers.base")
+    import triggers.redshift_statement
+
+    client = ScriptedDataApiClient({'Id': 'batch', 'Status': 'SUBMITTED'},
+                                   {'Id': 'batch', 'Status': 'STARTED'}, description)
+    monkeypatch.setattr(triggers.redshift_statement, 'data_api_client', lambda aws_conn_id, region_name: client)
+
+    event = first_event(triggers.redshift_statement.RedshiftStatementTrigger(
+        'batch', 'aws_credentials', 'us-west-2', 'copy', poll_interval=0))
+
+    assert client.calls == 3
+    assert (event['statement_id'], event['status'], event['error']) == ('batch', status, error)
+    assert [stats['statement'] for stats in event['query_stats']] == ['delete', 'copy']
+
+
+@pytest.fixture
+def stage_operator(monkeypatch):
+    import operators.deferrable
+    import operators.stage_redshift
+
+    saved, published = [], []
+    monkeypatch.setattr(operators.deferrable, 'save_watermark',
+                        lambda table, watermark, namespace="": saved.append((table, watermark, namespace)))
+    monkeypatch.setattr(operators.deferrable, 'publish_query_stats',
+                        lambda context, query_stats, table="", log=None: published.append(query_stats))
+    operator = operators.deferrable.DeferrableStageToRedshiftOperator(
+        task_id='Stage_events', redshift_conn_id='redshift', aws_credentials_id='aws_credentials',
+        table='staging_events', s3_bucket='udacity-dend', s3_key='log_data', region='us-west-2',
+        incremental=True, manifest_bucket='sparkify-manifests', watermark_namespace='sparkify')
+    return operator, saved, published
+
+
+def test_execute_complete_saves_the_watermark_handed_off_by_the_copy(monkeypatch, stage_operator):
+    import operators.stage_redshift
+
+    operator, saved, published = stage_operator
+    start = datetime(2018, 11, 1, tzinfo=timezone.utc)
+    previous = {'last_modified': start, 'key': 'log_data/a.json', 'staged_keys': {'log_data/a.json': start}}
+    monkeypatch.setattr(operators.stage_redshift, 'load_watermark', lambda table, namespace="": previous)
+    deferred = {}
+    monkeypatch.setattr(operator, '_defer_batch',
+                        lambda context, batch, **kwargs: deferred.update(statements=batch.statements, **kwargs))
+
+    new_objects = [{'key': 'log_data/b.json', 'last_modified': start + timedelta(minutes=10), 'size': 1},
+                   {'key': 'log_data/c.json', 'last_modified': start + timedelta(minutes=20), 'size': 1}]
+    operator._copy(None, 'staging_events', "COPY staging_events FROM 's3://sparkify-manifests/manifest'", {},
+                   new_objects)
+
+    assert deferred['statements'] == ["DELETE FROM staging_events",
+                                      "COPY staging_events FROM 's3://sparkify-manifests/manifest'"]
+    # the watermark travels to execute_complete as JSON, through the trigger.
+    assert deferred['watermark'] == serialize_watermark({
+        'last_modified': start + timedelta(minutes=20), 'key': 'log_data/c.json',
+        'staged_keys': {'log_data/a.json': start, 'log_data/b.json': start + timedelta(minutes=10),
+                        'log_data/c.json': start + timedelta(minutes=20)}})
+
+    operator.execute_complete({}, event={'statement_id': 'batch', 'status': 'success', 'error': None,
+                                         'query_stats': batch_query_stats(finished, 'copy')},
+                              watermark=deferred['watermark'])
+
+    assert len(published) == 1
+    assert len(saved) == 1
+    table, watermark, namespace = saved[0]
+    assert (table, namespace) == ('staging_events', 'sparkify')
+    assert (watermark['key'], watermark['last_modified']) == ('log_data/c.json', start + timedelta(minutes=20))
+    assert sorted(watermark['staged_keys']) == ['log_data/a.json', 'log_data/b.json', 'log_data/c.json']
+
+
+def test_failed_batch_keeps_the_watermark(stage_operator):
+    operator, saved, published = stage_operator
+
+    with pytest.raises(ValueError, match="copy failed"):
+        operator.execute_complete({}, event={'statement_id': 'batch', 'status': 'error',
+                                             'error': batch_error(failed), 'query_stats': []},
+                                  watermark={'key': 'log_data/c.json', 'last_modified': '2018-11-01T00:20:00+00:00'})
+
+    assert saved == [] and published == []
+
+
+@pytest.mark.parametrize('statements, status', [
+    (["SELECT 1", "SELECT 2"], 'success'),
+    (["SELECT 1", "SELECT * FROM sparkify_missing_table"], 'error'),
+])
+def test_trigger_awaits_a_batch_of_the_local_data_api(monkeypatch, statements, status):
+    dsn = os.environ.get('SPARKIFY_BENCHMARK_DSN')
+    if not dsn:
+        pytest.skip("SPARKIFY_BENCHMARK_DSN is not set")
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("airflow.triggers.base")
+    import triggers.redshift_statement
+    from helpers import submit_batch
+    from local_stand_ins import LocalDataApiClient
+
+    monkeypatch.setattr(LocalDataApiClient, 'dsn', dsn)
+    client = LocalDataApiClient()
+    monkeypatch.setattr(triggers.redshift_statement, 'data_api_client', lambda aws_conn_id, region_name: client)
+
+    statement_id = submit_batch(client, {}, statements, 'check')
+    event = first_event(triggers.redshift_statement.RedshiftStatementTrigger(
+        statement_id, 'aws_credentials', query_group='check', poll_interval=0.05))
+
+    assert event['status'] == status
+    if status == 'success':
+        assert [stats['statement'] for stats in event['query_stats']] == ['select', 'select']
+    else:
+        assert event['error'].startswith("select failed")
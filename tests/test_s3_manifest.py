@@ -0,0 +1,150 @@
+import gzip
+import io
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers.s3_manifest import (list_new_objects, next_watermark, serialize_watermark, deserialize_watermark,
+                                 coalesce_objects, month_prefixes)
+
+bucket = 'udacity-dend'
+
+
+class S3Hook:
+    """ The get_bucket method of the Airflow S3Hook, on the mocked S3. """
+
+    def get_bucket(self, bucket_name):
+        import boto3
+
+        return boto3.resource('s3', region_name='us-east-1').Bucket(bucket_name)
+
+
+@pytest.fixture
+def s3():
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    # moto 5 mocks every service with mock_aws, the older releases with mock_s3.
+    mock_s3 = getattr(moto, 'mock_aws', None) or moto.mock_s3
+
+    with mock_s3():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=bucket)
+        yield client
+
+
+def put(s3, *keys):
+    for key in keys:
+        s3.put_object(Bucket=bucket, Key=key, Body=b'{}')
+
+
+def keys(objects):
+    return [obj['key'] for obj in objects]
+
+
+def test_lists_every_object_without_watermark(s3):
+    put(s3, 'log_data/b.json', 'log_data/a.json', 'log_data/')
+
+    objects = list_new_objects(S3Hook(), bucket, 'log_data/')
+
+    assert sorted(keys(objects)) == ['log_data/a.json', 'log_data/b.json']
+
+
+def test_skips_the_staged_keys_within_the_lookback(s3):
+    put(s3, 'log_data/a.json', 'log_data/b.json')
+    staged = [obj for obj in list_new_objects(S3Hook(), bucket, 'log_data/') if obj['key'] == 'log_data/b.json']
+    watermark = next_watermark(staged)
+
+    # an object dated before the watermark (a multipart upload that completed late) is still new.
+    late = [obj for obj in list_new_objects(S3Hook(), bucket, 'log_data/') if obj['key'] == 'log_data/a.json'][0]
+    watermark['last_modified'] = late['last_modified'] + timedelta(minutes=5)
+
+    assert keys(list_new_objects(S3Hook(), bucket, 'log_data/', watermark)) == ['log_data/a.json']
+
+
+def test_skips_the_objects_before_the_lookback(s3):
+    put(s3, 'log_data/a.json')
+    objects = list_new_objects(S3Hook(), bucket, 'log_data/')
+    watermark = next_watermark(objects)
+    watermark['last_modified'] += timedelta(hours=2)
+    watermark['staged_keys'] = {}
+
+    assert list_new_objects(S3Hook(), bucket, 'log_data/', watermark, timedelta(hours=1)) == []
+    assert keys(list_new_objects(S3Hook(), bucket, 'log_data/', watermark, timedelta(hours=3))) == \
+        ['log_data/a.json']
+
+
+def test_watermark_saved_before_the_staged_keys_is_a_cutoff(s3):
+    put(s3, 'log_data/a.json', 'log_data/b.json')
+    objects = list_new_objects(S3Hook(), bucket, 'log_data/')
+    legacy = {'last_modified': objects[0]['last_modified'], 'key': objects[0]['key']}
+
+    assert keys(list_new_objects(S3Hook(), bucket, 'log_data/', legacy)) == [objects[1]['key']]
+
+
+def test_incremental_listing_of_month_folders_skips_the_older_months(s3):
+    from datetime import datetime, timezone
+
+    now = datetime.now(timezone.utc)
+    put(s3, 'log_data/2018/11/2018-11-01-events.json', f"log_data/{now.year}/{now.month}/events.json")
+    watermark = {'last_modified': now - timedelta(minutes=10), 'key': 'log_data/previous.json', 'staged_keys': {}}
+
+    assert keys(list_new_objects(S3Hook(), bucket, 'log_data', watermark, month_folders=True)) == \
+        [f"log_data/{now.year}/{now.month}/events.json"]
+    assert len(list_new_objects(S3Hook(), bucket, 'log_data', watermark)) == 2
+
+
+def test_month_prefixes():
+    from datetime import datetime, timezone
+
+    assert month_prefixes('log_data/', datetime(2018, 11, 30, 23, tzinfo=timezone.utc),
+                          datetime(2019, 1, 1, tzinfo=timezone.utc)) == \
+        ['log_data/2018/11/', 'log_data/2018/12/', 'log_data/2019/1/']
+
+
+def test_next_watermark_prunes_the_keys_before_the_lookback():
+    from datetime import datetime, timezone
+
+    start = datetime(2018, 11, 1, tzinfo=timezone.utc)
+    previous = {'last_modified': start, 'key': 'a',
+                'staged_keys': {'a': start, 'old': start - timedelta(hours=2)}}
+    staged = [{'key': 'b', 'last_modified': start + timedelta(minutes=30)},
+              {'key': 'c', 'last_modified': start + timedelta(minutes=90)}]
+
+    watermark = next_watermark(staged, previous, timedelta(hours=1))
+
+    assert (watermark['key'], watermark['last_modified']) == ('c', start + timedelta(minutes=90))
+    assert sorted(watermark['staged_keys']) == ['b', 'c']
+    assert deserialize_watermark(serialize_watermark(watermark)) == watermark
+
+
+class InMemoryS3Hook:
+    """ The get_key and load_file methods of the Airflow S3Hook, on objects held in memory. """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.loaded = {}
+
+    def get_key(self, key, bucket_name=None):
+        body = io.BytesIO(self.objects[key])
+        return type('S3Object', (), {'get': lambda self: {'Body': body}})()
+
+    def load_file(self, filename, key, bucket_name=None, replace=False):
+        with gzip.open(filename, 'rb') as batch_file:
+            self.loaded[key] = batch_file.read()
+
+
+def test_coalesced_csv_objects_keep_one_header_and_no_blank_line():
+    from datetime import datetime, timezone
+
+    objects = {'song_data/a.csv': b'song_id,title\nSOA,Intro\n', 'song_data/b.csv': b'song_id,title\nSOB,Outro'}
+    s3_hook = InMemoryS3Hook(objects)
+    listed = [{'key': key, 'size': len(body), 'last_modified': datetime(2018, 11, 1, tzinfo=timezone.utc)}
+              for key, body in sorted(objects.items())]
+
+    batches = coalesce_objects(s3_hook, 'udacity-dend', listed, 1, 1024, 'sparkify-manifests', 'batches',
+                               header_lines=1, data_format='csv', chunk_size=4)
+
+    assert [batch['key'] for batch in batches] == ['batches/batch_00000.csv.gz']
+    assert s3_hook.loaded['batches/batch_00000.csv.gz'] == b'song_id,title\nSOA,Intro\nSOB,Outro\n'
@@ -0,0 +1,105 @@
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers import external_sql, external_table_sql, external_schema_sql, add_partition_sql, render_window
+
+window = (datetime(2018, 11, 30, 22, tzinfo=timezone.utc), datetime(2018, 12, 1, 2, tzinfo=timezone.utc))
+
+events_sql = "SELECT COUNT(*) FROM staging_events WHERE page = 'NextSong' {events_window}"
+
+
+def test_external_sql_reads_the_external_tables():
+    sql = external_sql(events_sql, ['staging_events', 'staging_songs'], 'spectrum')
+
+    assert sql == "SELECT COUNT(*) FROM spectrum.staging_events WHERE page = 'NextSong' " \
+                  "{events_window} {events_partitions}"
+    # a qualified table is left alone, and a statement without the tables is unchanged.
+    assert external_sql(sql, ['staging_events'], 'spectrum') == sql.replace(
+        "{events_partitions}", "{events_partitions} {events_partitions}")
+    assert external_sql("SELECT 1 FROM songplays", ['staging_events'], 'spectrum') == "SELECT 1 FROM songplays"
+
+
+def test_external_sql_of_a_list_of_statements():
+    statements = external_sql(["DELETE FROM songplays", "SELECT * FROM staging_songs"], ['staging_songs'], 'spectrum')
+
+    assert statements == ["DELETE FROM songplays", "SELECT * FROM spectrum.staging_songs"]
+
+
+def test_add_partition_sql():
+    assert add_partition_sql('staging_events', 'spectrum', 's3://udacity-dend/log_data/', 2018, 11) == \
+        "ALTER TABLE spectrum.staging_events ADD IF NOT EXISTS PARTITION (part_year=2018, part_month=11) " \
+        "LOCATION 's3://udacity-dend/log_data/2018/11/'"
+
+
+def test_render_window_lists_the_partitions_of_the_window():
+    sql = render_window(external_sql(events_sql, ['staging_events'], 'spectrum'), window)
+
+    assert sql.endswith("AND ts >= 1543615200000 AND ts < 1543629600000 "
+                        "AND ((part_year = 2018 AND part_month = 11) OR (part_year = 2018 AND part_month = 12))")
+    assert render_window(external_sql(events_sql, ['staging_events'], 'spectrum')) == \
+        "SELECT COUNT(*) FROM spectrum.staging_events WHERE page = 'NextSong'  "
+
+
+def test_external_table_sql_mirrors_the_staging_table():
+    sql = external_table_sql('staging_events', 'spectrum', 's3://udacity-dend/log_data/', partitioned=True)
+
+    assert 'decimal(18,0)' in sql and 'bigint' in sql
+    assert 'PARTITIONED BY (part_year int, part_month int)' in sql
+    assert 'PARTITIONED BY' not in external_table_sql('staging_songs', 'spectrum', 's3://udacity-dend/song_data/')
+
+
+@pytest.fixture
+def local_spectrum(tmp_path):
+    """ A partitioned staging_events external table of the local stand-in, on a local Postgres. """
+    dsn = os.environ.get('SPARKIFY_BENCHMARK_DSN')
+    if not dsn:
+        pytest.skip("SPARKIFY_BENCHMARK_DSN is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    from local_stand_ins import external_ddl, to_postgres
+
+    events = {('2018', '11'): [(window[0], 'NextSong'), (window[0], 'Home'),
+                               (datetime(2018, 11, 30, 21, tzinfo=timezone.utc), 'NextSong')],
+              ('2018', '12'): [(datetime(2018, 12, 1, 1, tzinfo=timezone.utc), 'NextSong'),
+                               (window[1], 'NextSong')]}
+    for (year, month), month_events in events.items():
+        folder = tmp_path / 'udacity-dend' / 'log_data' / year / month
+        folder.mkdir(parents=True)
+        with open(folder / 'events.json', 'w') as events_file:
+            for ts, page in month_events:
+                events_file.write(json.dumps({'ts': int(ts.timestamp() * 1000), 'page': page, 'userId': 1}) + "\n")
+
+    schema = "spectrum_{}".format(uuid.uuid4().hex[:8])
+    location = 's3://udacity-dend/log_data'
+    conn = psycopg2.connect(dsn)
+    try:
+        for sql in [external_schema_sql(schema, 'sparkify', 'arn:aws:iam::0:role/spectrum'),
+                    external_table_sql('staging_events', schema, location, partitioned=True),
+                    add_partition_sql('staging_events', schema, location, 2018, 11),
+                    add_partition_sql('staging_events', schema, location, 2018, 12)]:
+            assert external_ddl(conn, sql, str(tmp_path)) is not None
+
+        def query(sql):
+            with conn.cursor() as cursor:
+                cursor.execute(to_postgres(sql))
+                return cursor.fetchone()[0]
+
+        yield schema, query
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def test_window_of_the_external_table(local_spectrum):
+    schema, query = local_spectrum
+
+    assert query(render_window(external_sql(events_sql, ['staging_events'], schema), window)) == 2
+    assert query(render_window(external_sql(events_sql, ['staging_events'], schema))) == 4
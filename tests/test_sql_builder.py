@@ -0,0 +1,13 @@
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers import build_query
+
+
+def test_build_query_accepts_a_list_of_columns():
+    columns = ['userid', 'level']
+
+    assert build_query('users', 'insert', columns) == build_query('users', 'insert', tuple(columns))
+    assert build_query('users', 'insert', columns) is build_query('users', 'insert', tuple(columns))
+    assert 'INSERT INTO users (userid, "level")' in build_query('users', 'insert', columns)
@@ -0,0 +1,30 @@
+import multiprocessing
+
+import pytest
+
+pytest.importorskip("airflow")
+
+from helpers import TableStatsStore
+
+
+def save_tables(path, namespace, tables):
+    store = TableStatsStore(path, namespace=namespace)
+    for table in tables:
+        store.save(table, {'row_count': len(table)})
+
+
+def test_concurrent_processes_keep_every_save(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    tables = [f"table_{i}" for i in range(20)]
+    processes = [multiprocessing.Process(target=save_tables, args=(path, tenant, tables))
+                 for tenant in ('udacity', 'acme', 'globex')]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+    for tenant in ('udacity', 'acme', 'globex'):
+        store = TableStatsStore(path, namespace=tenant)
+        assert [store.get(table)['row_count'] for table in tables] == [len(table) for table in tables]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['stats.json', 'stats.json.lock']